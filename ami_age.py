@@ -0,0 +1,42 @@
+"""
+Batch date arithmetic for AMI ages. Uses NumPy datetime64 when it is installed and falls back to datetime.
+"""
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _seconds_precision(creation_date):
+    # '2024-05-29T10:42:07.000Z' -> '2024-05-29T10:42:07'
+    return creation_date.split('.')[0].rstrip('Z')
+
+def ages_in_days(creation_dates, now=None):
+    """
+    Whole days between `now` and each CreationDate, in one pass over the list. Unparseable dates give "N/A".
+    """
+    now = now or datetime.now()
+    dates = [_seconds_precision(date) for date in creation_dates]
+    if np is not None:
+        try:
+            parsed = np.array(dates, dtype='datetime64[s]')
+        except ValueError:
+            pass
+        else:
+            days = (np.datetime64(now.replace(microsecond=0), 's') - parsed) // np.timedelta64(1, 'D')
+            return [int(age) for age in days]
+
+    ages = []
+    for date in dates:
+        try:
+            ages.append((now - datetime.strptime(date, '%Y-%m-%dT%H:%M:%S')).days)
+        except ValueError:
+            ages.append("N/A")
+    return ages
+
+def newest_image(images):
+    """
+    The image with the latest CreationDate, or None. ISO 8601 dates order correctly as strings.
+    """
+    return max(images, key=lambda image: image['CreationDate'], default=None)
@@ -0,0 +1,102 @@
+"""
+TTL-bounded cache for latest-AMI lookups, kept in memory and optionally persisted to disk between runs.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 24 * 60 * 60  # seconds
+DEFAULT_MAX_ENTRIES = 1000
+
+class LatestAmiCache:
+    """
+    Memo of (region, name pattern) -> (AMI ID, AMI name, creation date).
+    Entries expire after `ttl` seconds and the least recently used ones are evicted past `max_entries`.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (fetched_at, value), least recently used first
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        if path:
+            self.load()
+
+    @staticmethod
+    def _key(region, pattern):
+        return f"{region}|{pattern}"
+
+    def _is_fresh(self, fetched_at):
+        return time.time() - fetched_at < self.ttl
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def load(self):
+        """
+        Load unexpired entries from the cache file. A missing or unreadable file starts an empty cache.
+        """
+        try:
+            with open(self.path) as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for key, (fetched_at, value) in sorted(stored.items(), key=lambda item: item[1][0]):
+                if self._is_fresh(fetched_at):
+                    self._entries[key] = (fetched_at, tuple(value))
+            self._evict()
+
+    def save(self):
+        """
+        Write unexpired entries to the cache file, replacing it atomically.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            stored = {key: [fetched_at, list(value)] for key, (fetched_at, value) in self._entries.items() if self._is_fresh(fetched_at)}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(stored, file)
+        os.replace(tmp_path, self.path)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry and self._is_fresh(entry[0]):
+            self._entries.move_to_end(key)
+            return entry[1]
+        return None
+
+    def get(self, region, pattern, loader):
+        """
+        Return the cached value for (region, pattern), calling `loader()` on a miss.
+        Concurrent misses for the same key wait for a single loader call. Exceptions from the loader are not cached.
+        """
+        key = self._key(region, pattern)
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                value = self._lookup(key)
+                if value is not None:
+                    self.hits += 1
+                    return value
+                self.misses += 1
+            value = tuple(loader())
+            with self._lock:
+                self._entries[key] = (time.time(), value)
+                self._entries.move_to_end(key)
+                self._evict()
+            return value
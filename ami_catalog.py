@@ -0,0 +1,79 @@
+"""
+In-memory index of the Amazon-owned AMI catalog, so name patterns resolve without a describe_images call each.
+"""
+import bisect
+import re
+import threading
+
+from aws_clients import get_client
+
+_catalogs = {}
+_region_locks = {}
+_catalogs_lock = threading.Lock()
+
+def _glob_regex(pattern):
+    # describe_images name filters only know * and ?, so everything else is matched literally
+    return re.compile(''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c) for c in pattern) + r'\Z')
+
+def _literal_prefix(pattern):
+    return re.split(r'[*?]', pattern, maxsplit=1)[0]
+
+class AmiCatalog:
+    """
+    Amazon images of one region, sorted by name so every pattern only scans the names sharing its literal prefix.
+    The newest image per pattern (family) is remembered, including misses.
+    """
+
+    def __init__(self, images):
+        entries = sorted((image['Name'], image['CreationDate'], image['ImageId']) for image in images if image.get('Name'))
+        self._names = [entry[0] for entry in entries]
+        self._entries = entries
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def fetch(cls, region):
+        paginator = get_client('ec2', region).get_paginator('describe_images')
+        images = []
+        for page in paginator.paginate(Owners=['amazon']):
+            images.extend({'ImageId': image['ImageId'], 'Name': image.get('Name'), 'CreationDate': image['CreationDate']} for image in page['Images'])
+        return cls(images)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def latest(self, pattern):
+        """
+        Return (ImageId, Name) of the newest image whose name matches the pattern, or None.
+        """
+        with self._lock:
+            if pattern in self._latest:
+                return self._latest[pattern]
+
+        prefix = _literal_prefix(pattern)
+        matcher = _glob_regex(pattern)
+        start = bisect.bisect_left(self._names, prefix)
+        newest = None
+        # CreationDate is ISO 8601, so the string comparison orders by time
+        for name, creation_date, image_id in self._entries[start:]:
+            if not name.startswith(prefix):
+                break
+            if matcher.match(name) and (newest is None or creation_date > newest[0]):
+                newest = (creation_date, image_id, name)
+        result = (newest[1], newest[2]) if newest else None
+
+        with self._lock:
+            self._latest[pattern] = result
+        return result
+
+def get_catalog(region):
+    """
+    Return the region's catalog, fetching it on first use. Later calls in the run reuse it.
+    """
+    with _catalogs_lock:
+        region_lock = _region_locks.setdefault(region, threading.Lock())
+    # Regions are fetched in parallel, but each one only once
+    with region_lock:
+        if region not in _catalogs:
+            _catalogs[region] = AmiCatalog.fetch(region)
+        return _catalogs[region]
@@ -1,10 +1,22 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+import hashlib
+import os
+
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 
+from report_index import FILTERS, ReportStore
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+# Where new1.py, fleet_daemon.py and shard_scan.py write their CSV reports; the newest match is served by the
+# /api/reports routes. test2/test3 reports (<account>Report_*.csv) have other columns and are left out.
+app.config['REPORT_PATTERNS'] = [
+    os.path.join(os.environ.get('REPORT_DIR', '.'), pattern) for pattern in ('*_Report_*.csv', 'FleetReport_*.csv')
+]
+app.config['REPORT_PAGE_SIZE'] = 100
+app.config['REPORT_MAX_PAGE_SIZE'] = 1000
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
@@ -52,6 +64,68 @@ def booking():
         pass
     return render_template('booking.html')
 
+reports = ReportStore(app.config['REPORT_PATTERNS'])
+
+def latest_report():
+    report = reports.get()
+    if report is None:
+        abort(404, description="No compliance report has been generated yet")
+    return report
+
+def conditional(etag, build):
+    # Answer If-None-Match before building the body; the ETag is strong because the body depends only on it
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def int_arg(name, default, minimum, maximum=None):
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        abort(400, description=f"{name} must be an integer")
+    if value < minimum:
+        abort(400, description=f"{name} must be at least {minimum}")
+    if maximum is not None and value > maximum:
+        abort(400, description=f"{name} must be at most {maximum}")
+    return value
+
+@app.route('/api/reports/latest')
+def report_summary():
+    report = latest_report()
+    return conditional(report.etag, lambda: jsonify(
+        report=os.path.basename(report.path),
+        rows=len(report.rows),
+        columns=report.columns,
+        counts={param: report.counts(column) for param, column in FILTERS.items()},
+    ))
+
+@app.route('/api/reports/latest/rows')
+def report_rows():
+    report = latest_report()
+    # Repeat a parameter to match any of several values, e.g. ?region=us-east-1&region=us-west-2
+    filters = {column: tuple(sorted(set(request.args.getlist(param)))) for param, column in FILTERS.items() if request.args.getlist(param)}
+    page = int_arg('page', 1, 1)
+    per_page = int_arg('per_page', app.config['REPORT_PAGE_SIZE'], 1, app.config['REPORT_MAX_PAGE_SIZE'])
+    query = repr((sorted(filters.items()), page, per_page))
+    etag = hashlib.sha256(f"{report.etag}:{query}".encode()).hexdigest()
+
+    def build():
+        positions = report.select(filters)
+        start = (page - 1) * per_page
+        return jsonify(
+            report=os.path.basename(report.path),
+            total=len(positions),
+            page=page,
+            per_page=per_page,
+            pages=(len(positions) + per_page - 1) // per_page,
+            rows=[report.rows[position] for position in positions[start:start + per_page]],
+        )
+    return conditional(etag, build)
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
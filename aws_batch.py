@@ -0,0 +1,171 @@
+"""
+Batched AWS lookups shared by the compliance scanner scripts.
+"""
+import re
+
+from botocore.exceptions import ClientError
+
+# describe_images accepts long ImageIds lists; keep batches well inside the request size limit
+AMI_BATCH_SIZE = 100
+
+# AMI IDs named in an InvalidAMIID.* error message, e.g. "The image id '[ami-0abc]' does not exist"
+AMI_ID = re.compile(r'ami-[0-9a-zA-Z]+')
+
+def chunked(items, size):
+    """
+    Split a list into consecutive chunks of at most `size` items.
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def collect_image_ids(reservations):
+    """
+    Return the distinct ImageIds used by the instances of a describe_instances result.
+    """
+    image_ids = []
+    seen = set()
+    for reservation in reservations:
+        for instance in reservation['Instances']:
+            ami_id = instance.get('ImageId')
+            if ami_id and ami_id not in seen:
+                seen.add(ami_id)
+                image_ids.append(ami_id)
+    return image_ids
+
+def get_ami_map(ec2_client, image_ids, batch_size=AMI_BATCH_SIZE):
+    """
+    Fetch AMI metadata for every ImageId in large batches and return an {ImageId: image} map.
+    AMIs that are deregistered or not visible to the account are simply absent from the map; any other error is raised.
+    """
+    ami_map = {}
+    for batch in chunked(list(image_ids), batch_size):
+        for image in _describe_images(ec2_client, batch):
+            ami_map[image['ImageId']] = image
+    return ami_map
+
+def _describe_images(ec2_client, image_ids):
+    # One unknown or malformed ID fails the whole call, so drop the IDs the error names (or split the batch when it
+    # names none) and ask again. Any other error, e.g. throttling or expired credentials, goes to the caller.
+    images = []
+    pending = list(image_ids)
+    while pending:
+        try:
+            images.extend(ec2_client.describe_images(ImageIds=pending)['Images'])
+            return images
+        except ClientError as e:
+            error = e.response.get('Error', {})
+            if not error.get('Code', '').startswith('InvalidAMIID'):
+                raise
+            named = set(AMI_ID.findall(error.get('Message', ''))) & set(pending)
+            if named:
+                pending = [ami_id for ami_id in pending if ami_id not in named]
+            elif len(pending) == 1:
+                return images
+            else:
+                half = len(pending) // 2
+                images.extend(_describe_images(ec2_client, pending[:half]))
+                pending = pending[half:]
+    return images
+
+def get_asg_map(autoscaling_client, page_size=50, instance_ids=None):
+    """
+    Sweep every Auto Scaling instance in the client's region and return an {InstanceId: AutoScalingGroupName} map.
+    With `instance_ids`, only those instances are looked up, 50 IDs per call.
+    """
+    asg_map = {}
+    paginator = autoscaling_client.get_paginator('describe_auto_scaling_instances')
+    if instance_ids is None:
+        requests = [{}]
+    else:
+        requests = [{'InstanceIds': batch} for batch in chunked(list(instance_ids), 50)]
+    for kwargs in requests:
+        for page in paginator.paginate(PaginationConfig={'PageSize': page_size}, **kwargs):
+            for asg_instance in page['AutoScalingInstances']:
+                asg_map[asg_instance['InstanceId']] = asg_instance['AutoScalingGroupName']
+    return asg_map
+
+def get_patch_state_map(ssm_client, instance_ids, batch_size=50):
+    """
+    Load SSM patch states for the given instances, 50 IDs per call, into an {InstanceId: patch_state} map.
+    Instances of a batch that failed map to the exception so each row can still report the error.
+    """
+    patch_states = {}
+    for batch in chunked(list(instance_ids), batch_size):
+        kwargs = {'InstanceIds': batch}
+        try:
+            while True:
+                response = ssm_client.describe_instance_patch_states(**kwargs)
+                for patch_state in response['InstancePatchStates']:
+                    patch_states[patch_state['InstanceId']] = patch_state
+                if not response.get('NextToken'):
+                    break
+                kwargs['NextToken'] = response['NextToken']
+        except Exception as e:
+            for instance_id in batch:
+                patch_states.setdefault(instance_id, e)
+    return patch_states
+
+def get_tag_map(ec2_client, reservations, batch_size=200):
+    """
+    Return an {InstanceId: {Key: Value}} map built from the Tags already in a describe_instances result.
+    Only instances whose payload has no Tags are looked up, with batched describe_tags calls.
+    """
+    tag_map = {}
+    untagged = []
+    for reservation in reservations:
+        for instance in reservation['Instances']:
+            if 'Tags' in instance:
+                tag_map[instance['InstanceId']] = {tag['Key']: tag['Value'] for tag in instance['Tags']}
+            else:
+                untagged.append(instance['InstanceId'])
+
+    paginator = ec2_client.get_paginator('describe_tags') if untagged else None
+    for batch in chunked(untagged, batch_size):
+        for instance_id in batch:
+            tag_map[instance_id] = {}
+        try:
+            for page in paginator.paginate(Filters=[
+                {'Name': 'resource-type', 'Values': ['instance']},
+                {'Name': 'resource-id', 'Values': batch}
+            ]):
+                for tag in page['Tags']:
+                    tag_map[tag['ResourceId']][tag['Key']] = tag['Value']
+        except Exception as e:
+            for instance_id in batch:
+                tag_map[instance_id] = e
+    return tag_map
+
+def iter_reservation_pages(ec2_client, page_size=None, **kwargs):
+    """
+    Follow describe_instances pagination and yield each page's Reservations list as soon as it arrives.
+    """
+    for reservations, _ in iter_reservation_pages_with_tokens(ec2_client, page_size, **kwargs):
+        yield reservations
+
+def iter_reservation_pages_with_tokens(ec2_client, page_size=None, starting_token=None, **kwargs):
+    """
+    Like iter_reservation_pages, but yield (Reservations, NextToken) pairs and optionally start from a NextToken
+    saved earlier. The last page's NextToken is None.
+    """
+    paginator = ec2_client.get_paginator('describe_instances')
+    pagination_config = {'PageSize': page_size} if page_size else {}
+    if starting_token:
+        pagination_config['StartingToken'] = starting_token
+    for page in paginator.paginate(PaginationConfig=pagination_config, **kwargs):
+        yield page['Reservations'], page.get('NextToken')
+
+def iter_instances(ec2_client, page_size=None, **kwargs):
+    """
+    Yield every instance record across all describe_instances pages.
+    """
+    for reservations in iter_reservation_pages(ec2_client, page_size, **kwargs):
+        for reservation in reservations:
+            yield from reservation['Instances']
+
+def iter_reservation_pages_by_id(ec2_client, instance_ids, page_size=None, batch_size=200):
+    """
+    Like iter_reservation_pages, for the given instances only. An instance-id filter is used instead of
+    InstanceIds, so IDs that no longer exist are left out of the result rather than failing the call.
+    """
+    for batch in chunked(list(instance_ids), batch_size):
+        yield from iter_reservation_pages(ec2_client, page_size, Filters=[{'Name': 'instance-id', 'Values': batch}])
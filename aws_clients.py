@@ -0,0 +1,52 @@
+"""
+Shared boto3 clients for the compliance scanner scripts.
+"""
+import threading
+
+import boto3
+from botocore.config import Config
+
+from throttle import RequestScheduler, ThrottledClient
+
+# Enough pooled connections per client for every scanner worker thread to keep its connection alive.
+# botocore's own retries are off: the scheduler below decides when and how fast to retry.
+CLIENT_CONFIG = Config(max_pool_connections=50, retries={'mode': 'standard', 'max_attempts': 1})
+
+# Every API call made through get_client() clients is rate limited and retried here
+scheduler = RequestScheduler()
+
+_clients = {}
+_clients_lock = threading.Lock()
+_client_factory = None
+
+def set_client_factory(factory):
+    """
+    Build every client with factory(service, region) instead of boto3, e.g. an offline stand-in backend.
+    Passing None restores boto3. Clients created before the switch are discarded.
+    """
+    global _client_factory
+    with _clients_lock:
+        _client_factory = factory
+        _clients.clear()
+
+def get_client(service, region=None):
+    """
+    Return the shared client for a service and region, creating it on first use.
+    boto3 clients are safe to share between threads, but creating them from the default session is not,
+    so creation is serialised here and every worker reuses the same client and its connection pool.
+    """
+    key = (service, region)
+    with _clients_lock:
+        if key not in _clients:
+            if _client_factory:
+                client = _client_factory(service, region)
+            else:
+                client = boto3.client(service, region_name=region, config=CLIENT_CONFIG)
+            _clients[key] = ThrottledClient(client, region, scheduler)
+        return _clients[key]
+
+def use_session(session):
+    """
+    Build every client from the given boto3 Session, e.g. one holding a single account's credentials.
+    """
+    set_client_factory(lambda service, region: session.client(service, region_name=region, config=CLIENT_CONFIG))
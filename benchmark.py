@@ -0,0 +1,83 @@
+"""
+Scale benchmark for new1.py's get_instance_details pipeline, run against the offline FakeAWS backend.
+
+    python benchmark.py --sizes 1000 10000 50000 --latency 0.02 --throttle-rate 0.01
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+import tracemalloc
+
+import aws_clients
+import new1
+from ami_cache import LatestAmiCache
+from aws_clients import set_client_factory
+from fake_aws import FakeAWS, FakeFleet
+from report_writer import StreamingReportWriter
+from throttle import RequestScheduler
+
+DEFAULT_SIZES = [1000, 10000, 50000]
+
+def run_benchmark(size, latency=0.0, throttle_rate=0.0, workers=new1.MAX_WORKERS, batch_size=new1.INSTANCE_BATCH_SIZE, use_async=False):
+    """
+    Scan a synthetic fleet of `size` instances and return wall time, peak traced memory, API calls per operation
+    and how many calls were throttled and retried.
+    """
+    fleet = FakeFleet(size)
+    backend = FakeAWS(fleet, latency, throttle_rate)
+    set_client_factory(backend.client)
+    new1.latest_ami_cache = LatestAmiCache()
+    aws_clients.scheduler = RequestScheduler()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, 'w') as devnull:
+        report = StreamingReportWriter(os.path.join(tmp_dir, 'report.csv'))
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(devnull):
+                if use_async:
+                    asyncio.run(new1.get_instance_details_async(report, fleet.regions))
+                else:
+                    new1.get_instance_details(report, fleet.regions, workers, batch_size)
+        finally:
+            report.close()
+            wall_time = time.perf_counter() - start
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            set_client_factory(None)
+
+    return {
+        'size': size,
+        'rows': report.rows_written,
+        'wall_time': wall_time,
+        'peak_memory': peak_memory,
+        'calls': dict(backend.calls_by_operation()),
+        'throttled': sum(aws_clients.scheduler.throttled.values()),
+        'retries': sum(aws_clients.scheduler.retries.values()),
+    }
+
+def print_result(result):
+    print(f"{result['size']:>7} instances  {result['wall_time']:8.2f} s  "
+          f"{result['rows'] / result['wall_time']:9.0f} rows/s  {result['peak_memory'] / 2 ** 20:8.1f} MiB peak  "
+          f"{result['throttled']} throttled, {result['retries']} retried")
+    for operation, count in sorted(result['calls'].items()):
+        print(f"\t{operation:<34} {count:>8} calls")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compliance scanner against a synthetic offline fleet")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Fleet sizes to scan")
+    parser.add_argument("-l", "--latency", type=float, default=0.0, help="Seconds of latency added to every API call")
+    parser.add_argument("-t", "--throttle-rate", type=float, default=0.0, help="Fraction of API calls that fail with a throttling error")
+    parser.add_argument("-w", "--workers", type=int, default=new1.MAX_WORKERS, help="Scanner worker pool size")
+    parser.add_argument("-b", "--batch-size", type=int, default=new1.INSTANCE_BATCH_SIZE, help="Instances per worker batch")
+    parser.add_argument("-a", "--async", dest="use_async", action="store_true", help="Benchmark the asyncio scanner mode instead")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print_result(run_benchmark(size, args.latency, args.throttle_rate, args.workers, args.batch_size, args.use_async))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Offline stand-in for the EC2, SSM, Auto Scaling and STS calls made by the compliance scanner.
+
+FakeAWS generates a synthetic fleet and serves the scanner's describe_* calls from memory with optional per-call
+latency and throttling. Point the scanner at it with aws_clients.set_client_factory(FakeAWS(...).client).
+"""
+import fnmatch
+import hashlib
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from throttle import PAGE_SIZE_PARAMS
+
+FAKE_ACCOUNT_ID = '123456789012'
+FAKE_REGIONS = ['us-east-1', 'us-west-1', 'us-west-2']
+
+# Amazon image families as (name template, date format); each family gets one release per month
+AMI_FAMILIES = [
+    ('amzn2-ami-hvm-2.0.{date}.0-x86_64-gp2', '%Y%m%d'),
+    ('amzn-ami-hvm-2018.03.0.{date}.0-x86_64-gp2', '%Y%m%d'),
+    ('ubuntu/images/hvm-ssd/ubuntu-focal-20.04-amd64-server-{date}', '%Y%m%d'),
+    ('Windows_Server-2019-English-Full-Base-{date}', '%Y.%m.%d'),
+    ('aws-elasticbeanstalk-amzn-2.0.{date}.x86_64-eb_docker_amazon_linux_2-hvm-{date}', '%Y%m%d'),
+]
+AMI_RELEASES = 24
+PRIVATE_AMIS = 10
+
+REQUIRED_TAGS = [
+    'company-ssm-managed-patch-install-reboot', 'company:ssm:managed-qualys-install-linux',
+    'company:ssm:managed-crowdstrike-install', 'company-ssm-managed-scan'
+]
+
+def _resource_id(prefix, *parts):
+    return f"{prefix}-{hashlib.md5('/'.join(map(str, parts)).encode()).hexdigest()[:17]}"
+
+def _client_error(code, message, operation):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+def _page(items, max_results, next_token, default_page_size):
+    start = int(next_token or 0)
+    end = start + (max_results or default_page_size)
+    return items[start:end], (str(end) if end < len(items) else None)
+
+class FakeFleet:
+    """
+    Deterministic synthetic fleet: instances, Amazon and private AMIs, ASG membership, tags and patch states per region.
+    """
+
+    def __init__(self, size, regions=FAKE_REGIONS, seed=0):
+        self.regions = regions
+        rng = random.Random(seed)
+        now = datetime(2024, 6, 1, tzinfo=timezone.utc)
+        self.amazon_images = {}
+        self.private_images = {}
+        self.instances = {}
+        self.asg_instances = {}
+        self.patch_states = {}
+
+        for region in regions:
+            amazon_images = []
+            for family, date_format in AMI_FAMILIES:
+                for release in range(AMI_RELEASES):
+                    created = now - timedelta(days=30 * release + rng.randint(0, 5))
+                    amazon_images.append({
+                        'ImageId': _resource_id('ami', region, family, release),
+                        'Name': family.format(date=created.strftime(date_format)),
+                        'CreationDate': created.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                        'OwnerId': 'amazon',
+                        'Public': True,
+                    })
+            private_images = []
+            for n in range(PRIVATE_AMIS):
+                created = now - timedelta(days=rng.randint(1, 700))
+                private_images.append({
+                    'ImageId': _resource_id('ami', region, 'private', n),
+                    'Name': f"company-base-image-{created.strftime('%Y%m%d')}",
+                    'CreationDate': created.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                    'OwnerId': FAKE_ACCOUNT_ID,
+                    'Public': False,
+                })
+            self.amazon_images[region] = amazon_images
+            self.private_images[region] = private_images
+            self.instances[region] = []
+            self.asg_instances[region] = []
+            self.patch_states[region] = {}
+
+        # Most hosts run one of a handful of AMIs, as in a real account
+        for n in range(size):
+            region = regions[n % len(regions)]
+            in_use = self.amazon_images[region][::AMI_RELEASES // 4] + self.private_images[region]
+            if rng.random() < 0.01:
+                ami_id = _resource_id('ami', region, 'deregistered', n % 7)
+            else:
+                ami_id = rng.choice(in_use)['ImageId']
+            instance_id = _resource_id('i', region, n)
+            state = rng.choices(['running', 'stopped', 'terminated'], weights=[85, 12, 3])[0]
+            instance = {
+                'InstanceId': instance_id,
+                'ImageId': ami_id,
+                'InstanceType': rng.choice(['t3.micro', 'm5.large', 'c5.xlarge']),
+                'LaunchTime': now - timedelta(days=rng.randint(0, 900)),
+                'State': {'Name': state},
+                'Placement': {'AvailabilityZone': f"{region}a"},
+            }
+            # Roughly 2% of the payloads come back without Tags, like instances that were never tagged
+            if rng.random() >= 0.02:
+                tags = [{'Key': 'Name', 'Value': f"host-{n}"}]
+                tags += [{'Key': key, 'Value': 'true'} for key in REQUIRED_TAGS if rng.random() < 0.9]
+                instance['Tags'] = tags
+            self.instances[region].append(instance)
+
+            if rng.random() < 0.3:
+                self.asg_instances[region].append({
+                    'InstanceId': instance_id,
+                    'AutoScalingGroupName': f"asg-{region}-{n % 40}",
+                    'AvailabilityZone': f"{region}a",
+                    'LifecycleState': 'InService',
+                })
+            if state == 'running' and rng.random() < 0.9:
+                self.patch_states[region][instance_id] = {
+                    'InstanceId': instance_id,
+                    'PatchGroup': 'default',
+                    'InstalledPendingRebootCount': rng.choice([0, 0, 0, 1]),
+                    'MissingCount': rng.choice([0, 0, 2]),
+                    'OperationEndTime': now - timedelta(hours=rng.randint(1, 72)),
+                }
+
+class FakeAWS:
+    """
+    In-memory backend. `latency` (seconds) is slept on every call and `throttle_rate` is the chance that a call
+    fails with a throttling ClientError. Calls are counted per (operation, region) in `call_counts`.
+    """
+
+    def __init__(self, fleet, latency=0.0, throttle_rate=0.0, seed=0, account_id=FAKE_ACCOUNT_ID):
+        self.fleet = fleet
+        self.account_id = account_id
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.call_counts = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def client(self, service, region=None):
+        return FakeClient(self, service, region or self.fleet.regions[0])
+
+    def record_call(self, operation, region):
+        with self._lock:
+            self.call_counts[(operation, region)] += 1
+            throttled = self._rng.random() < self.throttle_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            code = 'ThrottlingException' if operation == 'describe_instance_patch_states' else 'RequestLimitExceeded'
+            raise _client_error(code, 'Rate exceeded', operation)
+
+    def calls_by_operation(self):
+        totals = Counter()
+        for (operation, _region), count in self.call_counts.items():
+            totals[operation] += count
+        return totals
+
+class FakePaginator:
+    def __init__(self, client, operation):
+        self.client = client
+        self.operation = operation
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        page_size = (PaginationConfig or {}).get('PageSize')
+        if page_size:
+            kwargs[PAGE_SIZE_PARAMS[self.operation]] = page_size
+        starting_token = (PaginationConfig or {}).get('StartingToken')
+        if starting_token:
+            kwargs['NextToken'] = starting_token
+        while True:
+            page = getattr(self.client, self.operation)(**kwargs)
+            yield page
+            next_token = page.get('NextToken')
+            if not next_token:
+                return
+            kwargs['NextToken'] = next_token
+
+class FakeClient:
+    """
+    Client for one service and region exposing the subset of the boto3 API the scanner uses.
+    """
+
+    def __init__(self, backend, service, region):
+        self.backend = backend
+        self.service = service
+        self.region = region
+        self.fleet = backend.fleet
+
+    def get_paginator(self, operation):
+        return FakePaginator(self, operation)
+
+    # EC2
+
+    def describe_instances(self, MaxResults=None, NextToken=None, Filters=None, InstanceIds=None):
+        self.backend.record_call('describe_instances', self.region)
+        instances = self.fleet.instances[self.region]
+        if InstanceIds:
+            wanted = set(InstanceIds)
+            instances = [instance for instance in instances if instance['InstanceId'] in wanted]
+        for instance_filter in Filters or []:
+            if instance_filter['Name'] == 'instance-state-name':
+                instances = [instance for instance in instances if instance['State']['Name'] in instance_filter['Values']]
+            elif instance_filter['Name'] == 'instance-id':
+                instances = [instance for instance in instances if instance['InstanceId'] in instance_filter['Values']]
+        page, next_token = _page(instances, MaxResults, NextToken, 1000)
+        response = {'Reservations': [{'ReservationId': _resource_id('r', instance['InstanceId']), 'Instances': [instance]} for instance in page]}
+        if next_token:
+            response['NextToken'] = next_token
+        return response
+
+    def describe_images(self, ImageIds=None, Owners=None, Filters=None, MaxResults=None, NextToken=None):
+        self.backend.record_call('describe_images', self.region)
+        if ImageIds:
+            images = {image['ImageId']: image for image in self.fleet.amazon_images[self.region] + self.fleet.private_images[self.region]}
+            missing = [ami_id for ami_id in ImageIds if ami_id not in images]
+            if missing:
+                raise _client_error('InvalidAMIID.NotFound', f"The image id '[{missing[0]}]' does not exist", 'describe_images')
+            return {'Images': [images[ami_id] for ami_id in ImageIds]}
+
+        images = self.fleet.private_images[self.region] if Owners == ['self'] else self.fleet.amazon_images[self.region]
+        for image_filter in Filters or []:
+            if image_filter['Name'] == 'name':
+                images = [image for image in images if any(fnmatch.fnmatchcase(image['Name'], pattern) for pattern in image_filter['Values'])]
+        return {'Images': list(images)}
+
+    def describe_tags(self, Filters=None, MaxResults=None, NextToken=None):
+        self.backend.record_call('describe_tags', self.region)
+        resource_ids = None
+        for tag_filter in Filters or []:
+            if tag_filter['Name'] == 'resource-id':
+                resource_ids = set(tag_filter['Values'])
+        tags = []
+        for instance in self.fleet.instances[self.region]:
+            if resource_ids is None or instance['InstanceId'] in resource_ids:
+                tags += [{'ResourceId': instance['InstanceId'], 'ResourceType': 'instance', 'Key': tag['Key'], 'Value': tag['Value']} for tag in instance.get('Tags', [])]
+        page, next_token = _page(tags, MaxResults, NextToken, 1000)
+        response = {'Tags': page}
+        if next_token:
+            response['NextToken'] = next_token
+        return response
+
+    # SSM
+
+    def describe_instance_patch_states(self, InstanceIds, MaxResults=None, NextToken=None):
+        self.backend.record_call('describe_instance_patch_states', self.region)
+        if len(InstanceIds) > 50:
+            raise _client_error('ValidationException', 'InstanceIds must contain at most 50 items', 'describe_instance_patch_states')
+        patch_states = self.fleet.patch_states[self.region]
+        states = [patch_states[instance_id] for instance_id in InstanceIds if instance_id in patch_states]
+        page, next_token = _page(states, MaxResults, NextToken, 50)
+        response = {'InstancePatchStates': page}
+        if next_token:
+            response['NextToken'] = next_token
+        return response
+
+    # Auto Scaling
+
+    def describe_auto_scaling_instances(self, InstanceIds=None, MaxRecords=None, NextToken=None):
+        self.backend.record_call('describe_auto_scaling_instances', self.region)
+        asg_instances = self.fleet.asg_instances[self.region]
+        if InstanceIds:
+            if len(InstanceIds) > 50:
+                raise _client_error('ValidationError', 'InstanceIds must contain at most 50 items', 'describe_auto_scaling_instances')
+            wanted = set(InstanceIds)
+            asg_instances = [asg_instance for asg_instance in asg_instances if asg_instance['InstanceId'] in wanted]
+        page, next_token = _page(asg_instances, MaxRecords, NextToken, 50)
+        response = {'AutoScalingInstances': page}
+        if next_token:
+            response['NextToken'] = next_token
+        return response
+
+    # STS
+
+    def get_caller_identity(self):
+        self.backend.record_call('get_caller_identity', self.region)
+        account_id = self.backend.account_id
+        return {'Account': account_id, 'UserId': 'AIDAFAKE', 'Arn': f"arn:aws:iam::{account_id}:user/scanner"}
@@ -0,0 +1,378 @@
+"""
+Long-running compliance daemon for new1.py's scanner. Every instance's report row is kept in memory, stale rows are
+refreshed on a schedule, change events are applied as they arrive and the CSV report is written on demand from
+memory instead of after a full scan.
+
+    python fleet_daemon.py --events-file events.jsonl --report-dir reports
+    kill -USR1 <pid>    # write the report now
+
+Events are JSON objects, one per line in the events file or put on FleetDaemon.events:
+    {"action": "report"}                                    write the report (optionally "path")
+    {"action": "sweep"}                                     rescan every region now
+    {"region": "us-east-1", "instance_id": "i-0abc..."}     rescan these instances ("instance_ids" for a list)
+    EventBridge events for EC2 state changes, tag changes or SSM compliance changes, as delivered to a queue or file
+"""
+import argparse
+import csv
+import heapq
+import json
+import os
+import queue
+import re
+import signal
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import new1
+from ami_cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, LatestAmiCache
+from aws_clients import get_client
+from report_writer import COLUMNS_ORDER
+from scan_log import LEVELS, SUMMARY, log, setup_logging, stop_logging
+
+REFRESH_INTERVAL = 60  # seconds between checks for stale rows
+STALE_AFTER = 60 * 60  # seconds after which a row is looked up again
+REFRESH_LIMIT = 1000  # stale rows refreshed per check, oldest first
+SWEEP_INTERVAL = 6 * 60 * 60  # seconds between full rescans, which pick up instances no event was seen for
+FAILED_RETRY_DELAY = 60  # seconds before a row whose lookups failed is retried, doubled after every further failure
+FAILED_RETRY_LIMIT = 5  # consecutive failures after which a row is parked and only refreshed when it goes stale
+EVENT_WAIT = 0.5  # longest the main loop blocks waiting for an event
+EVENT_POLL_INTERVAL = 1.0  # seconds between checks of the events file
+
+INSTANCE_ARN = re.compile(r'instance/(i-[0-9a-f]+)$')
+
+class FleetState:
+    """
+    Latest report row of every instance, grouped by region in discovery order. Rows are taken through the same
+    write_row(key, row) / close() interface as the report writers, so get_instance_details() scans straight into it,
+    and are reported in the order of the sweep's (region, sequence) keys, like new1.py's report. Refresh scans
+    write through refresh_writer(): their keys only number the refreshed instances, so a refreshed row keeps its
+    position, and an instance first found by a refresh goes after the swept ones until the next sweep places it.
+
+    A row whose lookups failed is retried after FAILED_RETRY_DELAY seconds, then with exponential backoff, until
+    FAILED_RETRY_LIMIT consecutive failures park it; a parked row is only refreshed with the stale ones.
+    """
+
+    def __init__(self, regions):
+        self.regions = list(regions)
+        self._entries = {region: {} for region in self.regions}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(entries) for entries in self._entries.values())
+
+    def write_row(self, key, row):
+        entry = {'row': row, 'sequence': key[1] if key else None, 'refreshed_at': time.monotonic(), 'failures': 0}
+        failed = new1.row_failed(row)
+        with self._lock:
+            entries = self._entries.setdefault(row['Region'], {})
+            previous = entries.get(row['Instance ID'])
+            if key is None and previous:
+                entry['sequence'] = previous['sequence']
+            if failed:
+                entry['failures'] = (previous['failures'] if previous else 0) + 1
+            entries[row['Instance ID']] = entry
+        if entry['failures'] == FAILED_RETRY_LIMIT:
+            log.warning("Parking %s after %d failed lookups in a row; it is only refreshed with the stale rows from now on",
+                        row['Instance ID'], FAILED_RETRY_LIMIT)
+
+    def close(self):
+        # Rows stay in memory; nothing to flush
+        pass
+
+    def refresh_writer(self):
+        return _RefreshWriter(self)
+
+    def region_of(self, instance_id):
+        with self._lock:
+            return next((region for region, entries in self._entries.items() if instance_id in entries), None)
+
+    def remove_unrefreshed(self, region, since, instance_ids=None):
+        """
+        Drop rows of `region` (or just `instance_ids` in it) that were not written since `since`, i.e. instances a
+        scan started at `since` no longer found. Returns the number removed.
+        """
+        with self._lock:
+            entries = self._entries.get(region, {})
+            candidates = entries.keys() if instance_ids is None else [instance_id for instance_id in instance_ids if instance_id in entries]
+            gone = [instance_id for instance_id in candidates if entries[instance_id]['refreshed_at'] < since]
+            for instance_id in gone:
+                del entries[instance_id]
+        return len(gone)
+
+    @staticmethod
+    def _due(entry, max_age):
+        # When a row should be looked up again: failed rows back off exponentially, never beyond max_age
+        failures = entry['failures']
+        if 0 < failures < FAILED_RETRY_LIMIT:
+            return entry['refreshed_at'] + min(max_age, FAILED_RETRY_DELAY * 2 ** (failures - 1))
+        return entry['refreshed_at'] + max_age
+
+    def stale(self, max_age, limit):
+        """
+        Up to `limit` rows that are due, i.e. older than `max_age` seconds or failed rows whose retry delay has
+        passed, as {region: [InstanceId, ...]}, longest overdue first.
+        """
+        now = time.monotonic()
+        candidates = []
+        with self._lock:
+            for region, entries in self._entries.items():
+                for instance_id, entry in entries.items():
+                    due = self._due(entry, max_age)
+                    if due <= now:
+                        candidates.append((due, region, instance_id))
+        stale = defaultdict(list)
+        for _, region, instance_id in heapq.nsmallest(limit, candidates):
+            stale[region].append(instance_id)
+        return dict(stale)
+
+    def rows(self):
+        # Rows are replaced, never modified, so a shallow copy is a consistent snapshot
+        with self._lock:
+            regions = [list(entries.values()) for entries in self._entries.values()]
+        rows = []
+        for entries in regions:
+            entries.sort(key=_report_order)
+            rows.extend(entry['row'] for entry in entries)
+        return rows
+
+    def write_csv(self, path, columns=COLUMNS_ORDER):
+        rows = self.rows()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp_path, path)
+        return len(rows)
+
+def _report_order(entry):
+    # Swept rows by sequence, then rows only a refresh has seen, by instance ID
+    sequence = entry['sequence']
+    return (sequence is None, sequence or 0, entry['row']['Instance ID'])
+
+class _RefreshWriter:
+    def __init__(self, state):
+        self.state = state
+
+    def write_row(self, key, row):
+        self.state.write_row(None, row)
+
+    def close(self):
+        pass
+
+def parse_event(event):
+    """
+    Return (action, region, instance_ids) for one event. action is 'report', 'sweep' or 'refresh'; region is None
+    when the event does not say.
+    """
+    if event.get('action') in ('report', 'sweep'):
+        return event['action'], None, []
+    instance_ids = list(event.get('instance_ids', []))
+    if event.get('instance_id'):
+        instance_ids.append(event['instance_id'])
+    # EventBridge: EC2 state changes carry detail.instance-id, tag and SSM compliance changes an instance ARN
+    detail = event.get('detail') or {}
+    if detail.get('instance-id'):
+        instance_ids.append(detail['instance-id'])
+    for resource in event.get('resources', []):
+        match = INSTANCE_ARN.search(resource)
+        if match:
+            instance_ids.append(match.group(1))
+    return 'refresh', event.get('region'), instance_ids
+
+class FleetDaemon:
+    """
+    Run scans on one background thread, one at a time: a full sweep at start and every `sweep_interval` seconds,
+    a refresh of instances named by events as soon as the running scan finishes, and every `refresh_interval`
+    seconds a refresh of up to `refresh_limit` rows that are due (see FleetState.stale). The main loop only reads events and
+    writes reports, so a report is served from memory straight away even while a scan runs.
+    """
+
+    def __init__(self, regions=new1.REGIONS, workers=new1.MAX_WORKERS, batch_size=new1.INSTANCE_BATCH_SIZE,
+                 refresh_interval=REFRESH_INTERVAL, stale_after=STALE_AFTER, refresh_limit=REFRESH_LIMIT,
+                 sweep_interval=SWEEP_INTERVAL, events_file=None, report_dir='.'):
+        self.state = FleetState(regions)
+        self.events = queue.Queue()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.refresh_interval = refresh_interval
+        self.stale_after = stale_after
+        self.refresh_limit = refresh_limit
+        self.sweep_interval = sweep_interval
+        self.events_file = events_file
+        self.report_dir = report_dir
+        self.account_id = None
+        # Set from signal handlers, so plain attributes rather than anything that takes a lock
+        self.report_requested = False
+        self.stop_requested = False
+        self._stopped = threading.Event()
+        self._scanner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scan')
+
+    def sweep(self):
+        started = time.monotonic()
+        new1.get_instance_details(self.state, self.state.regions, self.workers, self.batch_size)
+        removed = sum(self.state.remove_unrefreshed(region, started) for region in self.state.regions)
+        new1.latest_ami_cache.save()
+        log.log(SUMMARY, "Sweep: %d instances in %.1fs, %d removed", len(self.state), time.monotonic() - started, removed)
+
+    def refresh(self, instance_ids):
+        """
+        Rescan {region: [InstanceId, ...]}. Instances the scan no longer finds are removed.
+        """
+        started = time.monotonic()
+        regions = [region for region in self.state.regions if instance_ids.get(region)]
+        new1.get_instance_details(self.state.refresh_writer(), regions, self.workers, self.batch_size,
+                                  {region: sorted(instance_ids[region]) for region in regions})
+        removed = sum(self.state.remove_unrefreshed(region, started, instance_ids[region]) for region in regions)
+        log.log(SUMMARY, "Refreshed %d instances in %.1fs, %d removed",
+                sum(len(instance_ids[region]) for region in regions), time.monotonic() - started, removed)
+
+    def write_report(self, path=None):
+        started = time.monotonic()
+        if not path:
+            timestamp = datetime.now().strftime('%d%B%Y_%H%M%S')
+            path = os.path.join(self.report_dir, f"{self.account_id}_Report_{timestamp}.csv")
+        rows = self.state.write_csv(path)
+        log.log(SUMMARY, "The CSV file report is generated in  >>> %s <<< (%d rows in %.2fs)", path, rows, time.monotonic() - started)
+        return path
+
+    def request_report(self, *_):
+        self.report_requested = True
+
+    def stop(self, *_):
+        self.stop_requested = True
+
+    def _follow_events(self, position):
+        # Read complete lines appended to the events file; a file that shrank was truncated or replaced
+        while not self._stopped.wait(EVENT_POLL_INTERVAL):
+            try:
+                size = os.path.getsize(self.events_file)
+            except OSError:
+                continue
+            if size < position:
+                position = 0
+            if size == position:
+                continue
+            with open(self.events_file, 'rb') as file:
+                file.seek(position)
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break
+                    position += len(line)
+                    if not line.strip():
+                        continue
+                    try:
+                        self.events.put(json.loads(line))
+                    except ValueError as e:
+                        log.error("Skipping malformed event in %s: %s", self.events_file, e)
+
+    def _collect_events(self, changed, actions):
+        # Wait briefly for the first event, then take whatever else is queued so bursts become one refresh
+        try:
+            event = self.events.get(timeout=EVENT_WAIT)
+        except queue.Empty:
+            return
+        while True:
+            action, region, instance_ids = parse_event(event)
+            if action == 'report':
+                actions['report'] = event.get('path')
+            elif action == 'sweep':
+                actions['sweep'] = True
+            for instance_id in instance_ids:
+                instance_region = region or self.state.region_of(instance_id)
+                if instance_region in self.state.regions:
+                    changed[instance_region].add(instance_id)
+                else:
+                    log.warning("Ignoring event for %s in unscanned region %s", instance_id, instance_region)
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                return
+
+    def run(self):
+        self.account_id = get_client('sts').get_caller_identity().get('Account')
+        follower = None
+        if self.events_file:
+            # Events written before start are covered by the first sweep
+            position = os.path.getsize(self.events_file) if os.path.exists(self.events_file) else 0
+            follower = threading.Thread(target=self._follow_events, args=(position,), name='events', daemon=True)
+            follower.start()
+
+        changed = defaultdict(set)
+        scan = self._scanner.submit(self.sweep)
+        scan_ids = None
+        next_sweep = time.monotonic() + self.sweep_interval
+        next_refresh = time.monotonic() + self.refresh_interval
+        try:
+            while not self.stop_requested:
+                actions = {}
+                self._collect_events(changed, actions)
+                if self.report_requested or 'report' in actions:
+                    self.report_requested = False
+                    self.write_report(actions.get('report'))
+
+                if scan and not scan.done():
+                    continue
+                if scan and scan.exception():
+                    log.error("Scan failed: %s", scan.exception())
+                    # Instances named by events are tried again with the next refresh
+                    for region, instance_ids in (scan_ids or {}).items():
+                        changed[region].update(instance_ids)
+                scan = scan_ids = None
+
+                now = time.monotonic()
+                if actions.get('sweep') or now >= next_sweep:
+                    changed.clear()
+                    scan = self._scanner.submit(self.sweep)
+                    next_sweep = now + self.sweep_interval
+                    next_refresh = now + self.refresh_interval
+                elif changed:
+                    scan_ids = dict(changed)
+                    changed = defaultdict(set)
+                    scan = self._scanner.submit(self.refresh, scan_ids)
+                elif now >= next_refresh:
+                    stale = self.state.stale(self.stale_after, self.refresh_limit)
+                    if stale:
+                        scan = self._scanner.submit(self.refresh, stale)
+                    next_refresh = now + self.refresh_interval
+        finally:
+            self._stopped.set()
+            self._scanner.shutdown(wait=True)
+            if follower:
+                follower.join()
+            new1.latest_ami_cache.save()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EC2 AMI and Patch compliance daemon with an in-memory fleet state")
+    parser.add_argument("-r", "--regions", nargs="+", default=new1.REGIONS, help="Regions to scan")
+    parser.add_argument("-w", "--workers", type=int, default=new1.MAX_WORKERS, help="Size of the worker pool used for instance batches")
+    parser.add_argument("-b", "--batch-size", type=int, default=new1.INSTANCE_BATCH_SIZE, help="Number of instances handed to a worker at a time")
+    parser.add_argument("-e", "--events-file", help="JSON Lines file to follow for change events")
+    parser.add_argument("--report-dir", default=".", help="Directory on-demand reports are written to")
+    parser.add_argument("--refresh-interval", type=int, default=REFRESH_INTERVAL, help="Seconds between checks for stale rows")
+    parser.add_argument("--stale-after", type=int, default=STALE_AFTER, help="Seconds after which a row is looked up again")
+    parser.add_argument("--refresh-limit", type=int, default=REFRESH_LIMIT, help="Most stale rows refreshed per check")
+    parser.add_argument("--sweep-interval", type=int, default=SWEEP_INTERVAL, help="Seconds between full rescans of every region")
+    parser.add_argument("--ami-cache-file", default=new1.AMI_CACHE_FILE, help="File the latest-AMI cache is persisted to")
+    parser.add_argument("--ami-cache-ttl", type=int, default=DEFAULT_TTL, help="Seconds a cached latest-AMI lookup stays valid (0 disables the cache)")
+    parser.add_argument("--ami-cache-size", type=int, default=DEFAULT_MAX_ENTRIES, help="Maximum number of cached latest-AMI lookups")
+    parser.add_argument("-v", "--verbosity", choices=list(LEVELS), default="summary", help="summary: terminal only; instance/debug: also write per-instance records to the log file")
+    parser.add_argument("--log-file", default="fleet_daemon.log", help="Log file for --verbosity instance/debug")
+    args = parser.parse_args()
+
+    new1.latest_ami_cache = LatestAmiCache(args.ami_cache_file, args.ami_cache_ttl, args.ami_cache_size)
+    setup_logging(args.verbosity, args.log_file if args.verbosity != "summary" else None)
+    daemon = FleetDaemon(args.regions, args.workers, args.batch_size, args.refresh_interval, args.stale_after,
+                         args.refresh_limit, args.sweep_interval, args.events_file, args.report_dir)
+    signal.signal(signal.SIGUSR1, daemon.request_report)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    log.log(SUMMARY, "Compliance daemon started (pid %d); send SIGUSR1 or a {\"action\": \"report\"} event for a report", os.getpid())
+    try:
+        daemon.run()
+    finally:
+        stop_logging()
@@ -1,164 +1,355 @@
-import boto3
 from datetime import datetime
 import re
-import csv
+import argparse
+import zlib
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from aws_batch import chunked, collect_image_ids, get_ami_map, get_asg_map, get_patch_state_map, get_tag_map, iter_reservation_pages_by_id, iter_reservation_pages_with_tokens
+from aws_clients import get_client, scheduler
+from ami_age import ages_in_days, newest_image
+from ami_cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, LatestAmiCache
+from report_writer import REPORT_FORMATS, open_report
+from scan_profile import ScanProfile
+from scan_log import INSTANCE, LEVELS, SUMMARY, Progress, log, setup_logging, stop_logging
+from scan_checkpoint import CHECKPOINT_INTERVAL, ScanCheckpoint
+from scan_snapshot import DEFAULT_MAX_AGE, ScanSnapshot
 
-# Initialize clients
-ssm = boto3.client('ssm')
-autoscaling = boto3.client('autoscaling')
+REGIONS = ['us-east-1', 'us-west-1', 'us-west-2']  # List of regions to check
+MAX_WORKERS = 8
+INSTANCE_BATCH_SIZE = 25
+DISCOVERY_PAGE_SIZE = 500
+ASYNC_CONCURRENCY = 10
+AMI_CACHE_FILE = '.latest_ami_cache.json'
+SNAPSHOT_FILE = '.scan_snapshot.json'
+CHECKPOINT_FILE = '.scan_checkpoint.json'
 
-def add_to_csv(column_name, value, row_number, data_store):
-    if row_number not in data_store:
-        data_store[row_number] = {}
-    if column_name in data_store[row_number]:
-        data_store[row_number][column_name] += ' ' + str(value)
+def timed(phase):
+    # Phase timing is only collected when --profile is on
+    return profiler.phase(phase) if profiler else nullcontext()
+
+def add_to_csv(column_name, value, row):
+    if column_name in row:
+        row[column_name] += ' ' + str(value)
+    else:
+        row[column_name] = str(value)
+
+def fetch_latest_ami(ami_name_pattern, region):
+    response = get_client('ec2', region).describe_images(
+        Owners=['amazon'],
+        Filters=[{'Name': 'name', 'Values': [ami_name_pattern]}]
+    )
+    latest_ami_info = newest_image(response['Images'])
+    if latest_ami_info:
+        return latest_ami_info['ImageId'], latest_ami_info['Name'], latest_ami_info['CreationDate']
     else:
-        data_store[row_number][column_name] = str(value)
-
-def generateCSV(filename, data_store):
-    # Define the order of column headers
-    columns_order = [
-        "Instance ID", "Instance Name", "Instance state", "Region", "Patch Status",
-        "Patch Required Action", "Mandatory Tags Missing", "Current AMI Name",
-        "Current AMI ID", "AMI Visibility", "Latest AMI Suggestion", "Latest AMI ID",
-        "Latest AMI Name", "Latest AMI creation Date", "AMI Age in Days", "ASG Name", "Notes"
-    ]
-    
-    # Write to CSV using the defined order of columns
-    with open(filename, 'w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=columns_order)
-        writer.writeheader()
-        for row_number in sorted(data_store.keys()):
-            writer.writerow(data_store[row_number])
-
-def agedifference(start_date, end_date):
-    start_date = datetime.strptime(start_date.split('.')[0], '%Y-%m-%dT%H:%M:%S')
-    end_date = datetime.strptime(end_date.split('.')[0], '%Y-%m-%dT%H:%M:%S')
-    return (start_date - end_date).days
+        return "Error: AMI might be too old or unable to get correct pattern.", "N/A", "N/A"
 
 def get_latest_ami(ami_name, region):
-    ec2_region = boto3.client('ec2', region_name=region)
     ami_name_pattern = re.sub(r'[0-9]{8}', '*', ami_name)
     try:
-        response = ec2_region.describe_images(
-            Owners=['amazon'],
-            Filters=[{'Name': 'name', 'Values': [ami_name_pattern]}]
-        )
-        images = sorted(response['Images'], key=lambda x: datetime.strptime(x['CreationDate'], '%Y-%m-%dT%H:%M:%S.%fZ'), reverse=True)
-        if images:
-            latest_ami_info = images[0]
-            return latest_ami_info['ImageId'], latest_ami_info['Name'], latest_ami_info['CreationDate']
-        else:
-            return "Error: AMI might be too old or unable to get correct pattern.", "N/A", "N/A"
+        return latest_ami_cache.get(region, ami_name_pattern, lambda: fetch_latest_ami(ami_name_pattern, region))
     except Exception as e:
         return f"Error: Unable to get the latest AMI information. {str(e)}", "N/A", "N/A"
 
-def check_patch_status(instance_id, region, row, data_store):
-    ssm_region = boto3.client('ssm', region_name=region)
+def check_patch_status(instance_id, patch_states, row):
+    patch_state = patch_states.get(instance_id)
     try:
-        patch_state = ssm_region.describe_instance_patch_states(InstanceIds=[instance_id])
-        if patch_state['InstancePatchStates']:
-            patch_group = patch_state['InstancePatchStates'][0]['PatchGroup']
-            if patch_state['InstancePatchStates'][0]['InstalledPendingRebootCount'] > 0:
-                add_to_csv('Patch Status', 'Non-Compliant', row, data_store)
-                add_to_csv('Patch Required Action', 'Reboot required for patches to apply', row, data_store)
+        if isinstance(patch_state, Exception):
+            raise patch_state
+        if patch_state:
+            if patch_state['InstalledPendingRebootCount'] > 0:
+                add_to_csv('Patch Status', 'Non-Compliant', row)
+                add_to_csv('Patch Required Action', 'Reboot required for patches to apply', row)
             else:
-                add_to_csv('Patch Status', 'Compliant', row, data_store)
-                add_to_csv('Patch Required Action', 'Patches are applied', row, data_store)
+                add_to_csv('Patch Status', 'Compliant', row)
+                add_to_csv('Patch Required Action', 'Patches are applied', row)
         else:
-            add_to_csv('Patch Status', 'Compliant', row, data_store)
-            add_to_csv('Patch Required Action', '', row, data_store)
+            add_to_csv('Patch Status', 'Compliant', row)
+            add_to_csv('Patch Required Action', '', row)
     except Exception as e:
-        add_to_csv('Patch Status', f'Error: {str(e)}', row, data_store)
-        add_to_csv('Patch Required Action', '', row, data_store)
+        add_to_csv('Patch Status', f'Error: {str(e)}', row)
+        add_to_csv('Patch Required Action', '', row)
 
-def check_tags(instance_id, region, row, required_tags, data_store):
-    ec2 = boto3.client('ec2', region_name=region)
+def check_tags(instance_id, tag_map, row, required_tags):
+    instance_tags = tag_map.get(instance_id, {})
     try:
-        instance_tags = ec2.describe_tags(Filters=[
-            {'Name': 'resource-type', 'Values': ['instance']},
-            {'Name': 'resource-id', 'Values': [instance_id]}
-        ])['Tags']
-        instance_tags_keys = {tag['Key'] for tag in instance_tags}
-        missing_tags = required_tags - instance_tags_keys
+        if isinstance(instance_tags, Exception):
+            raise instance_tags
+        missing_tags = required_tags - instance_tags.keys()
         if missing_tags:
-            add_to_csv('Mandatory Tags Missing', ', '.join(missing_tags), row, data_store)
+            add_to_csv('Mandatory Tags Missing', ', '.join(missing_tags), row)
     except Exception as e:
-        add_to_csv('Mandatory Tags Missing', f'Error: {str(e)}', row, data_store)
+        add_to_csv('Mandatory Tags Missing', f'Error: {str(e)}', row)
+
+def shard_instances(page_instances):
+    # With hash sharding (shard_scan.py) every worker lists the whole region but only scans its own instances
+    if not instance_shard:
+        return page_instances
+    index, count = instance_shard
+    return [instance for instance in page_instances if zlib.crc32(instance['InstanceId'].encode()) % count == index]
+
+def restored(instance):
+    # True if the instance's row was restored from the checkpoint of an interrupted scan
+    return scan_checkpoint is not None and instance['InstanceId'] in scan_checkpoint.done_ids
+
+def region_pages(ec2_region, region, instance_ids):
+    # (pages, first sequence) of a region; with a checkpoint, discovery restarts at its cursor page
+    if instance_ids is not None:
+        return ((reservations, None) for reservations in iter_reservation_pages_by_id(ec2_region, instance_ids, DISCOVERY_PAGE_SIZE)), 0
+    token, sequence = scan_checkpoint.cursor(region) if scan_checkpoint else (None, 0)
+    return iter_reservation_pages_with_tokens(ec2_region, DISCOVERY_PAGE_SIZE, token), sequence
+
+def plan_page(page_instances, requested_image_ids):
+    # In incremental mode only instances that changed since the last scan are looked up again,
+    # and after --resume instances restored from the checkpoint are not looked up at all
+    carried = {}
+    if scan_snapshot:
+        carried = {instance['InstanceId']: scan_snapshot.lookup(instance) for instance in page_instances}
+    stale_reservations = [{'Instances': [instance for instance in page_instances if not carried.get(instance['InstanceId']) and not restored(instance)]}]
+    new_image_ids = [ami_id for ami_id in collect_image_ids(stale_reservations) if ami_id not in requested_image_ids]
+    requested_image_ids.update(new_image_ids)
+    # Patch states are cheap in batches and change without the instance changing, so carried rows get them too
+    running_ids = [instance['InstanceId'] for instance in page_instances if instance['State']['Name'] == 'running' and not restored(instance)]
+    return carried, stale_reservations, new_image_ids, running_ids
+
+def update_ami_ages(ami_ages, ami_map, new_image_ids, carried):
+    # Ages are keyed by creation date and computed for the whole page at once, for scanned and carried rows alike
+    page_dates = {ami_map[ami_id]['CreationDate'] for ami_id in new_image_ids if ami_id in ami_map}
+    page_dates.update(entry['ami_creation_date'] for entry in carried.values() if entry and entry['ami_creation_date'] != "N/A")
+    page_dates = [date for date in page_dates if date not in ami_ages]
+    ami_ages.update(zip(page_dates, ages_in_days(page_dates)))
+
+def discover_region(region, region_index, batch_size, submit, instance_ids=None):
+    if scan_checkpoint and scan_checkpoint.cursor(region) is None:
+        return
+    ec2_region = get_client('ec2', region)
+    ssm_region = get_client('ssm', region)
+    with timed('asg_sweep'):
+        asg_map = get_asg_map(get_client('autoscaling', region), instance_ids=instance_ids)
+    ami_map = {}
+    ami_ages = {}
+    requested_image_ids = set()
+
+    # Each page is looked up and handed to the workers before the next page is requested
+    pages, sequence = region_pages(ec2_region, region, instance_ids)
+    for reservations, next_token in pages:
+        page_instances = shard_instances([instance for reservation in reservations for instance in reservation['Instances']])
+        if progress:
+            progress.discovered(len(page_instances))
+        carried, stale_reservations, new_image_ids, running_ids = plan_page(page_instances, requested_image_ids)
+        with timed('page_lookups'):
+            ami_map.update(get_ami_map(ec2_region, new_image_ids))
+            tag_map = get_tag_map(ec2_region, stale_reservations)
+            patch_states = get_patch_state_map(ssm_region, running_ids)
+        with timed('ami_ages'):
+            update_ami_ages(ami_ages, ami_map, new_image_ids, carried)
+        page_data = {
+            'ami_map': ami_map,
+            'ami_ages': ami_ages,
+            'asg_map': asg_map,
+            'tag_map': tag_map,
+            'patch_states': patch_states,
+            'carried': carried,
+            'page': scan_checkpoint.add_page(region, sequence, len(page_instances), next_token) if scan_checkpoint else None,
+        }
+        for batch in chunked(page_instances, batch_size):
+            submit(batch, region, page_data, region_index, sequence)
+            sequence += len(batch)
+
+def process_instance(instance, region, region_data, required_tags):
+    row = {}
+    instance_id = instance['InstanceId']
+    instance_name = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), "N/A")
+    instance_state = instance['State']['Name']
+    ami_id = instance['ImageId']
+
+    ami = region_data['ami_map'].get(ami_id)
+    if ami:
+        ami_name = ami.get('Name', 'N/A')
+        ami_creation_date = ami['CreationDate']
+        ami_age = region_data['ami_ages'][ami_creation_date]
+        ami_visibility = "Public" if ami['Public'] else "Private"
+    else:
+        ami_name = "AMI not found"
+        ami_creation_date = "N/A"
+        ami_age = "N/A"
+        ami_visibility = "N/A"
+
+    asg_name = region_data['asg_map'].get(instance_id, "N/A")
+
+    with timed('latest_ami'):
+        latest_ami_id, latest_ami_name, latest_ami_creation_date = get_latest_ami(ami_name, region)
+
+    add_to_csv("Instance ID", instance_id, row)
+    add_to_csv("Instance Name", instance_name, row)
+    add_to_csv("Instance state", instance_state, row)
+    add_to_csv("Region", region, row)
+    add_to_csv("Current AMI Name", ami_name, row)
+    add_to_csv("Current AMI ID", ami_id, row)
+    add_to_csv("AMI Visibility", ami_visibility, row)
+    add_to_csv("Latest AMI Suggestion", latest_ami_name, row)
+    add_to_csv("Latest AMI ID", latest_ami_id, row)
+    add_to_csv("Latest AMI Name", latest_ami_name, row)
+    add_to_csv("Latest AMI creation Date", latest_ami_creation_date, row)
+    add_to_csv("AMI Age in Days", ami_age, row)
+    add_to_csv("ASG Name", asg_name, row)
+    add_to_csv("Notes", "", row)
+
+    check_patch_status(instance_id, region_data['patch_states'], row)
+    check_tags(instance_id, region_data['tag_map'], row, required_tags)
+
+    # One structured record per instance; formatted only when --verbosity instance or debug is on
+    log.log(INSTANCE, "instance=%s name=%s state=%s region=%s ami_id=%s ami_name=%s ami_age_days=%s visibility=%s "
+            "latest_ami_id=%s latest_ami_name=%s latest_ami_date=%s asg=%s",
+            instance_id, instance_name, instance_state, region, ami_id, ami_name, ami_age, ami_visibility,
+            latest_ami_id, latest_ami_name, latest_ami_creation_date, asg_name)
+
+    return row
 
-def get_instance_details():
-    regions = ['us-east-1', 'us-west-1', 'us-west-2']  # List of regions to check
-    row = 2
+def carry_forward(instance_id, entry, region_data):
+    row = dict(entry['row'])
+    if entry['ami_creation_date'] != "N/A":
+        row["AMI Age in Days"] = str(region_data['ami_ages'][entry['ami_creation_date']])
+    # The ASG sweep and patch state lookups run on every scan anyway, so those columns are always current
+    row["ASG Name"] = region_data['asg_map'].get(instance_id, "N/A")
+    row.pop('Patch Status', None)
+    row.pop('Patch Required Action', None)
+    check_patch_status(instance_id, region_data['patch_states'], row)
+    return row
+
+def row_failed(row):
+    # True if one of the row's lookups raised, rather than the instance itself being non-compliant
+    return any(value.startswith('Error: Unable') for value in row.values()) or \
+        row.get('Patch Status', '').startswith('Error') or row.get('Mandatory Tags Missing', '').startswith('Error')
+
+def record_snapshot(instance, row, region_data, entry):
+    # Rows where a lookup raised are re-queried next time instead of carrying the error forward
+    if entry:
+        scan_snapshot.record(instance, row, entry['ami_creation_date'], entry['scanned_at'], reusable=not row_failed(row))
+        return
+    ami = region_data['ami_map'].get(instance['ImageId'])
+    scan_snapshot.record(instance, row, ami['CreationDate'] if ami else "N/A", reusable=not row_failed(row))
+
+def process_instances(instances, region, region_data, region_index, first_sequence, required_tags, report):
+    # Rows are keyed by (region index, discovery sequence) so the report keeps region then discovery order
+    for offset, instance in enumerate(instances):
+        key = (region_index, first_sequence + offset)
+        if restored(instance):
+            # Already written to the report from the checkpoint
+            scan_checkpoint.row_done(region, region_data['page'])
+            if progress:
+                progress.done()
+            continue
+        entry = region_data['carried'].get(instance['InstanceId'])
+        with timed('rows'):
+            if entry:
+                row = carry_forward(instance['InstanceId'], entry, region_data)
+            else:
+                row = process_instance(instance, region, region_data, required_tags)
+            if scan_snapshot:
+                record_snapshot(instance, row, region_data, entry)
+        with timed('report_write'):
+            report.write_row(key, row)
+        if scan_checkpoint and region_data['page']:
+            scan_checkpoint.row_done(region, region_data['page'], key, instance['InstanceId'], row, row_failed(row))
+        if progress:
+            progress.done()
+
+def get_instance_details(report, regions=REGIONS, max_workers=MAX_WORKERS, batch_size=INSTANCE_BATCH_SIZE, instance_ids=None):
+    # instance_ids ({region: [InstanceId, ...]}) narrows the scan, ASG lookup included, to those instances
+    required_tags = {'company-ssm-managed-patch-install-reboot', 'company:ssm:managed-qualys-install-linux', 'company:ssm:managed-crowdstrike-install', 'company-ssm-managed-scan'}
+    # Discovery blocks once this many batches are queued, so memory does not grow with fleet size
+    in_flight = threading.BoundedSemaphore(max_workers * 2)
+    batch_futures = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, ThreadPoolExecutor(max_workers=len(regions)) as discovery:
+        def submit(batch, region, region_data, region_index, first_sequence):
+            in_flight.acquire()
+            batch_future = executor.submit(process_instances, batch, region, region_data, region_index, first_sequence, required_tags, report)
+            batch_future.add_done_callback(lambda _: in_flight.release())
+            batch_futures.append(batch_future)
+
+        discovery_futures = [
+            discovery.submit(discover_region, region, region_index, batch_size, submit, instance_ids[region] if instance_ids is not None else None)
+            for region_index, region in enumerate(regions)
+        ]
+        for discovery_future in discovery_futures:
+            discovery_future.result()
+        if progress:
+            progress.discovery_finished()
+        for batch_future in batch_futures:
+            batch_future.result()
+
+async def discover_region_async(region, region_index, call, required_tags, report):
+    if scan_checkpoint and scan_checkpoint.cursor(region) is None:
+        return
+    ec2_region = get_client('ec2', region)
+    ssm_region = get_client('ssm', region)
+    with timed('asg_sweep'):
+        asg_map = await call('autoscaling', region, get_asg_map, get_client('autoscaling', region))
+    ami_map = {}
+    ami_ages = {}
+    requested_image_ids = set()
+
+    pages, sequence = region_pages(ec2_region, region, None)
+    next_page = asyncio.ensure_future(call('ec2', region, next, pages, None))
+    while True:
+        page = await next_page
+        if page is None:
+            break
+        reservations, next_token = page
+        # The next page is fetched while this one is looked up
+        next_page = asyncio.ensure_future(call('ec2', region, next, pages, None))
+        page_instances = shard_instances([instance for reservation in reservations for instance in reservation['Instances']])
+        if progress:
+            progress.discovered(len(page_instances))
+        carried, stale_reservations, new_image_ids, running_ids = plan_page(page_instances, requested_image_ids)
+        # AMI, tag and patch lookups for the page run at the same time instead of one after another
+        with timed('page_lookups'):
+            page_ami_map, tag_map, patch_states = await asyncio.gather(
+                call('ec2', region, get_ami_map, ec2_region, new_image_ids),
+                call('ec2', region, get_tag_map, ec2_region, stale_reservations),
+                call('ssm', region, get_patch_state_map, ssm_region, running_ids),
+            )
+        ami_map.update(page_ami_map)
+        with timed('ami_ages'):
+            update_ami_ages(ami_ages, ami_map, new_image_ids, carried)
+
+        # Resolve the latest AMI for every distinct image name concurrently, so the row pass below only hits the cache
+        ami_names = {ami_map[instance['ImageId']].get('Name', 'N/A') if instance['ImageId'] in ami_map else "AMI not found"
+                     for instance in stale_reservations[0]['Instances']}
+        with timed('latest_ami_prefetch'):
+            await asyncio.gather(*(call('ec2', region, get_latest_ami, ami_name, region) for ami_name in ami_names))
+
+        page_data = {
+            'ami_map': ami_map,
+            'ami_ages': ami_ages,
+            'asg_map': asg_map,
+            'tag_map': tag_map,
+            'patch_states': patch_states,
+            'carried': carried,
+            'page': scan_checkpoint.add_page(region, sequence, len(page_instances), next_token) if scan_checkpoint else None,
+        }
+        await asyncio.to_thread(process_instances, page_instances, region, page_data, region_index, sequence, required_tags, report)
+        sequence += len(page_instances)
+
+async def get_instance_details_async(report, regions=REGIONS, concurrency=ASYNC_CONCURRENCY):
     required_tags = {'company-ssm-managed-patch-install-reboot', 'company:ssm:managed-qualys-install-linux', 'company:ssm:managed-crowdstrike-install', 'company-ssm-managed-scan'}
-    
-    for region in regions:
-        ec2_region = boto3.client('ec2', region_name=region)
-        instances = ec2_region.describe_instances()
-        
-        for reservation in instances['Reservations']:
-            for instance in reservation['Instances']:
-                instance_id = instance['InstanceId']
-                instance_name = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), "N/A")
-                instance_state = instance['State']['Name']
-                ami_id = instance['ImageId']
-
-                ami_response = ec2_region.describe_images(ImageIds=[ami_id])
-                if ami_response['Images']:
-                    ami = ami_response['Images'][0]
-                    ami_name = ami.get('Name', 'N/A')
-                    ami_creation_date = ami['CreationDate']
-                    ami_age = agedifference(datetime.now().strftime('%Y-%m-%dT%H:%M:%S'), ami_creation_date)
-                    ami_visibility = "Public" if ami['Public'] else "Private"
-                else:
-                    ami_name = "AMI not found"
-                    ami_creation_date = "N/A"
-                    ami_age = "N/A"
-                    ami_visibility = "N/A"
-
-                asg_name = "N/A"
-                asg_response = autoscaling.describe_auto_scaling_instances(InstanceIds=[instance_id])
-                if asg_response['AutoScalingInstances']:
-                    asg_name = asg_response['AutoScalingInstances'][0]['AutoScalingGroupName']
-
-                latest_ami_id, latest_ami_name, latest_ami_creation_date = get_latest_ami(ami_name, region)
-                latest_ami_age = "N/A"
-                if latest_ami_creation_date != "N/A" and latest_ami_creation_date != ami_creation_date:
-                    latest_ami_age = agedifference(datetime.now().strftime('%Y-%m-%dT%H:%M:%S'), latest_ami_creation_date)
-
-                add_to_csv("Instance ID", instance_id, row, data_store)
-                add_to_csv("Instance Name", instance_name, row, data_store)
-                add_to_csv("Instance state", instance_state, row, data_store)
-                add_to_csv("Region", region, row, data_store)
-                add_to_csv("Current AMI Name", ami_name, row, data_store)
-                add_to_csv("Current AMI ID", ami_id, row, data_store)
-                add_to_csv("AMI Visibility", ami_visibility, row, data_store)
-                add_to_csv("Latest AMI Suggestion", latest_ami_name, row, data_store)
-                add_to_csv("Latest AMI ID", latest_ami_id, row, data_store)
-                add_to_csv("Latest AMI Name", latest_ami_name, row, data_store)
-                add_to_csv("Latest AMI creation Date", latest_ami_creation_date, row, data_store)
-                add_to_csv("AMI Age in Days", ami_age, row, data_store)
-                add_to_csv("ASG Name", asg_name, row, data_store)
-                add_to_csv("Notes", "", row, data_store)
-
-                check_patch_status(instance_id, region, row, data_store)
-                check_tags(instance_id, region, row, required_tags, data_store)
-
-                print(f"Instance ID: {instance_id}")
-                print(f"Instance Name: {instance_name}")
-                print(f"State: {instance_state}")
-                print(f"Region: {region}")
-                print(f"Current AMI Name: {ami_name}")
-                print(f"Current AMI ID: {ami_id}")
-                print(f"Latest AMI ID: {latest_ami_id}")
-                print(f"Latest AMI Name: {latest_ami_name}")
-                print(f"Latest AMI creation Date: {latest_ami_creation_date}")
-                print(f"AMI Age: {ami_age} days")
-                print(f"AMI Visibility: {ami_visibility}")
-                print(f"ASG Name: {asg_name}")
-                print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-                print("------")
-
-                row += 1
+    # At most `concurrency` calls in flight per (service, region); boto3 is blocking, so each call runs on a thread
+    limits = defaultdict(lambda: asyncio.Semaphore(concurrency))
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=len(regions) * (3 * concurrency + 1)))
+
+    async def call(service, region, function, *args):
+        async with limits[(service, region)]:
+            return await asyncio.to_thread(function, *args)
+
+    # Rows are written as each region goes, so discovery only finishes together with the scan
+    await asyncio.gather(*(discover_region_async(region, region_index, call, required_tags, report) for region_index, region in enumerate(regions)))
+    if progress:
+        progress.discovery_finished()
 
 #### #### #### #### #### #### #### #### #### #### #### #### 
 #### #### #### #### #### #### #### #### #### #### #### #### 
@@ -166,14 +357,97 @@ def get_instance_details():
 #### #### #### #### #### #### #### #### #### #### #### #### 
 #### #### #### #### #### #### #### #### #### #### #### #### 
 
-# This dictionary will act as an associative array to store our data
-data_store = {}
-row = 0
+# Latest AMI per (region, name pattern); in memory only unless main points it at a file
+latest_ami_cache = LatestAmiCache()
+# Previous scan used by --incremental; None means every instance is scanned
+scan_snapshot = None
+# Call and phase timings collected with --profile
+profiler = None
+# Live instances/s and ETA line; only the command line run shows one
+progress = None
+# (index, count) of the instance-ID hash shard this process scans; None scans every instance
+instance_shard = None
+# Finished rows and discovery cursors of this scan, for --resume after an interruption
+scan_checkpoint = None
 
-get_instance_details()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EC2 AMI and Patch compliance report")
+    parser.add_argument("-r", "--regions", nargs="+", default=REGIONS, help="Regions to scan")
+    parser.add_argument("-w", "--workers", type=int, default=MAX_WORKERS, help="Size of the worker pool used for regions and instance batches")
+    parser.add_argument("-b", "--batch-size", type=int, default=INSTANCE_BATCH_SIZE, help="Number of instances handed to a worker at a time")
+    parser.add_argument("--ami-cache-file", default=AMI_CACHE_FILE, help="File the latest-AMI cache is persisted to between runs")
+    parser.add_argument("--ami-cache-ttl", type=int, default=DEFAULT_TTL, help="Seconds a cached latest-AMI lookup stays valid (0 disables the cache)")
+    parser.add_argument("--ami-cache-size", type=int, default=DEFAULT_MAX_ENTRIES, help="Maximum number of cached latest-AMI lookups")
+    parser.add_argument("-i", "--incremental", action="store_true", help="Only re-query instances that changed since the last scan and carry the rest forward")
+    parser.add_argument("--snapshot-file", default=SNAPSHOT_FILE, help="File holding the previous scan for --incremental")
+    parser.add_argument("--snapshot-max-age", type=int, default=DEFAULT_MAX_AGE, help="Seconds after which an unchanged instance is re-queried anyway")
+    parser.add_argument("-a", "--async", dest="use_async", action="store_true", help="Run lookups as asyncio tasks instead of the worker pool")
+    parser.add_argument("--async-concurrency", type=int, default=ASYNC_CONCURRENCY, help="Calls in flight per service and region in --async mode")
+    parser.add_argument("-v", "--verbosity", choices=list(LEVELS), default="summary", help="summary: terminal only; instance/debug: also write per-instance records to a log file")
+    parser.add_argument("--log-file", help="Log file for --verbosity instance/debug (default: <report name>.log)")
+    parser.add_argument("-p", "--profile", action="store_true", help="Print call latencies, phase times and cache hit rates and save them as JSON next to the report")
+    parser.add_argument("-f", "--formats", nargs="+", choices=sorted(REPORT_FORMATS), default=["csv"], help="Report outputs written side by side while the scan runs")
+    parser.add_argument("--resume", action="store_true", help="Continue the interrupted scan in --checkpoint-file instead of starting over")
+    parser.add_argument("--checkpoint-file", default=CHECKPOINT_FILE, help="File finished rows and discovery cursors are checkpointed to")
+    parser.add_argument("--checkpoint-interval", type=int, default=CHECKPOINT_INTERVAL, help="Seconds between checkpoints")
+    args = parser.parse_args()
 
-# Generate CSV with dynamic filename
-account_id = boto3.client('sts').get_caller_identity().get('Account')
-timestamp = datetime.now().strftime('%d%B%Y_%H%M%S')
-filename = f"{account_id}_Report_{timestamp}.csv"
-generateCSV(filename, data_store)
+    latest_ami_cache = LatestAmiCache(args.ami_cache_file, args.ami_cache_ttl, args.ami_cache_size)
+    if args.incremental:
+        scan_snapshot = ScanSnapshot(args.snapshot_file, args.snapshot_max_age)
+    if args.profile:
+        profiler = ScanProfile()
+        scheduler.profile = profiler
+
+    # A resumed scan keeps the report name and regions of the scan it continues
+    scan_checkpoint = ScanCheckpoint(args.checkpoint_file, args.checkpoint_interval)
+    resumed = args.resume and scan_checkpoint.load()
+    if resumed:
+        report_name = scan_checkpoint.report_name
+        regions = scan_checkpoint.regions
+    else:
+        # Generate the report files with a dynamic name, one per requested format
+        account_id = get_client('sts').get_caller_identity().get('Account')
+        timestamp = datetime.now().strftime('%d%B%Y_%H%M%S')
+        report_name = f"{account_id}_Report_{timestamp}"
+        regions = args.regions
+        scan_checkpoint.start(report_name, regions)
+    log_file = args.log_file or (f"{report_name}.log" if args.verbosity != "summary" else None)
+    setup_logging(args.verbosity, log_file)
+    if args.resume and not resumed:
+        log.log(SUMMARY, "No checkpoint found in %s, starting a full scan", args.checkpoint_file)
+    report = open_report(report_name, args.formats)
+    if resumed:
+        log.log(SUMMARY, "Resuming %s: %d finished rows restored from the checkpoint", report_name, scan_checkpoint.replay(report))
+    progress = Progress().start()
+    try:
+        if args.use_async:
+            asyncio.run(get_instance_details_async(report, regions, args.async_concurrency))
+        else:
+            get_instance_details(report, regions, args.workers, args.batch_size)
+    except BaseException:
+        scan_checkpoint.save()
+        log.error("Scan interrupted; run again with --resume to continue from the last checkpoint")
+        raise
+    else:
+        scan_checkpoint.clear()
+    finally:
+        # Keep what was resolved and written so far even if the scan dies part-way
+        progress.stop()
+        latest_ami_cache.save()
+        report.close()
+        if scan_snapshot:
+            scan_snapshot.save()
+            log.log(SUMMARY, "Incremental scan: %d instances re-queried, %d carried forward", scan_snapshot.rescanned, scan_snapshot.carried)
+        if profiler:
+            profiler.finish()
+            caches = {'latest_ami': (latest_ami_cache.hits, latest_ami_cache.misses)}
+            if scan_snapshot:
+                caches['scan_snapshot'] = (scan_snapshot.carried, scan_snapshot.rescanned)
+            summary = profiler.summary(caches, scheduler)
+            profiler.print_summary(summary)
+            profiler.save(f"{report_name}.profile.json", summary)
+            log.log(SUMMARY, "Profile saved to %s.profile.json", report_name)
+        if log_file:
+            log.log(SUMMARY, "Per-instance log written to %s", log_file)
+        stop_logging()
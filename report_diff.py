@@ -0,0 +1,124 @@
+"""
+Diff two compliance report CSVs joined on the instance ID: new and removed instances, patch status flips,
+AMI changes and tag regressions (mandatory tags that went missing).
+
+    python report_diff.py 123456789012_Report_17October2026_020000.csv 123456789012_Report_18October2026_020000.csv -o diff.csv
+
+The smaller report is loaded into a hash index on the instance ID and the larger one is streamed past it, so the
+run is linear in the total number of rows and memory only grows with the smaller report.
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+from collections import Counter
+
+# Column names used by new1.py reports first, then by the test1-test4 reports
+FIELDS = {
+    'instance_id': ('Instance ID', 'InstanceID'),
+    'region': ('Region',),
+    'patch_status': ('Patch Status',),
+    'ami_id': ('Current AMI ID', 'Current AMI-ID'),
+    'tags_missing': ('Mandatory Tags Missing', 'Tags missing'),
+}
+
+DIFF_COLUMNS = ['Change', 'Instance ID', 'Region', 'Old', 'New']
+
+def resolve_columns(fieldnames, path):
+    # Map each field to the column this report uses for it; only the instance ID is required
+    columns = {}
+    for field, candidates in FIELDS.items():
+        columns[field] = next((name for name in candidates if name in (fieldnames or [])), None)
+    if not columns['instance_id']:
+        raise ValueError(f"{path} has no instance ID column (expected one of {', '.join(FIELDS['instance_id'])})")
+    return columns
+
+def iter_report(path):
+    """
+    Yield (instance_id, region, patch_status, ami_id, tags_missing) for every row of a report.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        columns = resolve_columns(header, path)
+        # Plain rows indexed by position are much cheaper than a dict per row
+        positions = [header.index(columns[field]) if columns[field] else None for field in FIELDS]
+        for row in reader:
+            yield tuple(row[position] if position is not None and position < len(row) else '' for position in positions)
+
+def missing_tags(value):
+    """
+    The set of tag keys named in a "tags missing" cell, or None if the check itself failed.
+    Handles both "a, b" (new1.py) and "Missing: a Missing: b" (test2/test3) cells.
+    """
+    if value.startswith('Error'):
+        return None
+    return {tag.rstrip('.') for tag in re.split(r'[,\s]+', value) if tag and tag != 'Missing:'}
+
+def compare(old, new):
+    """
+    Yield (change, old value, new value) for the tracked fields of one instance.
+    """
+    _, _, old_patch, old_ami, old_tags = old
+    _, _, new_patch, new_ami, new_tags = new
+    if old_patch != new_patch:
+        yield 'patch_status', old_patch, new_patch
+    if old_ami != new_ami:
+        yield 'ami', old_ami, new_ami
+    old_missing, new_missing = missing_tags(old_tags), missing_tags(new_tags)
+    if old_missing is not None and new_missing is not None and new_missing - old_missing:
+        yield 'tag_regression', ', '.join(sorted(old_missing)), ', '.join(sorted(new_missing - old_missing))
+
+def diff_reports(old_path, new_path):
+    """
+    Yield (change, instance_id, region, old, new) records. change is 'new', 'removed', 'patch_status', 'ami' or
+    'tag_regression'. Changes of instances in both reports come in streaming order, then the unmatched instances
+    of the indexed report.
+    """
+    # Index whichever report is smaller; the other is only ever streamed
+    old_is_indexed = os.path.getsize(old_path) <= os.path.getsize(new_path)
+    indexed_path, streamed_path = (old_path, new_path) if old_is_indexed else (new_path, old_path)
+    index = {record[0]: record for record in iter_report(indexed_path)}
+
+    for record in iter_report(streamed_path):
+        instance_id, region = record[0], record[1]
+        other = index.pop(instance_id, None)
+        if other is None:
+            yield ('new' if old_is_indexed else 'removed'), instance_id, region, '', ''
+            continue
+        old, new = (other, record) if old_is_indexed else (record, other)
+        for change, old_value, new_value in compare(old, new):
+            yield change, instance_id, new[1] or old[1], old_value, new_value
+
+    for instance_id, record in index.items():
+        yield ('removed' if old_is_indexed else 'new'), instance_id, record[1], '', ''
+
+def write_diff(old_path, new_path, output):
+    """
+    Stream the diff to `output` as CSV and return a Counter of changes by type.
+    """
+    counts = Counter()
+    writer = csv.writer(output)
+    writer.writerow(DIFF_COLUMNS)
+    for change in diff_reports(old_path, new_path):
+        writer.writerow(change)
+        counts[change[0]] += 1
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diff two compliance reports by instance ID")
+    parser.add_argument("old", help="Earlier report CSV")
+    parser.add_argument("new", help="Later report CSV")
+    parser.add_argument("-o", "--output", help="Write the changes to this CSV file instead of stdout")
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, 'w', newline='') as output:
+            counts = write_diff(args.old, args.new, output)
+        summary = sys.stdout
+    else:
+        counts = write_diff(args.old, args.new, sys.stdout)
+        summary = sys.stderr
+    print(f"New instances: {counts['new']}, removed: {counts['removed']}, patch status changes: {counts['patch_status']}, "
+          f"AMI changes: {counts['ami']}, tag regressions: {counts['tag_regression']}", file=summary)
@@ -0,0 +1,102 @@
+"""
+In-memory index of the latest compliance report CSV, for serving it over HTTP without re-reading the file.
+"""
+import csv
+import glob
+import hashlib
+import os
+import threading
+import time
+
+# Columns that can be filtered on, with the query parameter that selects each
+FILTERS = {'region': 'Region', 'patch_status': 'Patch Status', 'asg': 'ASG Name'}
+
+RELOAD_CHECK_INTERVAL = 30  # seconds between checks for a newer report file
+SELECTION_CACHE_SIZE = 256
+
+class ReportIndex:
+    """
+    One report loaded into a list of rows plus a {value: [row positions]} index per filter column.
+    `etag` is the SHA-256 of the file, so it only changes when the report does.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            content = file.read()
+        self.etag = hashlib.sha256(content).hexdigest()
+        self.modified = os.path.getmtime(path)
+        reader = csv.DictReader(content.decode('utf-8-sig').splitlines(), restval='')
+        self.columns = reader.fieldnames or []
+        # Short rows get '' for their missing cells (restval) and cells past the header are dropped, so no
+        # value or key is ever None
+        self.rows = [{column: row[column] for column in self.columns} for row in reader]
+        self.index = {column: {} for column in FILTERS.values() if column in self.columns}
+        for position, row in enumerate(self.rows):
+            for column, values in self.index.items():
+                values.setdefault(row[column], []).append(position)
+        self._selections = {}
+        self._lock = threading.Lock()
+
+    def counts(self, column):
+        return {value: len(positions) for value, positions in self.index.get(column, {}).items()}
+
+    def select(self, filters):
+        """
+        Row positions matching every filtered column, where a column matches any of its values, in report order.
+        `filters` maps a column to a tuple of values. Results are cached, since pollers repeat the same queries.
+        """
+        key = tuple(sorted(filters.items()))
+        with self._lock:
+            if key in self._selections:
+                return self._selections[key]
+        if not filters:
+            positions = range(len(self.rows))
+        else:
+            matches = []
+            for column, values in filters.items():
+                column_index = self.index.get(column, {})
+                lists = [column_index.get(value, []) for value in values]
+                matches.append(lists[0] if len(lists) == 1 else sorted(set().union(*lists)))
+            # Walk the smallest match list and check membership in the others
+            matches.sort(key=len)
+            others = [set(match) for match in matches[1:]]
+            positions = [position for position in matches[0] if all(position in other for other in others)]
+        with self._lock:
+            if len(self._selections) >= SELECTION_CACHE_SIZE:
+                self._selections.clear()
+            self._selections[key] = positions
+        return positions
+
+class ReportStore:
+    """
+    Hold the ReportIndex of the newest file matching any of `patterns` and swap in a newer one when it appears,
+    checking the directory at most every `check_interval` seconds.
+    """
+
+    def __init__(self, patterns, check_interval=RELOAD_CHECK_INTERVAL):
+        self.patterns = [patterns] if isinstance(patterns, str) else list(patterns)
+        self.check_interval = check_interval
+        self._index = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def latest_path(self):
+        paths = [path for pattern in self.patterns for path in glob.glob(pattern)]
+        return max(paths, key=os.path.getmtime, default=None)
+
+    def get(self):
+        """
+        Return the current ReportIndex, or None if there is no report yet.
+        """
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.check_interval:
+            return self._index
+        with self._lock:
+            if self._checked is None or now - self._checked >= self.check_interval:
+                path = self.latest_path()
+                index = self._index
+                if path and (index is None or path != index.path or os.path.getmtime(path) != index.modified):
+                    self._index = ReportIndex(path)
+                self._checked = now
+            return self._index
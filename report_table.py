@@ -0,0 +1,78 @@
+"""
+Column-oriented report table for the scripts that used to fill a sparse {(row, col): value} grid.
+"""
+
+# Row numbers follow the old grid: row 1 was the header, so data starts at row 2
+FIRST_ROW = 2
+
+# Columns of the test1-test4 reports, in display order
+REPORT_COLUMNS = [
+    'InstanceID', 'Instance Name', 'Instance State', 'Region', 'Patch Status', 'Patch required action',
+    'Tags missing', 'Current AMI-name', 'Current AMI-ID', 'AMI_Visibility', 'AMI update suggestion',
+    'Latest AMI-ID', 'Latest AMI creation date', 'AMI age', 'ASG Name', 'Notes'
+]
+
+class ReportTable:
+    """
+    Each column gets a fixed storage slot when it is added and keeps its values in an append-only list indexed by
+    row. The display order is kept separately, so inserting a column only touches the column list, and export
+    zips the column lists together instead of scanning every cell.
+    """
+
+    def __init__(self, columns=()):
+        self.columns = []
+        self.row_count = 0
+        self._slots = {}
+        self._values = []
+        for column in columns:
+            self.add_column(column)
+
+    def add_column(self, name, position=None):
+        """
+        Add a column at a 1-based display position (the end by default). Adding an existing column is a no-op.
+        """
+        if name in self._slots:
+            return
+        self._slots[name] = len(self._values)
+        self._values.append([])
+        if position is None:
+            self.columns.append(name)
+        else:
+            self.columns.insert(position - 1, name)
+
+    def add(self, row, name, data):
+        """
+        Set a cell, adding the column if needed. A second value for the same cell is appended after a space.
+        """
+        if name not in self._slots:
+            self.add_column(name)
+        values = self._values[self._slots[name]]
+        index = row - FIRST_ROW
+        if index >= len(values):
+            values.extend([''] * (index - len(values)))
+            values.append(data)
+            if index >= self.row_count:
+                self.row_count = index + 1
+        elif values[index]:
+            values[index] += f" {data}"
+        else:
+            values[index] = data
+
+    def get(self, row, name, default=''):
+        slot = self._slots.get(name)
+        index = row - FIRST_ROW
+        if slot is None or index >= len(self._values[slot]):
+            return default
+        return self._values[slot][index]
+
+    def rows(self):
+        """
+        Return an iterator over the data rows as tuples in display order.
+        """
+        columns = []
+        for name in self.columns:
+            values = self._values[self._slots[name]]
+            if len(values) < self.row_count:
+                values.extend([''] * (self.row_count - len(values)))
+            columns.append(values)
+        return zip(*columns)
@@ -0,0 +1,248 @@
+"""
+Streaming sinks for the compliance report: CSV, JSON Lines and SQLite, alone or several at once.
+"""
+import csv
+import heapq
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+# Define the order of column headers
+COLUMNS_ORDER = [
+    "Instance ID", "Instance Name", "Instance state", "Region", "Patch Status",
+    "Patch Required Action", "Mandatory Tags Missing", "Current AMI Name",
+    "Current AMI ID", "AMI Visibility", "Latest AMI Suggestion", "Latest AMI ID",
+    "Latest AMI Name", "Latest AMI creation Date", "AMI Age in Days", "ASG Name", "Notes"
+]
+
+SORT_RUN_SIZE = 10000  # rows SortedReportWriter sorts in memory before spilling them to a run file
+
+class StreamingReportWriter:
+    """
+    Write finished rows to disk as soon as they can be placed in report order.
+
+    Rows are keyed by (part index, sequence), e.g. (region index, discovery sequence). Each part streams to its own
+    `<filename>.part<N>` file and only rows that arrive ahead of a missing sequence are held in memory.
+    close() stitches the parts into `filename` in part order under a single header, replacing it in one step.
+    """
+
+    def __init__(self, filename, columns=COLUMNS_ORDER):
+        self.filename = filename
+        self.columns = columns
+        self.rows_written = 0
+        self._parts = {}
+        self._lock = threading.Lock()
+
+    def _open_part(self, part_index):
+        path = f"{self.filename}.part{part_index}"
+        file = open(path, 'w', newline='')
+        part = {
+            'path': path,
+            'file': file,
+            'writer': self._row_writer(file),
+            'next_sequence': 0,
+            'pending': {},
+        }
+        self._parts[part_index] = part
+        return part
+
+    def _row_writer(self, file):
+        return csv.DictWriter(file, fieldnames=self.columns)
+
+    def _write_header(self, file):
+        csv.DictWriter(file, fieldnames=self.columns).writeheader()
+
+    def _write(self, part, row):
+        part['writer'].writerow(row)
+        self.rows_written += 1
+
+    def write_row(self, key, row):
+        part_index, sequence = key
+        with self._lock:
+            part = self._parts.get(part_index) or self._open_part(part_index)
+            part['pending'][sequence] = row
+            while part['next_sequence'] in part['pending']:
+                self._write(part, part['pending'].pop(part['next_sequence']))
+                part['next_sequence'] += 1
+            part['file'].flush()
+
+    def close(self):
+        with self._lock:
+            # Stitch into a temporary file so readers of `filename` never see a half-written report
+            tmp_path = f"{self.filename}.tmp"
+            with open(tmp_path, 'w', newline='') as file:
+                self._write_header(file)
+                for part_index in sorted(self._parts):
+                    part = self._parts[part_index]
+                    # Rows behind a sequence that never arrived (a failed instance) are still kept
+                    for sequence in sorted(part['pending']):
+                        self._write(part, part['pending'].pop(sequence))
+                    part['file'].close()
+                    with open(part['path'], newline='') as part_file:
+                        shutil.copyfileobj(part_file, file)
+                    os.remove(part['path'])
+            os.replace(tmp_path, self.filename)
+            self._parts = {}
+
+class _JsonLinesRowWriter:
+    def __init__(self, file, columns):
+        self.file = file
+        self.columns = columns
+
+    def writerow(self, row):
+        self.file.write(json.dumps({column: row.get(column, '') for column in self.columns}) + '\n')
+
+class JsonLinesReportWriter(StreamingReportWriter):
+    """
+    Same ordering and part files as the CSV writer, but one JSON object per row and no header.
+    """
+
+    def _row_writer(self, file):
+        return _JsonLinesRowWriter(file, self.columns)
+
+    def _write_header(self, file):
+        pass
+
+class SqliteReportWriter:
+    """
+    Insert rows into a `report` table as they finish, so the report can be queried while the scan runs.
+
+    Rows keep their (part_index, sequence) key in two extra columns; ORDER BY part_index, sequence gives the CSV
+    order. An existing `report` table in `filename` is replaced. Inserts are committed every `commit_every` rows
+    and on close().
+    """
+
+    INDEXED_COLUMNS = ["Region", "Patch Status", "Current AMI ID"]
+
+    def __init__(self, filename, columns=COLUMNS_ORDER, commit_every=500):
+        self.filename = filename
+        self.columns = columns
+        self.commit_every = commit_every
+        self.rows_written = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        quoted = [f'"{column}"' for column in columns]
+        # Start the table over like the file writers do; a resumed scan replays its finished rows into it
+        self._connection.execute("DROP TABLE IF EXISTS report")
+        self._connection.execute(f"CREATE TABLE report (part_index INTEGER, sequence INTEGER, {', '.join(f'{column} TEXT' for column in quoted)})")
+        for column in self.INDEXED_COLUMNS:
+            if column in columns:
+                index_name = 'idx_report_' + column.lower().replace(' ', '_')
+                self._connection.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON report ("{column}")')
+        self._connection.commit()
+        self._insert = f"INSERT INTO report VALUES (?, ?, {', '.join('?' * len(columns))})"
+
+    def write_row(self, key, row):
+        part_index, sequence = key
+        with self._lock:
+            self._connection.execute(self._insert, [part_index, sequence] + [row.get(column, '') for column in self.columns])
+            self.rows_written += 1
+            if self.rows_written % self.commit_every == 0:
+                self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+class MultiReportWriter:
+    """
+    Fan every finished row out to several writers, e.g. CSV and SQLite from the same scan.
+    """
+
+    def __init__(self, writers):
+        self.writers = writers
+
+    @property
+    def rows_written(self):
+        return self.writers[0].rows_written
+
+    def write_row(self, key, row):
+        for writer in self.writers:
+            writer.write_row(key, row)
+
+    def close(self):
+        # Close every sink even if one of them fails, then re-raise the first error
+        error = None
+        for writer in self.writers:
+            try:
+                writer.close()
+            except Exception as e:
+                error = error or e
+        if error:
+            raise error
+
+class SortedReportWriter:
+    """
+    Write a shard's rows sorted by `sort_key(row)`, so partial reports from several workers can be combined with
+    a k-way merge instead of a full re-sort.
+
+    Rows are buffered up to `run_size` at a time; every full buffer is sorted and spilled to a `<filename>.run<N>`
+    file, and close() merges the runs into `filename`. Memory stays at one buffer plus one row per run, however
+    large the shard.
+    """
+
+    def __init__(self, filename, sort_key, columns=COLUMNS_ORDER, run_size=SORT_RUN_SIZE):
+        self.filename = filename
+        self.sort_key = sort_key
+        self.columns = columns
+        self.run_size = run_size
+        self.rows_written = 0
+        self._rows = []
+        self._runs = []
+        self._lock = threading.Lock()
+
+    def write_row(self, key, row):
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) >= self.run_size:
+                self._spill()
+
+    def _spill(self):
+        self._rows.sort(key=self.sort_key)
+        path = f"{self.filename}.run{len(self._runs)}"
+        with open(path, 'w', newline='') as file:
+            csv.DictWriter(file, fieldnames=self.columns).writerows(self._rows)
+        self._runs.append(path)
+        self._rows = []
+
+    def close(self):
+        with self._lock:
+            self._rows.sort(key=self.sort_key)
+            files = [open(path, newline='') for path in self._runs]
+            try:
+                runs = [csv.DictReader(file, fieldnames=self.columns) for file in files]
+                tmp_path = f"{self.filename}.tmp"
+                with open(tmp_path, 'w', newline='') as file:
+                    writer = csv.DictWriter(file, fieldnames=self.columns)
+                    writer.writeheader()
+                    for row in heapq.merge(*runs, self._rows, key=self.sort_key):
+                        writer.writerow(row)
+                        self.rows_written += 1
+                os.replace(tmp_path, self.filename)
+            finally:
+                for file in files:
+                    file.close()
+            for path in self._runs:
+                os.remove(path)
+            self._rows = []
+            self._runs = []
+
+# Output format name -> (file extension, writer class)
+REPORT_FORMATS = {
+    'csv': ('csv', StreamingReportWriter),
+    'jsonl': ('jsonl', JsonLinesReportWriter),
+    'sqlite': ('sqlite', SqliteReportWriter),
+}
+
+def open_report(basename, formats=('csv',), columns=COLUMNS_ORDER):
+    """
+    Open one writer per format as `<basename>.<extension>` and return a single writer feeding all of them.
+    """
+    writers = []
+    for report_format in formats:
+        extension, writer_class = REPORT_FORMATS[report_format]
+        writers.append(writer_class(f"{basename}.{extension}", columns))
+    return writers[0] if len(writers) == 1 else MultiReportWriter(writers)
@@ -0,0 +1,170 @@
+"""
+Checkpoints of a running scan, so an interrupted scan can be resumed instead of started over.
+"""
+import json
+import os
+import threading
+import time
+
+CHECKPOINT_INTERVAL = 30  # seconds between checkpoint writes
+ROWS_READ_SIZE = 65536  # bytes read at a time when looking for the last complete row
+
+class ScanCheckpoint:
+    """
+    Completed rows and the discovery cursor of every region.
+
+    Finished rows are appended to `<path>.rows` as [region index, sequence, InstanceId, row] lines. The cursor of
+    a region is the page token and first sequence of the oldest page that still has unfinished rows; it only moves
+    past a page once every row of it is finished, so rows whose lookups failed keep their page open and are
+    retried on resume. `<path>` holds the cursors, the report name and the regions, and is rewritten every
+    `interval` seconds and by save().
+    """
+
+    def __init__(self, path, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.rows_path = f"{path}.rows"
+        self.interval = interval
+        self.report_name = None
+        self.regions = []
+        self.done_ids = set()
+        self._cursors = {}
+        self._pages = {}
+        self._rows_file = None
+        self._saved = time.monotonic()
+        self._lock = threading.Lock()
+
+    def start(self, report_name, regions):
+        """
+        Begin a new checkpoint, discarding any previous one.
+        """
+        self.report_name = report_name
+        self.regions = list(regions)
+        self.done_ids = set()
+        self._cursors = {region: {'token': None, 'sequence': 0, 'finished': False} for region in self.regions}
+        self._pages = {region: [] for region in self.regions}
+        self._rows_file = open(self.rows_path, 'w')
+        self.save()
+
+    def load(self):
+        """
+        Pick up the previous checkpoint. Returns False if there is none.
+        """
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return False
+        self.report_name = state['report_name']
+        self.regions = state['regions']
+        self._cursors = state['cursors']
+        self._pages = {region: [] for region in self.regions}
+        self._trim_rows()
+        self._rows_file = open(self.rows_path, 'a')
+        return True
+
+    def _trim_rows(self):
+        # Cut off a last line torn by the interruption; the next row appended to it could never be read back
+        try:
+            with open(self.rows_path, 'rb+') as file:
+                position = file.seek(0, os.SEEK_END)
+                end = 0
+                while position > 0:
+                    step = min(ROWS_READ_SIZE, position)
+                    position -= step
+                    file.seek(position)
+                    newline = file.read(step).rfind(b'\n')
+                    if newline != -1:
+                        end = position + newline + 1
+                        break
+                file.truncate(end)
+        except FileNotFoundError:
+            pass
+
+    def replay(self, report):
+        """
+        Write every row finished before the interruption to `report` and return how many there were.
+        """
+        restored = 0
+        try:
+            with open(self.rows_path) as file:
+                for line in file:
+                    try:
+                        region_index, sequence, instance_id, row = json.loads(line)
+                    except ValueError:
+                        # A line cut short by the interruption; that instance is simply scanned again
+                        continue
+                    report.write_row((region_index, sequence), row)
+                    self.done_ids.add(instance_id)
+                    restored += 1
+        except OSError:
+            pass
+        return restored
+
+    def cursor(self, region):
+        """
+        (page token, first sequence) to resume discovery of `region` from, or None if it was finished.
+        """
+        with self._lock:
+            cursor = self._cursors[region]
+            return None if cursor['finished'] else (cursor['token'], cursor['sequence'])
+
+    def add_page(self, region, first_sequence, size, next_token):
+        """
+        Register a discovered page and return the handle its rows are reported against.
+        """
+        page = {'first_sequence': first_sequence, 'size': size, 'done': 0, 'next_token': next_token}
+        with self._lock:
+            self._pages[region].append(page)
+            self._advance(region)
+        return page
+
+    def row_done(self, region, page, key=None, instance_id=None, row=None, failed=False):
+        """
+        Count one row of `page` as finished and record it, unless it was restored from the checkpoint (no `row`)
+        or one of its lookups failed.
+        """
+        with self._lock:
+            if row is not None and not failed:
+                self._rows_file.write(json.dumps([key[0], key[1], instance_id, row], separators=(',', ':')) + '\n')
+            if not failed:
+                page['done'] += 1
+                self._advance(region)
+            if time.monotonic() - self._saved >= self.interval:
+                self._save()
+
+    def _advance(self, region):
+        # Move the cursor past every leading page whose rows are all finished
+        pages = self._pages[region]
+        while pages and pages[0]['done'] >= pages[0]['size']:
+            page = pages.pop(0)
+            self._cursors[region] = {
+                'token': page['next_token'],
+                'sequence': page['first_sequence'] + page['size'],
+                'finished': page['next_token'] is None,
+            }
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        # Rows go to disk before the cursors that point past them
+        self._rows_file.flush()
+        os.fsync(self._rows_file.fileno())
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({'report_name': self.report_name, 'regions': self.regions, 'cursors': self._cursors}, file)
+        os.replace(tmp_path, self.path)
+        self._saved = time.monotonic()
+
+    def clear(self):
+        """
+        Remove the checkpoint once the scan has finished.
+        """
+        with self._lock:
+            if self._rows_file:
+                self._rows_file.close()
+                self._rows_file = None
+            for path in (self.path, self.rows_path):
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,138 @@
+"""
+Level-gated logging for the scanners with a background writer, plus a live progress line.
+
+Levels, from least to most detail:
+    summary   run-level messages and errors, shown on the terminal
+    instance  one record per instance or check, written to the log file only
+    debug     everything, including retries and throttling, also to the log file
+"""
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+SUMMARY = 25  # between INFO and WARNING
+INSTANCE = 15  # between DEBUG and INFO
+logging.addLevelName(SUMMARY, 'SUMMARY')
+logging.addLevelName(INSTANCE, 'INSTANCE')
+
+LEVELS = {'summary': SUMMARY, 'instance': INSTANCE, 'debug': logging.DEBUG}
+
+log = logging.getLogger('scanner')
+
+_listener = None
+
+def setup_logging(level='summary', log_file=None):
+    """
+    Send scanner records through a queue to one background thread that does all the writing, so workers never
+    block on the terminal or the disk. The terminal gets SUMMARY and above; `log_file` gets everything down to
+    `level`. Records below the effective level are dropped before they are formatted.
+    """
+    global _listener
+    stop_logging()
+
+    terminal = logging.StreamHandler(sys.stdout)
+    terminal.setLevel(SUMMARY)
+    terminal.setFormatter(logging.Formatter('%(message)s'))
+    handlers = [terminal]
+    if log_file:
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setLevel(LEVELS[level])
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        handlers.append(file_handler)
+
+    records = queue.SimpleQueue()
+    log.handlers = [logging.handlers.QueueHandler(records)]
+    log.setLevel(LEVELS[level] if log_file else SUMMARY)
+    log.propagate = False
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    """
+    Write out everything still queued and stop the background writer. Summary messages logged afterwards are
+    written straight to the terminal.
+    """
+    global _listener
+    if _listener:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    terminal = logging.StreamHandler(sys.stdout)
+    terminal.setFormatter(logging.Formatter('%(message)s'))
+    log.handlers = [terminal]
+    log.setLevel(SUMMARY)
+    log.propagate = False
+
+class Progress:
+    """
+    "done/discovered instances, rate, ETA" refreshed by a background thread every `interval` seconds. On a terminal
+    the line is redrawn in place; otherwise (or with live=False) a new line is written every 10 intervals.
+    """
+
+    def __init__(self, label='', interval=1.0, stream=sys.stderr, live=None):
+        self.label = label
+        self.interval = interval
+        self.stream = stream
+        self.live = stream.isatty() if live is None else live
+        self.started = time.monotonic()
+        self._discovered = 0
+        self._done = 0
+        self._discovery_finished = False
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='progress', daemon=True)
+
+    def start(self):
+        self.started = time.monotonic()
+        self._thread.start()
+        return self
+
+    def discovered(self, count):
+        with self._lock:
+            self._discovered += count
+
+    def discovery_finished(self):
+        with self._lock:
+            self._discovery_finished = True
+
+    def done(self, count=1):
+        with self._lock:
+            self._done += count
+
+    def line(self):
+        with self._lock:
+            done, discovered, finished = self._done, self._discovered, self._discovery_finished
+        elapsed = time.monotonic() - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        if rate and discovered > done:
+            eta = time.strftime('%H:%M:%S', time.gmtime((discovered - done) / rate))
+        else:
+            eta = '--:--:--'
+        total = discovered if finished else f"{discovered}+"
+        prefix = f"{self.label}: " if self.label else ''
+        return f"{prefix}{done}/{total} instances  {rate:.0f}/s  ETA {eta}"
+
+    def _run(self):
+        ticks = 0
+        while not self._stopped.wait(self.interval):
+            ticks += 1
+            if self.live:
+                self.stream.write(f"\r{self.line()}\033[K")
+                self.stream.flush()
+            elif ticks % 10 == 0:
+                self.stream.write(f"{self.line()}\n")
+                self.stream.flush()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self.live:
+            self.stream.write(f"\r{self.line()}\033[K\n")
+        else:
+            self.stream.write(f"{self.line()}\n")
+        self.stream.flush()
@@ -0,0 +1,105 @@
+"""
+Timing and counters for one scan: per-call latency by (operation, region), pipeline phase times and cache hit rates.
+"""
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+PERCENTILES = [50, 95, 99]
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+class ScanProfile:
+    """
+    Collect call latencies and phase times from every worker thread. Phase times are summed over threads, so with
+    parallel workers they can add up to more than the wall time of the scan.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.wall_time = None
+        self._calls = defaultdict(list)
+        self._errors = defaultdict(int)
+        self._phases = defaultdict(float)
+        self._phase_counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record_call(self, operation, region, seconds, failed=False):
+        with self._lock:
+            self._calls[(operation, region)].append(seconds)
+            if failed:
+                self._errors[(operation, region)] += 1
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._phases[name] += elapsed
+                self._phase_counts[name] += 1
+
+    def finish(self):
+        self.wall_time = time.perf_counter() - self.started
+
+    def summary(self, caches=None, scheduler=None):
+        """
+        Plain dict of everything collected. `caches` maps a cache name to its (hits, misses);
+        `scheduler` adds throttled and retried call counts.
+        """
+        with self._lock:
+            calls = {key: sorted(latencies) for key, latencies in self._calls.items()}
+            errors = dict(self._errors)
+            phases = dict(self._phases)
+            phase_counts = dict(self._phase_counts)
+
+        operations = []
+        for (operation, region), latencies in sorted(calls.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            entry = {
+                'operation': operation,
+                'region': region,
+                'calls': len(latencies),
+                'errors': errors.get((operation, region), 0),
+                'total_seconds': sum(latencies),
+            }
+            for p in PERCENTILES:
+                entry[f"p{p}_ms"] = percentile(latencies, p) * 1000
+            if scheduler:
+                entry['throttled'] = scheduler.throttled[(operation, region)]
+                entry['retried'] = scheduler.retries[(operation, region)]
+            operations.append(entry)
+
+        cache_stats = {}
+        for name, (hits, misses) in (caches or {}).items():
+            cache_stats[name] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else None}
+
+        return {
+            'wall_seconds': self.wall_time if self.wall_time is not None else time.perf_counter() - self.started,
+            'operations': operations,
+            'phases': {name: {'seconds': seconds, 'count': phase_counts[name]} for name, seconds in phases.items()},
+            'caches': cache_stats,
+        }
+
+    def print_summary(self, summary):
+        print(f"\nScan profile ({summary['wall_seconds']:.2f} s wall time)")
+        print(f"\t{'operation':<34} {'region':<12} {'calls':>7} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'total s':>8}")
+        for entry in summary['operations']:
+            print(f"\t{entry['operation']:<34} {str(entry['region']):<12} {entry['calls']:>7} {entry['errors']:>6} "
+                  f"{entry['p50_ms']:>8.1f} {entry['p95_ms']:>8.1f} {entry['p99_ms']:>8.1f} {entry['total_seconds']:>8.2f}")
+        print("\tPhases (seconds summed over worker threads):")
+        for name, phase in sorted(summary['phases'].items(), key=lambda item: -item[1]['seconds']):
+            print(f"\t\t{name:<16} {phase['seconds']:>9.2f} s  {phase['count']:>8} times")
+        for name, cache in summary['caches'].items():
+            hit_rate = f"{cache['hit_rate']:.1%}" if cache['hit_rate'] is not None else "n/a"
+            print(f"\tCache {name}: {cache['hits']} hits, {cache['misses']} misses ({hit_rate})")
+
+    def save(self, path, summary):
+        with open(path, 'w') as file:
+            json.dump(summary, file, indent=2)
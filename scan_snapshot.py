@@ -0,0 +1,85 @@
+"""
+Compact snapshot of the previous scan, used to carry unchanged instances forward in incremental mode.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_MAX_AGE = 3 * 24 * 60 * 60  # seconds
+
+def instance_fingerprint(instance):
+    """
+    Hash of the describe_instances fields that drive every report column: ImageId, state, launch time and tags.
+    """
+    tags = sorted((tag['Key'], tag['Value']) for tag in instance.get('Tags', []))
+    parts = [instance['ImageId'], instance['State']['Name'], str(instance.get('LaunchTime')), json.dumps(tags)]
+    return hashlib.sha1('\x1f'.join(parts).encode()).hexdigest()
+
+class ScanSnapshot:
+    """
+    Per-instance fingerprint, report row and AMI creation date from the previous scans.
+
+    An instance is carried forward when its fingerprint is unchanged, its row is younger than `max_age` seconds and
+    it was not recorded as `reusable=False` (e.g. a lookup failed). Patch columns are not carried: the scanner
+    looks patch states up for every running instance. save() merges this scan's entries into the previous
+    snapshot, so instances a failed or region-limited scan did not reach keep theirs until they expire.
+    """
+
+    def __init__(self, path, max_age=DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.carried = 0
+        self.rescanned = 0
+        self._previous = {}
+        self._current = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as file:
+                self._previous = json.load(file)
+        except (OSError, ValueError):
+            self._previous = {}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        now = time.time()
+        with self._lock:
+            # Entries past max_age could never be carried again, which also drops terminated instances in time
+            merged = {instance_id: entry for instance_id, entry in self._previous.items() if now - entry['scanned_at'] < self.max_age}
+            merged.update(self._current)
+            with open(tmp_path, 'w') as file:
+                json.dump(merged, file, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, instance):
+        """
+        Return the previous entry for an instance if it can be carried forward, otherwise None.
+        """
+        entry = self._previous.get(instance['InstanceId'])
+        if not entry or entry['fingerprint'] != instance_fingerprint(instance):
+            return None
+        if time.time() - entry['scanned_at'] >= self.max_age:
+            return None
+        if not entry.get('reusable', True):
+            return None
+        return entry
+
+    def record(self, instance, row, ami_creation_date, scanned_at=None, reusable=True):
+        entry = {
+            'fingerprint': instance_fingerprint(instance),
+            'scanned_at': scanned_at or time.time(),
+            'ami_creation_date': ami_creation_date,
+            'row': row,
+        }
+        if not reusable:
+            entry['reusable'] = False
+        with self._lock:
+            self._current[instance['InstanceId']] = entry
+            if scanned_at:
+                self.carried += 1
+            else:
+                self.rescanned += 1
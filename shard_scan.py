@@ -0,0 +1,191 @@
+"""
+Sharded scanning for new1.py. The fleet is split into shards by account, region or instance-ID hash, each shard is
+scanned by its own worker into a partial report, and the partials are combined with a k-way merge.
+
+    python shard_scan.py run --by hash --shards 4                   # every shard as a local process, then merge
+    python shard_scan.py run --by account --profiles prod nonprod   # one shard per AWS profile
+    python shard_scan.py shard --by region --shards 3 --index 1     # a single shard, e.g. on its own node
+    python shard_scan.py merge parts/*_Part*.csv                    # combine partials copied back from the nodes
+    python shard_scan.py run --by hash --shards 4 --fake 20000      # offline, all workers against the same FakeAWS fleet
+
+Partial reports have the usual report columns and are sorted by region (in --regions order) and instance ID, and
+merged by account, region and instance ID, so every way of sharding the same fleet merges to the same report.
+"""
+import argparse
+import csv
+import heapq
+import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import boto3
+
+import new1
+from ami_cache import LatestAmiCache
+from aws_clients import get_client, set_client_factory, use_session
+from fake_aws import FakeAWS, FakeFleet
+from report_writer import COLUMNS_ORDER, SortedReportWriter
+from scan_log import SUMMARY, log, setup_logging, stop_logging
+
+SHARD_MODES = ['account', 'region', 'hash']
+
+# <account>_Part<index>of<count>.csv
+PART_NAME = re.compile(r'^(?P<account>[^_]+)_Part(?P<index>\d+)of(?P<count>\d+)\.csv$')
+
+def plan_shards(by, count, regions, profiles=()):
+    """
+    Return the shards as dicts of 'profile' (None for the default credentials), 'regions' and 'hash'
+    ((index, count) or None). Account sharding makes one shard per profile and ignores `count`.
+    """
+    if by == 'account':
+        return [{'profile': profile, 'regions': regions, 'hash': None} for profile in profiles]
+    profile = profiles[0] if profiles else None
+    if by == 'region':
+        count = min(count, len(regions))
+        return [{'profile': profile, 'regions': regions[index::count], 'hash': None} for index in range(count)]
+    return [{'profile': profile, 'regions': regions, 'hash': (index, count)} for index in range(count)]
+
+def report_order(regions):
+    """
+    Sort key of a report row: region in `regions` order (unknown regions last, by name), then instance ID.
+    """
+    rank = {region: position for position, region in enumerate(regions)}
+    return lambda row: (rank.get(row['Region'], len(regions)), row['Region'], row['Instance ID'])
+
+def scan_shard(index, shard, count, regions, out_dir='.', workers=new1.MAX_WORKERS, batch_size=new1.INSTANCE_BATCH_SIZE, fake_size=None):
+    """
+    Scan one shard into `<account>_Part<index>of<count>.csv` in `out_dir` and return its path.
+    With `fake_size`, the shard is scanned against a FakeAWS fleet of that size, seeded by the profile name.
+    """
+    setup_logging()
+    try:
+        if fake_size:
+            backend = FakeAWS(FakeFleet(fake_size, seed=zlib.crc32(shard['profile'].encode()) if shard['profile'] else 0))
+            if shard['profile']:
+                backend.account_id = shard['profile']
+            set_client_factory(backend.client)
+        elif shard['profile']:
+            use_session(boto3.Session(profile_name=shard['profile']))
+        new1.instance_shard = shard['hash']
+        new1.latest_ami_cache = LatestAmiCache()
+
+        account_id = get_client('sts').get_caller_identity().get('Account')
+        path = os.path.join(out_dir, f"{account_id}_Part{index:03d}of{count:03d}.csv")
+        report = SortedReportWriter(path, report_order(regions))
+        try:
+            new1.get_instance_details(report, shard['regions'], workers, batch_size)
+        finally:
+            report.close()
+        log.log(SUMMARY, "Shard %d of %d: %d rows written to %s", index + 1, count, report.rows_written, path)
+        return path
+    finally:
+        stop_logging()
+
+def _keyed_rows(reader, account, sort_key):
+    for row in reader:
+        yield (account, *sort_key(row)), account, row
+
+def merge_partials(paths, regions, filename=None):
+    """
+    k-way merge sorted partial reports into one CSV and return its name. When the partials span several accounts,
+    an Account column is added in front, as in test2.py's fleet report.
+    """
+    sort_key = report_order(regions)
+    files = []
+    streams = []
+    accounts = set()
+    columns = None
+    try:
+        for path in paths:
+            match = PART_NAME.match(os.path.basename(path))
+            account = match.group('account') if match else ''
+            accounts.add(account)
+            file = open(path, newline='')
+            files.append(file)
+            reader = csv.DictReader(file)
+            columns = columns or reader.fieldnames
+            streams.append(_keyed_rows(reader, account, sort_key))
+
+        with_account = len(accounts) > 1
+        timestamp = datetime.now().strftime('%d%B%Y_%H%M%S')
+        if not filename:
+            filename = f"FleetReport_{timestamp}.csv" if with_account else f"{next(iter(accounts), '')}_Report_{timestamp}.csv"
+        rows = 0
+        with open(filename, 'w', newline='') as merged:
+            writer = csv.DictWriter(merged, fieldnames=(['Account'] if with_account else []) + (columns or COLUMNS_ORDER))
+            writer.writeheader()
+            # Each partial is already sorted, so only the head row of every partial is held at a time
+            for _, account, row in heapq.merge(*streams, key=lambda item: item[0]):
+                if with_account:
+                    row['Account'] = account
+                writer.writerow(row)
+                rows += 1
+    finally:
+        for file in files:
+            file.close()
+    log.log(SUMMARY, "The CSV file report is generated in  >>> %s <<< (%d rows from %d partial reports)", filename, rows, len(paths))
+    return filename
+
+def run_shards(shards, regions, processes=None, out_dir='.', workers=new1.MAX_WORKERS, batch_size=new1.INSTANCE_BATCH_SIZE,
+               fake_size=None, keep_parts=False, filename=None):
+    """
+    Scan every shard in a local worker process, then merge the partial reports.
+    """
+    with ProcessPoolExecutor(max_workers=processes or len(shards)) as executor:
+        futures = [
+            executor.submit(scan_shard, index, shard, len(shards), regions, out_dir, workers, batch_size, fake_size)
+            for index, shard in enumerate(shards)
+        ]
+        paths = [future.result() for future in futures]
+    merged = merge_partials(paths, regions, filename)
+    if not keep_parts:
+        for path in paths:
+            os.remove(path)
+    return merged
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded EC2 AMI and Patch compliance scan")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Scan every shard as a local process and merge the partial reports")
+    shard_parser = commands.add_parser("shard", help="Scan a single shard into a partial report")
+    merge_parser = commands.add_parser("merge", help="Merge partial reports into the final report")
+
+    for command in (run_parser, shard_parser):
+        command.add_argument("--by", choices=SHARD_MODES, default="region", help="Split the work by account (one shard per profile), region or instance-ID hash")
+        command.add_argument("-n", "--shards", type=int, default=len(new1.REGIONS), help="Number of region or hash shards")
+        command.add_argument("--profiles", nargs="+", default=[], help="AWS profiles: one per account shard, or a single profile for region and hash shards")
+        command.add_argument("-w", "--workers", type=int, default=new1.MAX_WORKERS, help="Scanner worker threads per shard")
+        command.add_argument("-b", "--batch-size", type=int, default=new1.INSTANCE_BATCH_SIZE, help="Number of instances handed to a worker at a time")
+        command.add_argument("--out-dir", default=".", help="Directory the partial reports are written to")
+        command.add_argument("--fake", type=int, metavar="SIZE", help="Scan a FakeAWS fleet of this many instances instead of AWS")
+    run_parser.add_argument("-p", "--processes", type=int, help="Local worker processes (default: one per shard)")
+    run_parser.add_argument("--keep-parts", action="store_true", help="Keep the partial reports after merging")
+    run_parser.add_argument("-o", "--output", help="Merged report file name")
+    shard_parser.add_argument("-i", "--index", type=int, required=True, help="0-based index of the shard to scan")
+    merge_parser.add_argument("parts", nargs="+", help="Partial report CSVs")
+    merge_parser.add_argument("-o", "--output", help="Merged report file name")
+    for command in (run_parser, shard_parser, merge_parser):
+        command.add_argument("-r", "--regions", nargs="+", default=new1.REGIONS, help="Regions to scan, in report order")
+    args = parser.parse_args()
+
+    if args.command != "merge":
+        if args.by == "account" and not args.profiles:
+            parser.error("--by account needs --profiles")
+        if args.by != "account" and len(args.profiles) > 1:
+            parser.error("only --by account takes more than one profile")
+        shards = plan_shards(args.by, args.shards, args.regions, args.profiles)
+
+    setup_logging()
+    try:
+        if args.command == "run":
+            run_shards(shards, args.regions, args.processes, args.out_dir, args.workers, args.batch_size, args.fake, args.keep_parts, args.output)
+        elif args.command == "shard":
+            if not 0 <= args.index < len(shards):
+                parser.error(f"--index must be between 0 and {len(shards) - 1}")
+            scan_shard(args.index, shards[args.index], len(shards), args.regions, args.out_dir, args.workers, args.batch_size, args.fake)
+        else:
+            merge_partials(args.parts, args.regions, args.output)
+    finally:
+        stop_logging()
@@ -3,12 +3,14 @@ import subprocess
 import sys
 import csv
 import datetime
-import boto3
 import re
 import json
 from dateutil import parser
 import argparse
 import shutil
+from aws_batch import get_tag_map, iter_reservation_pages
+from aws_clients import get_client
+from report_table import REPORT_COLUMNS, ReportTable
 
 
 # Function to check if required commands are installed
@@ -50,36 +52,8 @@ def is_session_alive():
     return False
 
 
-# Function to add or update column positions
-column_positions = {}
-csv_data = {}
-
-
-def add_column(col_name, position=None):
-    if position is None:
-        position = len(column_positions) + 1
-
-    for key in column_positions:
-        if column_positions[key] >= position:
-            column_positions[key] += 1
-
-    column_positions[col_name] = position
-    header_key = (1, position)
-    csv_data[header_key] = col_name
-
-
-# Function to add data to CSV
-def add_to_csv(row, col_name, data):
-    if col_name not in column_positions:
-        add_column(col_name)
-
-    col = column_positions[col_name]
-    key = (row, col)
-
-    if key in csv_data:
-        csv_data[key] += f" {data}"
-    else:
-        csv_data[key] = data
+# Report cells, filled in row by row while the regions are scanned
+table = ReportTable(REPORT_COLUMNS)
 
 
 # Function to generate CSV
@@ -89,34 +63,28 @@ def generate_csv(aws_account):
 
     with open(filename, 'w', newline='') as csvfile:
         writer = csv.writer(csvfile)
-        max_row = max(key[0] for key in csv_data.keys())
-        max_col = max(key[1] for key in csv_data.keys())
-
-        for i in range(1, max_row + 1):
-            row = [csv_data.get((i, j), '') for j in range(1, max_col + 1)]
-            writer.writerow(row)
+        writer.writerow(table.columns)
+        writer.writerows(table.rows())
 
     print(f"\n\n\t\t The CSV file report is generated in  >>> {filename} <<< \n\n")
 
 
 # Function to check all required tags for an instance
-def chk_all_tags(tocheckinstance, tocheckregion, row, tags_to_be_checked):
-    client = boto3.client('ec2', region_name=tocheckregion)
-    response = client.describe_tags(Filters=[
-        {'Name': 'resource-type', 'Values': ['instance']},
-        {'Name': 'resource-id', 'Values': [tocheckinstance]}
-    ])
-
-    tags = {tag['Key']: tag['Value'] for tag in response['Tags']}
+def chk_all_tags(tocheckinstance, tag_map, row, tags_to_be_checked):
+    tags = tag_map.get(tocheckinstance, {})
+    if isinstance(tags, Exception):
+        table.add(row, 'Tags missing', f"Error: {tags}")
+        return
+
     missing_tags = [tag for tag in tags_to_be_checked if tag not in tags]
 
     for tag in missing_tags:
-        add_to_csv(row, 'Tags missing', f"Missing: {tag}")
+        table.add(row, 'Tags missing', f"Missing: {tag}")
 
 
 # Function to check the patch status of an instance
 def check_patch_status(tocheckinstance, tocheckregion, row):
-    client = boto3.client('ssm', region_name=tocheckregion)
+    client = get_client('ssm', tocheckregion)
     response = client.describe_instance_patch_states(InstanceIds=[tocheckinstance])
     patch_state = response['InstancePatchStates'][0]
 
@@ -124,20 +92,20 @@ def check_patch_status(tocheckinstance, tocheckregion, row):
     missing_count = patch_state['MissingCount']
 
     if installed_pending_reboot_count == 0 and missing_count == 0:
-        add_to_csv(row, 'Patch Status', 'Compliant')
-        add_to_csv(row, 'Patch required action', 'Patches are applied')
+        table.add(row, 'Patch Status', 'Compliant')
+        table.add(row, 'Patch required action', 'Patches are applied')
     else:
         if installed_pending_reboot_count > 0:
-            add_to_csv(row, 'Tags missing', 'ssm-managed-patch-install-reboot')
+            table.add(row, 'Tags missing', 'ssm-managed-patch-install-reboot')
 
         if missing_count > 0:
-            add_to_csv(row, 'Patch Status', 'Non-Compliant')
-            add_to_csv(row, 'Patch required action', 'Patches are required to be applied')
+            table.add(row, 'Patch Status', 'Non-Compliant')
+            table.add(row, 'Patch required action', 'Patches are required to be applied')
 
 
 # Function to check the AMI status of an instance
 def check_instance_ami(tocheckinstance, tocheckregion, row):
-    ec2 = boto3.client('ec2', region_name=tocheckregion)
+    ec2 = get_client('ec2', tocheckregion)
     instance_details = ec2.describe_instances(InstanceIds=[tocheckinstance])
     instance = instance_details['Reservations'][0]['Instances'][0]
     ami_id = instance['ImageId']
@@ -147,10 +115,10 @@ def check_instance_ami(tocheckinstance, tocheckregion, row):
     is_public = ami_details['Public']
     creation_date = ami_details['CreationDate']
 
-    add_to_csv(row, 'Current AMI-name', ami_name)
-    add_to_csv(row, 'Current AMI-ID', ami_id)
-    add_to_csv(row, 'AMI_Visibility', 'Public' if is_public else 'Private')
-    add_to_csv(row, 'AMI creation date', creation_date)
+    table.add(row, 'Current AMI-name', ami_name)
+    table.add(row, 'Current AMI-ID', ami_id)
+    table.add(row, 'AMI_Visibility', 'Public' if is_public else 'Private')
+    table.add(row, 'AMI creation date', creation_date)
 
     if not is_public:
         return
@@ -162,7 +130,7 @@ def check_instance_ami(tocheckinstance, tocheckregion, row):
     )['Images']
 
     if not latest_ami_info:
-        add_to_csv(row, 'AMI update suggestion', 'Error: Unable to get the latest AMI information.')
+        table.add(row, 'AMI update suggestion', 'Error: Unable to get the latest AMI information.')
         return
 
     latest_ami_info = sorted(latest_ami_info, key=lambda x: x['CreationDate'], reverse=True)[0]
@@ -170,16 +138,16 @@ def check_instance_ami(tocheckinstance, tocheckregion, row):
     latest_ami_id = latest_ami_info['ImageId']
     latest_ami_date = latest_ami_info['CreationDate']
 
-    add_to_csv(row, 'Latest AMI-ID', latest_ami_id)
-    add_to_csv(row, 'Latest AMI creation date', latest_ami_date)
+    table.add(row, 'Latest AMI-ID', latest_ami_id)
+    table.add(row, 'Latest AMI creation date', latest_ami_date)
 
     if creation_date == latest_ami_date:
-        add_to_csv(row, 'AMI update suggestion', 'Already at Latest')
-        add_to_csv(row, 'AMI age', 'No Difference')
+        table.add(row, 'AMI update suggestion', 'Already at Latest')
+        table.add(row, 'AMI age', 'No Difference')
     else:
         age_diff = agedifference(latest_ami_date, creation_date)
-        add_to_csv(row, 'AMI update suggestion', latest_ami_name)
-        add_to_csv(row, 'AMI age', age_diff)
+        table.add(row, 'AMI update suggestion', latest_ami_name)
+        table.add(row, 'AMI age', age_diff)
 
 
 # Main function
@@ -219,55 +187,39 @@ def main():
             print("[ Error ] Possibly you do not have access to {aws_account} as Admin. Admin access is needed to perform Patch checking.")
             sys.exit(1)
 
-    add_column('InstanceID', 1)
-    add_column('Instance Name', 2)
-    add_column('Instance State', 3)
-    add_column('Region', 4)
-    add_column('Patch Status', 5)
-    add_column('Patch required action', 6)
-    add_column('Tags missing', 7)
-    add_column('Current AMI-name', 8)
-    add_column('Current AMI-ID', 9)
-    add_column('AMI_Visibility', 10)
-    add_column('AMI update suggestion', 11)
-    add_column('Latest AMI-ID', 12)
-    add_column('Latest AMI creation date', 13)
-    add_column('AMI age', 14)
-    add_column('ASG Name', 15)
-    add_column('Notes', 16)
-
     row = 2
 
-    ec2_client = boto3.client('ec2')
     regions = ['us-east-1', 'us-west-2', 'us-west-1']
 
     for ec2region in regions:
-        response = ec2_client.describe_instances(Filters=[{'Name': 'instance-state-name', 'Values': ['running', 'stopped']}], RegionName=ec2region)
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                instance_id = instance['InstanceId']
-                instance_name = next(tag['Value'] for tag in instance['Tags'] if tag['Key'] == 'Name')
-                state = instance['State']['Name']
-
-                add_to_csv(row, 'InstanceID', instance_id)
-                add_to_csv(row, 'Instance Name', instance_name)
-                add_to_csv(row, 'Region', ec2region)
-
-                if state == 'running':
-                    add_to_csv(row, 'Instance State', 'Running')
-                    check_patch_status(instance_id, ec2region, row)
-                    tags_to_be_checked = [
-                        "ssm-managed-patch-install-reboot",
-                        "company:ssm:managed-qualys-install-linux",
-                        "company:ssm:managed-crowdstrike-install",
-                        "ssm-managed-scan"
-                    ]
-                    chk_all_tags(instance_id, ec2region, row, tags_to_be_checked)
-                    check_instance_ami(instance_id, ec2region, row)
-                    row += 1
-                elif state == 'stopped':
-                    add_to_csv(row, 'Instance State', 'Stopped')
-                    row += 1
+        ec2_client = get_client('ec2', ec2region)
+        for reservations in iter_reservation_pages(ec2_client, Filters=[{'Name': 'instance-state-name', 'Values': ['running', 'stopped']}]):
+            tag_map = get_tag_map(ec2_client, reservations)
+            for reservation in reservations:
+                for instance in reservation['Instances']:
+                    instance_id = instance['InstanceId']
+                    instance_name = next(tag['Value'] for tag in instance['Tags'] if tag['Key'] == 'Name')
+                    state = instance['State']['Name']
+
+                    table.add(row, 'InstanceID', instance_id)
+                    table.add(row, 'Instance Name', instance_name)
+                    table.add(row, 'Region', ec2region)
+
+                    if state == 'running':
+                        table.add(row, 'Instance State', 'Running')
+                        check_patch_status(instance_id, ec2region, row)
+                        tags_to_be_checked = [
+                            "ssm-managed-patch-install-reboot",
+                            "company:ssm:managed-qualys-install-linux",
+                            "company:ssm:managed-crowdstrike-install",
+                            "ssm-managed-scan"
+                        ]
+                        chk_all_tags(instance_id, tag_map, row, tags_to_be_checked)
+                        check_instance_ami(instance_id, ec2region, row)
+                        row += 1
+                    elif state == 'stopped':
+                        table.add(row, 'Instance State', 'Stopped')
+                        row += 1
 
     generate_csv(aws_account)
     print("Now Generating CSV .. ")
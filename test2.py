@@ -1,11 +1,18 @@
-import os
 import subprocess
-import json
 import datetime
-from collections import defaultdict
 import argparse
 import shutil
 import re
+from concurrent.futures import ProcessPoolExecutor
+import boto3
+from aws_batch import collect_image_ids, get_ami_map, get_asg_map, get_patch_state_map, get_tag_map, iter_reservation_pages
+from aws_clients import get_client, use_session
+from ami_cache import LatestAmiCache
+from report_table import REPORT_COLUMNS, ReportTable
+from scan_log import INSTANCE, LEVELS, SUMMARY, Progress, log, setup_logging, stop_logging
+
+# Latest Amazon AMI per (region, name pattern), shared by every instance of the run
+latest_ami_cache = LatestAmiCache()
 
 def check_commands(commands):
     """
@@ -13,7 +20,7 @@ def check_commands(commands):
     """
     for cmd in commands:
         if not shutil.which(cmd):
-            print(f"ERROR: {cmd} is required but it's not installed. Aborting.\n")
+            log.error(f"ERROR: {cmd} is required but it's not installed. Aborting.")
             exit(1)
 
 def agedifference(start, end):
@@ -25,61 +32,21 @@ def agedifference(start, end):
         end_date = datetime.datetime.strptime(end.split('.')[0], "%Y-%m-%dT%H:%M:%S")
         return (start_date - end_date).days
     except ValueError as e:
-        print(f"Date Error: {e}")
+        log.error(f"Date Error: {e}")
         return None
 
-def is_session_alive():
-    """
-    Check if the AWS session is still valid by verifying required environment variables and session information.
-    """
-    required_vars = ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"]
-    for var in required_vars:
-        if var not in os.environ:
-            return False
-
-    try:
-        session_info = subprocess.getoutput("alks session ls 2>/dev/null | grep -v '─' | tr -d '│' | egrep 'ACCOUNT|IAM' | sed -r 's/\\x1B\\[[0-9;]*[a-zA-Z]//g'")
-        if not session_info:
-            return False
-
-        session_lines = session_info.split('\n')
-        access_key = session_lines[0].split()[0].replace('*', '')
-        secret_key = session_lines[0].split()[1].replace('*', '').replace('…', '')
-
-        if os.environ["AWS_ACCESS_KEY_ID"].endswith(access_key) and os.environ["AWS_SECRET_ACCESS_KEY"].endswith(secret_key):
-            return True
-    except Exception as e:
-        print(f"Error checking session: {e}")
-        return False
-
-    return False
-
-def add_column(column_positions, csv_data, col_name, position=None):
-    """
-    Add or update column positions in the CSV data.
-    """
-    if position is None:
-        position = len(column_positions) + 1
-    for key in column_positions:
-        if column_positions[key] >= position:
-            column_positions[key] += 1
-    column_positions[col_name] = position
-    csv_data[f"1,{position}"] = col_name
-
-def addtocsv(csv_data, column_positions, row, col_name, data):
+def get_alks_credentials(account):
     """
-    Add data to the CSV, handling column headings if they are missing.
+    Open an ALKS Admin session for the account and return its exported AWS credentials as a dict.
+    The exports are parsed instead of applied, so each account's credentials stay inside the worker scanning it.
     """
-    if col_name not in column_positions:
-        add_column(column_positions, csv_data, col_name)
-    col = column_positions[col_name]
-    key = f"{row},{col}"
-    if key in csv_data:
-        csv_data[key] += f" {data}"
-    else:
-        csv_data[key] = data
+    session_output = subprocess.getoutput(f"alks sessions open -a \"{account}\" -r \"Admin\" 2>/dev/null")
+    credentials = dict(re.findall(r"export\s+(AWS_[A-Z_]+)=[\"']?([^\"'\s]+)", session_output))
+    if all(var in credentials for var in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"]):
+        return credentials
+    return None
 
-def generatecsv(csv_data, column_positions, aws_account):
+def generatecsv(table, aws_account):
     """
     Generate a CSV file from the collected data.
     """
@@ -87,176 +54,192 @@ def generatecsv(csv_data, column_positions, aws_account):
     filename = f"{aws_account}Report_{dt}.csv"
     try:
         with open(filename, "w") as file:
-            max_row = max(int(k.split(',')[0]) for k in csv_data.keys())
-            max_col = max(int(k.split(',')[1]) for k in csv_data.keys())
-            for i in range(1, max_row + 1):
-                line = ",".join(csv_data.get(f"{i},{j}", "") for j in range(1, max_col + 1))
-                file.write(line.rstrip(',') + "\n")
-        print(f"\t[ OK ]\n\n\t\tThe CSV file report is generated in  >>> {filename} <<<\n\n")
+            file.write(",".join(table.columns) + "\n")
+            for values in table.rows():
+                file.write(",".join(values).rstrip(',') + "\n")
+        log.log(SUMMARY, f"The CSV file report is generated in  >>> {filename} <<<")
+        return filename
     except Exception as e:
-        print(f"Error generating CSV: {e}")
+        log.error(f"Error generating CSV: {e}")
+        return None
 
-def chkalltags(instance_id, region, row, env, csv_data, column_positions, TagstobeCheckedProd, TagstobeCheckedNONProd):
+def merge_reports(reports):
+    """
+    Merge per-account CSV reports into one fleet-wide CSV with an Account column in front.
+    """
+    dt = datetime.datetime.now().strftime("%d%B%Y_%H%M%S")
+    filename = f"FleetReport_{dt}.csv"
+    with open(filename, "w") as merged:
+        header_written = False
+        for aws_account, report in reports:
+            with open(report) as file:
+                header = file.readline()
+                if not header_written:
+                    merged.write(f"Account,{header}")
+                    header_written = True
+                for line in file:
+                    merged.write(f"{aws_account},{line}")
+    log.log(SUMMARY, f"The fleet-wide CSV report is generated in  >>> {filename} <<<")
+    return filename
+
+def chkalltags(instance_tags, row, env, table, TagstobeCheckedProd, TagstobeCheckedNONProd):
     """
     Check all required tags for an instance and add missing tags to the CSV.
     """
+    if isinstance(instance_tags, Exception):
+        log.error(f"Error checking tags: {instance_tags}")
+        return
     tags_to_check = TagstobeCheckedProd if env == "prod" else TagstobeCheckedNONProd
     for tagcheck in tags_to_check:
-        try:
-            result = subprocess.getoutput(f"aws ec2 describe-tags --filters Name=resource-type,Values=instance Name=resource-id,Values={instance_id} --region {region} | jq -r \".Tags[] | select(.Key=='{tagcheck}') | .Value\"")
-            if not result:
-                print(f"\tError: Tag missing {tagcheck}")
-                addtocsv(csv_data, column_positions, row, 'Tags missing', f"Missing: {tagcheck}")
-        except Exception as e:
-            print(f"Error checking tag {tagcheck}: {e}")
+        if not instance_tags.get(tagcheck):
+            log.log(INSTANCE, f"Error: Tag missing {tagcheck}")
+            table.add(row, 'Tags missing', f"Missing: {tagcheck}")
 
-def checkspecialtag(instance_id, region, tagcheck):
+def checkspecialtag(instance_tags, tagcheck):
     """
     Check if a specific tag is present for an instance.
     """
-    try:
-        result = subprocess.getoutput(f"aws ec2 describe-tags --filters Name=resource-type,Values=instance Name=resource-id,Values={instance_id} --region {region} | jq -r \".Tags[] | select(.Key=='{tagcheck}') | .Value\"")
-        return bool(result)
-    except Exception as e:
-        print(f"Error checking special tag {tagcheck}: {e}")
+    if isinstance(instance_tags, Exception):
+        log.error(f"Error checking special tag {tagcheck}: {instance_tags}")
         return False
+    return bool(instance_tags.get(tagcheck))
 
-def checkPatchStatus(instance_id, region, row, csv_data, column_positions):
+def checkPatchStatus(instance_id, instance_tags, row, table, patch_states):
     """
     Check the patch status of an instance and update the CSV with the findings.
     """
-    print("Checking on Patches:")
+    log.log(INSTANCE, "Checking on Patches:")
     ok = 0
 
     try:
-        ssmdata = subprocess.getoutput(f"aws ssm describe-instance-patch-states --instance-ids {instance_id} --region {region}")
-        ssmdata_json = json.loads(ssmdata)
-        installed_pending_reboot = ssmdata_json["InstancePatchStates"][0]["InstalledPendingRebootCount"]
-        missing_count = ssmdata_json["InstancePatchStates"][0]["MissingCount"]
+        patch_state = patch_states[instance_id]
+        if isinstance(patch_state, Exception):
+            raise patch_state
+        installed_pending_reboot = patch_state["InstalledPendingRebootCount"]
+        missing_count = patch_state["MissingCount"]
 
         if installed_pending_reboot == 0:
             ok += 1
         else:
-            print("\tError: InstalledPendingRebootCount issue Non-Compliant: This instance needs to rebooted for the patches to be applied.")
-            if checkspecialtag(instance_id, region, "company-ssm-managed-patch-install-reboot"):
-                addtocsv(csv_data, column_positions, row, 'Tags missing', "company-ssm-managed-patch-install-reboot")
-                print("\tInfo: Tag company-ssm-managed-patch-install-reboot is true. Seems like PatchManager needs to recheck in next run. Ignore this instance for now.")
+            log.log(INSTANCE, "Error: InstalledPendingRebootCount issue Non-Compliant: This instance needs to rebooted for the patches to be applied.")
+            if checkspecialtag(instance_tags, "company-ssm-managed-patch-install-reboot"):
+                table.add(row, 'Tags missing', "company-ssm-managed-patch-install-reboot")
+                log.log(INSTANCE, "Info: Tag company-ssm-managed-patch-install-reboot is true. Seems like PatchManager needs to recheck in next run. Ignore this instance for now.")
             else:
-                addtocsv(csv_data, column_positions, row, 'Tags missing', "company-ssm-managed-patch-install-reboot.")
-                print("\tError: Required TAG missing: company-ssm-managed-patch-install-reboot.")
+                table.add(row, 'Tags missing', "company-ssm-managed-patch-install-reboot.")
+                log.log(INSTANCE, "Error: Required TAG missing: company-ssm-managed-patch-install-reboot.")
 
         if missing_count == 0:
             ok += 1
 
         if ok > 1:
-            addtocsv(csv_data, column_positions, row, 'Patch required action', "Patches are applied")
-            addtocsv(csv_data, column_positions, row, 'Patch Status', "Compliant")
-            print("\t All patches applied and instance is Compliant [ OK ]")
+            table.add(row, 'Patch required action', "Patches are applied")
+            table.add(row, 'Patch Status', "Compliant")
+            log.log(INSTANCE, "All patches applied and instance is Compliant [ OK ]")
         else:
-            print("\tError: MissingCount. Non-Compliant: Patches are not applied, This instance need urgent attention.")
-            addtocsv(csv_data, column_positions, row, 'Patch required action', "Patches are required to be applied")
-            addtocsv(csv_data, column_positions, row, 'Patch Status', "Non-Compliant")
+            log.log(INSTANCE, "Error: MissingCount. Non-Compliant: Patches are not applied, This instance need urgent attention.")
+            table.add(row, 'Patch required action', "Patches are required to be applied")
+            table.add(row, 'Patch Status', "Non-Compliant")
     except Exception as e:
-        print(f"Error checking patch status: {e}")
+        log.error(f"Error checking patch status: {e}")
 
-def check_instance_ami(instance_details, instance_id, region, row, csv_data, column_positions):
+def get_latest_ami_info(region, ami_name_pattern):
+    """
+    Return (ImageId, Name, CreationDate) of the newest Amazon AMI matching the name pattern, or None if there is none.
+    """
+    def fetch():
+        images = get_client("ec2", region).describe_images(Owners=["amazon"], Filters=[{"Name": "name", "Values": [ami_name_pattern]}])["Images"]
+        if not images:
+            return ()
+        latest = max(images, key=lambda image: image["CreationDate"])
+        return latest["ImageId"], latest["Name"], latest["CreationDate"]
+    return latest_ami_cache.get(region, ami_name_pattern, fetch) or None
+
+def check_instance_ami(instance, region, row, table, asg_map, ami_map):
     """
     Check the AMI details of an instance and suggest updates if needed.
     """
-    print(f"Current AMI ID of the instance: {instance_id}")
+    instance_id = instance["InstanceId"]
+    log.log(INSTANCE, f"Current AMI ID of the instance: {instance_id}")
+
+    asg_name = asg_map.get(instance_id, "Not in ASG")
+    if isinstance(asg_name, Exception):
+        log.error(f"Error checking ASG membership: {asg_name}")
+    else:
+        table.add(row, "ASG Name", asg_name)
 
     try:
-        ami_id = next((i["ImageId"] for r in instance_details["Reservations"] for i in r["Instances"] if i["InstanceId"] == instance_id), None)
-        ami_info = json.loads(subprocess.getoutput(f"aws ec2 describe-images --image-ids {ami_id} --region {region} --query 'Images[0]' --output json"))
+        ami_id = instance["ImageId"]
+        ami_info = ami_map[ami_id]
+        if isinstance(ami_info, Exception):
+            raise ami_info
         ami_name = ami_info["Name"]
         is_public = ami_info["Public"]
         creation_date = ami_info["CreationDate"]
 
-        addtocsv(csv_data, column_positions, row, "Current AMI-name", ami_name)
-        addtocsv(csv_data, column_positions, row, "Current AMI-ID", ami_id)
-        addtocsv(csv_data, column_positions, row, "AMI_Visibility", "Public" if is_public else "Private")
-
-        asg_info = json.loads(subprocess.getoutput(f"aws autoscaling describe-auto-scaling-instances --instance-ids {instance_id} --region {region} --query 'AutoScalingInstances[0]' --output json"))
-        asg_name = asg_info.get("AutoScalingGroupName", "Not in ASG")
-        addtocsv(csv_data, column_positions, row, "ASG Name", asg_name)
+        table.add(row, "Current AMI-name", ami_name)
+        table.add(row, "Current AMI-ID", ami_id)
+        table.add(row, "AMI_Visibility", "Public" if is_public else "Private")
 
         if not is_public:
-            print("\tThe AMI is private. No further checks.")
+            log.log(INSTANCE, "The AMI is private. No further checks.")
             return
 
         ami_name_pattern = re.sub(r'[0-9]{8}', '*', ami_name)
-        latest_ami_info = json.loads(subprocess.getoutput(f"aws ec2 describe-images --region {region} --owners amazon --filters 'Name=name,Values={ami_name_pattern}' --query 'Images | sort_by(@, &CreationDate) | [-1]' --output json"))
+        latest_ami_info = get_latest_ami_info(region, ami_name_pattern)
 
         if not latest_ami_info:
-            print("\tError: Unable to get the latest AMI information.")
-            addtocsv(csv_data, column_positions, row, "AMI update suggestion", "Error: Unable to get the latest AMI information.")
+            log.log(INSTANCE, "Error: Unable to get the latest AMI information.")
+            table.add(row, "AMI update suggestion", "Error: Unable to get the latest AMI information.")
             return
 
-        latest_ami_name = latest_ami_info["Name"]
-        latest_ami_id = latest_ami_info["ImageId"]
-        latest_ami_date = latest_ami_info["CreationDate"]
+        latest_ami_id, latest_ami_name, latest_ami_date = latest_ami_info
 
-        addtocsv(csv_data, column_positions, row, "Latest AMI-ID", latest_ami_id)
-        addtocsv(csv_data, column_positions, row, "Latest AMI creation date", latest_ami_date)
+        table.add(row, "Latest AMI-ID", latest_ami_id)
+        table.add(row, "Latest AMI creation date", latest_ami_date)
 
         if creation_date == latest_ami_date:
-            addtocsv(csv_data, column_positions, row, "AMI update suggestion", "Already at Latest")
-            addtocsv(csv_data, column_positions, row, "AMI age", "No Difference")
+            table.add(row, "AMI update suggestion", "Already at Latest")
+            table.add(row, "AMI age", "No Difference")
         else:
-            addtocsv(csv_data, column_positions, row, "AMI update suggestion", latest_ami_name)
+            table.add(row, "AMI update suggestion", latest_ami_name)
             age_diff = agedifference(latest_ami_date, creation_date)
-            addtocsv(csv_data, column_positions, row, "AMI age", f"{age_diff} days")
+            table.add(row, "AMI age", f"{age_diff} days")
     except Exception as e:
-        print(f"Error checking AMI details: {e}")
+        log.error(f"Error checking AMI details: {e}")
 
-def main():
-    parser = argparse.ArgumentParser(description="PatchManager Checks")
-    parser.add_argument("-e", "--environment", required=True, help="Specify the environment (prod or non-prod)")
-    parser.add_argument("-a", "--aws-account", required=True, help="Specify the AWS account ID example awsacs awsnamecompany")
-    args = parser.parse_args()
-
-    ENV = args.environment
-    AWS_ACCOUNT = args.aws_account
+def scan_account(aws_account, env, verbosity="summary", live_progress=True):
+    """
+    Scan one account with its own ALKS credentials and client pool and return its report filename, or None.
+    Per-instance records go to <aws_account>_scan.log when verbosity is instance or debug.
+    """
+    # Worker processes do not inherit the parent's log writer thread, so every scan sets up its own
+    setup_logging(verbosity, f"{aws_account}_scan.log" if verbosity != "summary" else None)
+    progress = Progress(label=aws_account, live=None if live_progress else False).start()
+    try:
+        return _scan_account(aws_account, env, progress)
+    finally:
+        progress.stop()
+        stop_logging()
+
+def _scan_account(aws_account, env, progress):
+    # Step 2: Get an ALKS session for this account only
+    account = subprocess.getoutput(f"alks developer accounts 2>/dev/null | grep {aws_account} | grep ALKSAdmin | awk '{{ printf(\"%s %s %s\",$2,$3,$4) }}'")
+    log.log(SUMMARY, f"Checking AWS session for {account} and Admin")
+
+    credentials = get_alks_credentials(account)
+    if not credentials:
+        log.error(f"Possibly you do not have access to {aws_account} as Admin. Admin access is needed to perform Patch checking.")
+        return None
+    use_session(boto3.Session(
+        aws_access_key_id=credentials["AWS_ACCESS_KEY_ID"],
+        aws_secret_access_key=credentials["AWS_SECRET_ACCESS_KEY"],
+        aws_session_token=credentials["AWS_SESSION_TOKEN"],
+    ))
+    log.log(SUMMARY, "[ OK ]")
 
-    if ENV == "non-prod" and not AWS_ACCOUNT.endswith("np"):
-        AWS_ACCOUNT += "np"
-
-    # Step 1: Check if essential commands are installed
-    check_commands(["aws", "jq", "alks", "sed", "awk", "grep"])
-    print("Checking if essential commands are installed:\t[ OK ]\n")
-
-    # Step 2: Check AWS session and get session if needed
-    account = subprocess.getoutput(f"alks developer accounts 2>/dev/null | grep {AWS_ACCOUNT} | grep ALKSAdmin | awk '{{ printf(\"%s %s %s\",$2,$3,$4) }}'")
-    print(f"Checking AWS session for {account} and Admin")
-
-    if not is_session_alive():
-        print("[ Error ] \nAWS session has expired. Now trying to get sessions.")
-        subprocess.run(f"eval $(alks sessions open -a \"{account}\" -r \"Admin\" 2>/dev/null)", shell=True)
-        if not is_session_alive():
-            print(f"[ Error ]\nPossibly you do not have access to {AWS_ACCOUNT} as Admin. Admin access is needed to perform Patch checking.")
-            exit(1)
-    print("[ OK ]\n")
-
-    # Step 3: Initialize column positions and CSV data
-    column_positions = {}
-    csv_data = defaultdict(str)
-
-    add_column(column_positions, csv_data, 'InstanceID', 1)
-    add_column(column_positions, csv_data, 'Instance Name', 2)
-    add_column(column_positions, csv_data, 'Instance State', 3)
-    add_column(column_positions, csv_data, 'Region', 4)
-    add_column(column_positions, csv_data, 'Patch Status', 5)
-    add_column(column_positions, csv_data, 'Patch required action', 6)
-    add_column(column_positions, csv_data, 'Tags missing', 7)
-    add_column(column_positions, csv_data, 'Current AMI-name', 8)
-    add_column(column_positions, csv_data, 'Current AMI-ID', 9)
-    add_column(column_positions, csv_data, 'AMI_Visibility', 10)
-    add_column(column_positions, csv_data, 'AMI update suggestion', 11)
-    add_column(column_positions, csv_data, 'Latest AMI-ID', 12)
-    add_column(column_positions, csv_data, 'Latest AMI creation date', 13)
-    add_column(column_positions, csv_data, 'AMI age', 14)
-    add_column(column_positions, csv_data, 'ASG Name', 15)
-    add_column(column_positions, csv_data, 'Notes', 16)
+    # Step 3: Initialize the report table
+    table = ReportTable(REPORT_COLUMNS)
 
     row = 2
 
@@ -264,40 +247,93 @@ def main():
     regions = ["us-east-1", "us-west-2", "us-west-1"]
     for region in regions:
         try:
-            instance_details = json.loads(subprocess.getoutput(f"aws ec2 describe-instances --region {region}"))
+            ec2 = get_client("ec2", region)
+            instance_details = {"Reservations": [r for reservations in iter_reservation_pages(ec2) for r in reservations]}
+            # A failed region-wide lookup maps every instance to the error, so each row still gets written
+            image_ids = collect_image_ids(instance_details["Reservations"])
+            try:
+                ami_map = get_ami_map(ec2, image_ids)
+            except Exception as e:
+                log.error(f"Error loading AMI details for {region}: {e}")
+                ami_map = dict.fromkeys(image_ids, e)
+            try:
+                asg_map = get_asg_map(get_client("autoscaling", region))
+            except Exception as e:
+                log.error(f"Error loading ASG membership for {region}: {e}")
+                asg_map = {i["InstanceId"]: e for r in instance_details["Reservations"] for i in r["Instances"]}
+            tag_map = get_tag_map(ec2, instance_details["Reservations"])
+            patch_states = get_patch_state_map(get_client("ssm", region), [i["InstanceId"] for r in instance_details["Reservations"] for i in r["Instances"] if i["State"]["Name"] == "running"])
+            progress.discovered(sum(len(r["Instances"]) for r in instance_details["Reservations"]))
             for reservation in instance_details["Reservations"]:
                 for instance in reservation["Instances"]:
+                    progress.done()
                     instance_id = instance["InstanceId"]
-                    instance_name = next((tag["Value"] for tag in instance["Tags"] if tag["Key"] == "Name"), "N/A")
+                    instance_name = next((tag["Value"] for tag in instance.get("Tags", []) if tag["Key"] == "Name"), "N/A")
                     state = instance["State"]["Name"]
-                    print(f"\n\nNow working: {instance_id} {region}")
-                    print(f"\tThis {instance_name} ({instance_id}) is in >> {state} Status <<:")
+                    log.log(INSTANCE, f"Now working: {instance_id} {region}")
+                    log.log(INSTANCE, f"This {instance_name} ({instance_id}) is in >> {state} Status <<:")
 
                     if state == "running":
-                        addtocsv(csv_data, column_positions, row, "InstanceID", instance_id)
-                        addtocsv(csv_data, column_positions, row, 'Instance Name', instance_name)
-                        addtocsv(csv_data, column_positions, row, 'Instance State', "Running")
-                        addtocsv(csv_data, column_positions, row, "Region", region)
-                        checkPatchStatus(instance_id, region, row, csv_data, column_positions)
-                        chkalltags(instance_id, region, row, ENV, csv_data, column_positions, 
+                        table.add(row, "InstanceID", instance_id)
+                        table.add(row, 'Instance Name', instance_name)
+                        table.add(row, 'Instance State', "Running")
+                        table.add(row, "Region", region)
+                        checkPatchStatus(instance_id, tag_map[instance_id], row, table, patch_states)
+                        chkalltags(tag_map[instance_id], row, env, table, 
                                    ["company-ssm-managed-patch-install-no-reboot"], 
                                    ["company-ssm-managed-patch-install-reboot", "company:ssm:managed-qualys-install-linux", "company:ssm:managed-crowdstrike-install", "company-ssm-managed-scan"])
-                        check_instance_ami(instance_details, instance_id, region, row, csv_data, column_positions)
+                        check_instance_ami(instance, region, row, table, asg_map, ami_map)
                         row += 1
                     elif state == "stopped":
-                        addtocsv(csv_data, column_positions, row, "InstanceID", instance_id)
-                        addtocsv(csv_data, column_positions, row, 'Instance Name', instance_name)
-                        addtocsv(csv_data, column_positions, row, "Instance State", "Stopped")
-                        addtocsv(csv_data, column_positions, row, "Region", region)
+                        table.add(row, "InstanceID", instance_id)
+                        table.add(row, 'Instance Name', instance_name)
+                        table.add(row, "Instance State", "Stopped")
+                        table.add(row, "Region", region)
                         row += 1
                     else:
-                        print(f"\tThis {instance_name} ({instance_id}) is in >> {state} Status << No Checks further and will NOT be on Report.\n")
+                        log.log(INSTANCE, f"This {instance_name} ({instance_id}) is in >> {state} Status << No Checks further and will NOT be on Report.")
         except Exception as e:
-            print(f"Error processing region {region}: {e}")
+            log.error(f"Error processing region {region}: {e}")
+    progress.discovery_finished()
 
     # Step 5: Generate CSV report
-    print("Now Generating CSV .. ")
-    generatecsv(csv_data, column_positions, AWS_ACCOUNT)
+    log.log(SUMMARY, "Now Generating CSV ..")
+    return generatecsv(table, aws_account)
+
+def main():
+    parser = argparse.ArgumentParser(description="PatchManager Checks")
+    parser.add_argument("-e", "--environment", required=True, help="Specify the environment (prod or non-prod)")
+    parser.add_argument("-a", "--aws-account", required=True, nargs="+", help="Specify one or more AWS account IDs example awsacs awsnamecompany")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of accounts scanned in parallel worker processes")
+    parser.add_argument("-v", "--verbosity", choices=list(LEVELS), default="summary", help="summary: terminal only; instance/debug: also write per-instance records to <account>_scan.log")
+    args = parser.parse_args()
+    setup_logging(args.verbosity)
+
+    ENV = args.environment
+    AWS_ACCOUNTS = [aws_account + "np" if ENV == "non-prod" and not aws_account.endswith("np") else aws_account for aws_account in args.aws_account]
+
+    # Step 1: Check if essential commands are installed
+    check_commands(["alks", "sed", "awk", "grep"])
+    log.log(SUMMARY, "Checking if essential commands are installed: [ OK ]")
+
+    if len(AWS_ACCOUNTS) == 1:
+        reports = [(AWS_ACCOUNTS[0], scan_account(AWS_ACCOUNTS[0], ENV, args.verbosity))]
+    else:
+        # One process per account keeps credentials, clients and connection pools isolated
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            # Progress goes out as periodic lines, since several accounts cannot share one live line
+            reports = list(zip(AWS_ACCOUNTS, executor.map(scan_account, AWS_ACCOUNTS, [ENV] * len(AWS_ACCOUNTS),
+                                                          [args.verbosity] * len(AWS_ACCOUNTS), [False] * len(AWS_ACCOUNTS))))
+
+    failed = [aws_account for aws_account, report in reports if not report]
+    reports = [(aws_account, report) for aws_account, report in reports if report]
+    if len(AWS_ACCOUNTS) > 1 and reports:
+        merge_reports(reports)
+    if failed:
+        log.error(f"No report for: {', '.join(failed)}")
+        stop_logging()
+        exit(1)
+    stop_logging()
 
 if __name__ == "__main__":
     main()
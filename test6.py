@@ -1,13 +1,14 @@
 #!/opt/homebrew/bin/python3
-import boto3
 from datetime import datetime
 import re
 import csv
+from aws_batch import collect_image_ids, get_ami_map, get_asg_map, iter_reservation_pages
+from aws_clients import get_client
 
 # Initialize clients
-ec2 = boto3.client('ec2')
-ssm = boto3.client('ssm')
-autoscaling = boto3.client('autoscaling')
+ec2 = get_client('ec2')
+ssm = get_client('ssm')
+autoscaling = get_client('autoscaling')
 
 def add_to_csv(column_name, value, row_number, data_store):
     if row_number not in data_store:
@@ -38,7 +39,7 @@ def agedifference(start_date, end_date):
     return (start_date - end_date).days
 
 def get_latest_ami(ami_name, region):
-    ec2_region = boto3.client('ec2', region_name=region)
+    ec2_region = get_client('ec2', region)
     ami_name_pattern = re.sub(r'[0-9]{8}', '*', ami_name)
     try:
         response = ec2_region.describe_images(
@@ -86,68 +87,66 @@ def check_tags(instance_id, region, row, required_tags, data_store):
         add_to_csv('Tags missing', f'Error: {str(e)}', row, data_store)
 
 def get_instance_details():
-    instances = ec2.describe_instances()
+    asg_map = get_asg_map(autoscaling)
     row = 2
     required_tags = {'company-ssm-managed-patch-install-reboot', 'company:ssm:managed-qualys-install-linux', 'company:ssm:managed-crowdstrike-install', 'company-ssm-managed-scan'}
-    for reservation in instances['Reservations']:
-        for instance in reservation['Instances']:
-            instance_id = instance['InstanceId']
-            instance_name = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), "N/A")
-            instance_state = instance['State']['Name']
-            region = instance['Placement']['AvailabilityZone'][:-1]
-            ami_id = instance['ImageId']
-
-            ami_response = ec2.describe_images(ImageIds=[ami_id])
-            if ami_response['Images']:
-                ami = ami_response['Images'][0]
-                ami_name = ami.get('Name', 'N/A')
-                ami_creation_date = ami['CreationDate']
-                ami_age = agedifference(datetime.now().strftime('%Y-%m-%dT%H:%M:%S'), ami_creation_date)
-                ami_visibility = "Public" if ami['Public'] else "Private"
-            else:
-                ami_name = "AMI not found"
-                ami_creation_date = "N/A"
-                ami_age = "N/A"
-                ami_visibility = "N/A"
-
-            asg_name = "N/A"
-            asg_response = autoscaling.describe_auto_scaling_instances(InstanceIds=[instance_id])
-            if asg_response['AutoScalingInstances']:
-                asg_name = asg_response['AutoScalingInstances'][0]['AutoScalingGroupName']
-
-            latest_ami_id, latest_ami_name = get_latest_ami(ami_name, region)
-
-            add_to_csv("Instance ID", instance_id , row, data_store)
-            add_to_csv("Instance Name", instance_name , row, data_store)
-            add_to_csv("State", instance_state , row, data_store)
-            add_to_csv("Region", region , row, data_store)
-            add_to_csv("Current AMI Name", ami_name , row, data_store)
-            add_to_csv("Current AMI ID",  ami_id , row, data_store)
-            add_to_csv("Latest AMI ID", latest_ami_id , row, data_store)
-            add_to_csv("Latest AMI Name", latest_ami_name , row, data_store)
-            add_to_csv("AMI Age in days", ami_age , row, data_store)
-            add_to_csv("AMI Visibility", ami_visibility, row, data_store)
-            add_to_csv("ASG Name",  asg_name , row, data_store)
-            add_to_csv("Timestamp", datetime.now().strftime('%Y-%m-%d %H:%M:%S'), row, data_store)
-
-            check_patch_status(instance_id, region, row, data_store)
-            check_tags(instance_id, region, row, required_tags, data_store)
-
-            print(f"Instance ID: {instance_id}")
-            print(f"Instance Name: {instance_name}")
-            print(f"State: {instance_state}")
-            print(f"Region: {region}")
-            print(f"Current AMI Name: {ami_name}")
-            print(f"Current AMI ID: {ami_id}")
-            print(f"Latest AMI ID: {latest_ami_id}")
-            print(f"Latest AMI Name: {latest_ami_name}")
-            print(f"AMI Age: {ami_age} days")
-            print(f"AMI Visibility: {ami_visibility}")
-            print(f"ASG Name: {asg_name}")
-            print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            print("------")
-
-            row += 1
+    for reservations in iter_reservation_pages(ec2):
+        ami_map = get_ami_map(ec2, collect_image_ids(reservations))
+        for reservation in reservations:
+            for instance in reservation['Instances']:
+                instance_id = instance['InstanceId']
+                instance_name = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), "N/A")
+                instance_state = instance['State']['Name']
+                region = instance['Placement']['AvailabilityZone'][:-1]
+                ami_id = instance['ImageId']
+
+                ami = ami_map.get(ami_id)
+                if ami:
+                    ami_name = ami.get('Name', 'N/A')
+                    ami_creation_date = ami['CreationDate']
+                    ami_age = agedifference(datetime.now().strftime('%Y-%m-%dT%H:%M:%S'), ami_creation_date)
+                    ami_visibility = "Public" if ami['Public'] else "Private"
+                else:
+                    ami_name = "AMI not found"
+                    ami_creation_date = "N/A"
+                    ami_age = "N/A"
+                    ami_visibility = "N/A"
+
+                asg_name = asg_map.get(instance_id, "N/A")
+
+                latest_ami_id, latest_ami_name = get_latest_ami(ami_name, region)
+
+                add_to_csv("Instance ID", instance_id , row, data_store)
+                add_to_csv("Instance Name", instance_name , row, data_store)
+                add_to_csv("State", instance_state , row, data_store)
+                add_to_csv("Region", region , row, data_store)
+                add_to_csv("Current AMI Name", ami_name , row, data_store)
+                add_to_csv("Current AMI ID",  ami_id , row, data_store)
+                add_to_csv("Latest AMI ID", latest_ami_id , row, data_store)
+                add_to_csv("Latest AMI Name", latest_ami_name , row, data_store)
+                add_to_csv("AMI Age in days", ami_age , row, data_store)
+                add_to_csv("AMI Visibility", ami_visibility, row, data_store)
+                add_to_csv("ASG Name",  asg_name , row, data_store)
+                add_to_csv("Timestamp", datetime.now().strftime('%Y-%m-%d %H:%M:%S'), row, data_store)
+
+                check_patch_status(instance_id, region, row, data_store)
+                check_tags(instance_id, region, row, required_tags, data_store)
+
+                print(f"Instance ID: {instance_id}")
+                print(f"Instance Name: {instance_name}")
+                print(f"State: {instance_state}")
+                print(f"Region: {region}")
+                print(f"Current AMI Name: {ami_name}")
+                print(f"Current AMI ID: {ami_id}")
+                print(f"Latest AMI ID: {latest_ami_id}")
+                print(f"Latest AMI Name: {latest_ami_name}")
+                print(f"AMI Age: {ami_age} days")
+                print(f"AMI Visibility: {ami_visibility}")
+                print(f"ASG Name: {asg_name}")
+                print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                print("------")
+
+                row += 1
 
 #### #### #### #### #### #### #### #### #### #### #### #### 
 #### #### #### #### #### #### #### #### #### #### #### #### 
@@ -162,7 +161,7 @@ row=0
 get_instance_details()
 
 # Generate CSV with dynamic filename
-account_id = boto3.client('sts').get_caller_identity().get('Account')
+account_id = get_client('sts').get_caller_identity().get('Account')
 timestamp = datetime.now().strftime('%d%B%Y_%H%M%S')
 filename = f"{account_id}_Report_{timestamp}.csv"
 generateCSV(filename, data_store)
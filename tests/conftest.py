@@ -0,0 +1,91 @@
+"""
+Shared fixtures: the scanner modules are flat scripts in the repository root, and every scan runs against FakeAWS.
+"""
+import os
+import runpy
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The scanner imports boto3 and botocore at module level
+pytest.importorskip("botocore")
+
+import new1  # noqa: E402
+from ami_cache import LatestAmiCache  # noqa: E402
+from aws_clients import set_client_factory  # noqa: E402
+from fake_aws import FakeAWS, FakeClient, FakeFleet  # noqa: E402
+from report_writer import StreamingReportWriter  # noqa: E402
+
+FLEET_SIZE = 600
+PAGE_SIZE = 100
+
+@pytest.fixture
+def fleet():
+    return FakeFleet(FLEET_SIZE)
+
+@pytest.fixture
+def fake_aws(fleet):
+    """
+    Point every scanner client at a FakeAWS backend for the length of the test.
+    """
+    backend = FakeAWS(fleet)
+    set_client_factory(backend.client)
+    yield backend
+    set_client_factory(None)
+
+@pytest.fixture
+def scanner(monkeypatch):
+    """
+    new1 with its module state reset for the test: a fresh in-memory AMI cache and no shard, snapshot or checkpoint.
+    """
+    monkeypatch.setattr(new1, 'latest_ami_cache', LatestAmiCache())
+    for name in ('scan_snapshot', 'profiler', 'progress', 'instance_shard', 'scan_checkpoint'):
+        monkeypatch.setattr(new1, name, None)
+    yield new1
+    set_client_factory(None)
+
+@pytest.fixture
+def scan(fake_aws, scanner):
+    """
+    Scan the fake fleet in-process into a CSV report at the given path and return the path.
+    """
+    def run(path, regions=new1.REGIONS):
+        report = StreamingReportWriter(str(path))
+        try:
+            scanner.get_instance_details(report, regions)
+        finally:
+            report.close()
+        return str(path)
+
+    return run
+
+@pytest.fixture
+def run_new1(fake_aws, monkeypatch):
+    """
+    Run new1.py as a script with the given arguments in the current directory. Discovery pages hold PAGE_SIZE
+    instances, and with `fail_after` every describe_instances call after that many raises ExpiredToken, as when
+    the credentials of a long scan run out.
+    """
+    from botocore.exceptions import ClientError
+
+    describe_instances = FakeClient.describe_instances
+
+    def run(*args, fail_after=None):
+        calls = [0]
+
+        def limited(self, **kwargs):
+            calls[0] += 1
+            if fail_after is not None and calls[0] > fail_after:
+                raise ClientError({'Error': {'Code': 'ExpiredToken', 'Message': 'The security token included in the request is expired'}},
+                                  'DescribeInstances')
+            kwargs['MaxResults'] = PAGE_SIZE
+            return describe_instances(self, **kwargs)
+
+        monkeypatch.setattr(FakeClient, 'describe_instances', limited)
+        monkeypatch.setattr(sys, 'argv', ['new1.py', *args])
+        runpy.run_path(os.path.join(ROOT, 'new1.py'), run_name='__main__')
+
+    return run
@@ -0,0 +1,55 @@
+import csv
+import importlib
+
+import pytest
+from botocore.exceptions import ClientError
+
+from ami_cache import LatestAmiCache
+from fake_aws import FakeClient
+from scan_log import Progress
+
+CREDENTIALS = dict.fromkeys(['AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'], 'fake')
+
+@pytest.fixture(params=['test2', 'test3'])
+def account_scan(request, fake_aws, monkeypatch, tmp_path):
+    """
+    test2/test3 _scan_account against the fake backend, with the ALKS session stubbed out. Returns the report rows.
+    """
+    module = importlib.import_module(request.param)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(module, 'latest_ami_cache', LatestAmiCache())
+    monkeypatch.setattr(module.subprocess, 'getoutput', lambda command: '')
+    monkeypatch.setattr(module, 'get_alks_credentials', lambda account: CREDENTIALS)
+    monkeypatch.setattr(module.boto3, 'Session', lambda **credentials: None)
+    monkeypatch.setattr(module, 'use_session', lambda session: None)
+
+    def run():
+        path = module._scan_account('123456789012', 'prod', Progress(live=False))
+        with open(path, newline='') as file:
+            header, *rows = csv.reader(file)
+        return [dict(zip(header, row)) for row in rows]
+
+    return run
+
+def reported(fleet):
+    return sorted(instance['InstanceId'] for region in fleet.regions for instance in fleet.instances[region]
+                  if instance['State']['Name'] in ('running', 'stopped'))
+
+def test_every_running_and_stopped_instance_is_reported(account_scan, fleet):
+    rows = account_scan()
+    assert sorted(row['InstanceID'] for row in rows) == reported(fleet)
+    running = [row for row in rows if row['Instance State'] == 'Running']
+    assert all(row.get('ASG Name') for row in running)
+    assert any(row.get('Current AMI-ID') for row in running)
+
+def test_failed_ami_and_asg_lookups_only_blank_their_cells(account_scan, fleet, monkeypatch):
+    def denied(self, **kwargs):
+        raise ClientError({'Error': {'Code': 'UnauthorizedOperation', 'Message': 'denied'}}, 'Describe')
+
+    monkeypatch.setattr(FakeClient, 'describe_images', denied)
+    monkeypatch.setattr(FakeClient, 'describe_auto_scaling_instances', denied)
+    rows = account_scan()
+
+    assert sorted(row['InstanceID'] for row in rows) == reported(fleet)
+    assert not any(row.get('Current AMI-ID') or row.get('ASG Name') for row in rows)
+    assert any(row.get('Patch Status') for row in rows)
@@ -0,0 +1,45 @@
+import fnmatch
+
+import pytest
+
+from ami_catalog import AmiCatalog
+
+IMAGES = [
+    {'ImageId': 'ami-1', 'Name': 'amzn2-ami-hvm-2.0.20240101.0-x86_64-gp2', 'CreationDate': '2024-01-02T00:00:00.000Z'},
+    {'ImageId': 'ami-2', 'Name': 'amzn2-ami-hvm-2.0.20240301.0-x86_64-gp2', 'CreationDate': '2024-03-02T00:00:00.000Z'},
+    {'ImageId': 'ami-3', 'Name': 'amzn2-ami-hvm-2.0.20240201.0-arm64-gp2', 'CreationDate': '2024-04-01T00:00:00.000Z'},
+    {'ImageId': 'ami-4', 'Name': 'amzn2-ami-hvmX2.0.20240401.0-x86_64-gp2', 'CreationDate': '2024-05-01T00:00:00.000Z'},
+    {'ImageId': 'ami-5', 'Name': 'Windows_Server-2019-English-Full-Base-2024.02.14', 'CreationDate': '2024-02-14T00:00:00.000Z'},
+    {'ImageId': 'ami-6', 'Name': None, 'CreationDate': '2024-06-01T00:00:00.000Z'},
+]
+
+@pytest.fixture
+def catalog():
+    return AmiCatalog(IMAGES)
+
+def test_newest_match_of_a_pattern(catalog):
+    assert len(catalog) == 5
+    assert catalog.latest('amzn2-ami-hvm-2.0.*-x86_64-gp2') == ('ami-2', 'amzn2-ami-hvm-2.0.20240301.0-x86_64-gp2')
+    assert catalog.latest('amzn2-ami-hvm-2.0.*') == ('ami-3', 'amzn2-ami-hvm-2.0.20240201.0-arm64-gp2')
+    assert catalog.latest('Windows_Server-2019-English-Full-Base-*') == ('ami-5', 'Windows_Server-2019-English-Full-Base-2024.02.14')
+    assert catalog.latest('ubuntu/*') is None
+
+def test_only_star_and_question_mark_are_wildcards(catalog):
+    # '-' and '.' are literal, so the hvmX image does not match, while '?' matches exactly one character
+    assert catalog.latest('amzn2-ami-hvm-2.0.2024?301.0-x86_64-gp2')[0] == 'ami-2'
+    assert catalog.latest('amzn2-ami-hvm?2.0.20240401.0-x86_64-gp2')[0] == 'ami-4'
+    assert catalog.latest('amzn2-ami-hvm-2.0.20240401.0-x86_64-gp2') is None
+    assert catalog.latest('amzn2-ami-hvm-2.0.2024[03]*') is None
+
+@pytest.mark.parametrize('pattern', ['*', '*-gp2', 'amzn2-ami-hvm*', '*2024.02*', 'amzn2-ami-hvm-2.0.202403?1.0-*'])
+def test_matches_agree_with_fnmatch(catalog, pattern):
+    matches = [image for image in IMAGES if image['Name'] and fnmatch.fnmatchcase(image['Name'], pattern)]
+    newest = max(matches, key=lambda image: image['CreationDate'], default=None)
+    assert catalog.latest(pattern) == ((newest['ImageId'], newest['Name']) if newest else None)
+
+def test_catalog_of_the_fake_fleet(fake_aws, fleet):
+    catalog = AmiCatalog.fetch('us-west-2')
+    assert len(catalog) == len(fleet.amazon_images['us-west-2'])
+    ubuntu = [image for image in fleet.amazon_images['us-west-2'] if image['Name'].startswith('ubuntu/')]
+    newest = max(ubuntu, key=lambda image: image['CreationDate'])
+    assert catalog.latest('ubuntu/images/hvm-ssd/ubuntu-focal-20.04-amd64-server-*') == (newest['ImageId'], newest['Name'])
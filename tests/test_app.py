@@ -0,0 +1,84 @@
+import csv
+import os
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_sqlalchemy")
+pytest.importorskip("flask_login")
+
+import app as booking_app  # noqa: E402
+from report_index import ReportStore  # noqa: E402
+
+REPORT_NAME = '123456789012_Report_18October2026_020000.csv'
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    patterns = [str(tmp_path / '*_Report_*.csv'), str(tmp_path / 'FleetReport_*.csv')]
+    monkeypatch.setattr(booking_app, 'reports', ReportStore(patterns, check_interval=0))
+    return booking_app.app.test_client()
+
+@pytest.fixture
+def report(scan, tmp_path):
+    return scan(tmp_path / REPORT_NAME)
+
+def test_no_report_yet(client):
+    assert client.get('/api/reports/latest').status_code == 404
+
+def test_summary_counts_the_report(client, report):
+    with open(report, newline='') as file:
+        rows = list(csv.DictReader(file))
+    response = client.get('/api/reports/latest')
+
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert summary['report'] == REPORT_NAME
+    assert summary['rows'] == len(rows)
+    regions = summary['counts']['region']
+    assert regions == {region: sum(row['Region'] == region for row in rows) for region in regions}
+    assert sum(summary['counts']['patch_status'].values()) == len(rows)
+
+def test_etag_answers_304_until_the_report_changes(client, report, tmp_path):
+    first = client.get('/api/reports/latest')
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/api/reports/latest', headers={'If-None-Match': etag}).status_code == 304
+
+    # A newer report gets a new ETag
+    newer = tmp_path / 'FleetReport_18October2026_030000.csv'
+    with open(report) as source, open(newer, 'w') as target:
+        target.writelines(list(source)[:11])
+    later = time.time() + 10
+    os.utime(newer, (later, later))
+    response = client.get('/api/reports/latest', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['rows'] == 10
+
+def test_rows_are_filtered_and_paged(client, report):
+    summary = client.get('/api/reports/latest').get_json()
+    region, count = sorted(summary['counts']['region'].items())[0]
+
+    response = client.get(f'/api/reports/latest/rows?region={region}&per_page=7&page=2')
+    page = response.get_json()
+    assert page['total'] == count
+    assert page['pages'] == (count + 6) // 7
+    assert len(page['rows']) == 7
+    assert {row['Region'] for row in page['rows']} == {region}
+
+    etag = response.headers['ETag']
+    assert client.get(f'/api/reports/latest/rows?per_page=7&region={region}&page=2', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(f'/api/reports/latest/rows?region={region}&per_page=7&page=3', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/api/reports/latest/rows?per_page=0').status_code == 400
+
+def test_short_rows_and_other_reports_do_not_break_the_summary(client, tmp_path):
+    with open(tmp_path / REPORT_NAME, 'w', newline='') as file:
+        file.write('Instance ID,Region,Patch Status\ni-1,us-east-1\ni-2,us-east-1,Compliant,extra\n')
+    # A test2/test3 report is newer but not served
+    with open(tmp_path / '123456789012Report_18October2026_030000.csv', 'w', newline='') as file:
+        file.write('InstanceID,Region\ni-3\n')
+
+    summary = client.get('/api/reports/latest').get_json()
+    assert summary['report'] == REPORT_NAME
+    assert summary['counts']['patch_status'] == {'': 1, 'Compliant': 1}
@@ -0,0 +1,59 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from aws_batch import collect_image_ids, get_ami_map
+
+def client_error(code, message):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, 'DescribeImages')
+
+class ImagesClient:
+    """
+    describe_images over a fixed set of known IDs, failing the whole call on any other one like EC2 does.
+    """
+
+    def __init__(self, known, name_missing=True, error=None):
+        self.known = set(known)
+        self.name_missing = name_missing
+        self.error = error
+        self.calls = 0
+
+    def describe_images(self, ImageIds):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        missing = [ami_id for ami_id in ImageIds if ami_id not in self.known]
+        if missing:
+            raise client_error('InvalidAMIID.NotFound', f"The image id '[{missing[0]}]' does not exist" if self.name_missing else 'Invalid id')
+        return {'Images': [{'ImageId': ami_id} for ami_id in ImageIds]}
+
+KNOWN = [f"ami-{n:017x}" for n in range(40)]
+UNKNOWN = [f"ami-dead{n:013x}" for n in range(3)]
+
+def test_ami_map_of_the_fake_fleet(fake_aws, fleet):
+    reservations = [{'Instances': [instance]} for instance in fleet.instances['us-east-1']]
+    image_ids = collect_image_ids(reservations)
+    ami_map = get_ami_map(fake_aws.client('ec2', 'us-east-1'), image_ids)
+
+    images = {image['ImageId'] for image in fleet.amazon_images['us-east-1'] + fleet.private_images['us-east-1']}
+    assert set(ami_map) == set(image_ids) & images
+    # Deregistered AMIs are in use but left out of the map
+    assert set(image_ids) - images
+
+def test_named_invalid_ids_are_dropped_and_the_batch_retried():
+    client = ImagesClient(KNOWN)
+    ami_map = get_ami_map(client, KNOWN + UNKNOWN, batch_size=100)
+    assert set(ami_map) == set(KNOWN)
+    assert client.calls == len(UNKNOWN) + 1
+
+def test_batches_are_split_when_the_error_names_no_id():
+    client = ImagesClient(KNOWN, name_missing=False)
+    ami_map = get_ami_map(client, KNOWN[:20] + UNKNOWN[:1] + KNOWN[20:], batch_size=100)
+    assert set(ami_map) == set(KNOWN)
+    assert client.calls < len(KNOWN)
+
+@pytest.mark.parametrize('code', ['RequestLimitExceeded', 'UnauthorizedOperation'])
+def test_other_errors_are_raised(code):
+    client = ImagesClient(KNOWN, error=client_error(code, 'no'))
+    with pytest.raises(ClientError):
+        get_ami_map(client, KNOWN)
+    assert client.calls == 1
@@ -0,0 +1,41 @@
+import pytest
+from botocore.exceptions import ClientError
+
+import aws_clients
+import benchmark
+from fake_aws import FAKE_REGIONS, FakeFleet
+
+def test_describe_instances_pages_and_filters(fake_aws, fleet):
+    client = fake_aws.client('ec2', 'us-east-1')
+    instances = fleet.instances['us-east-1']
+
+    first = client.describe_instances(MaxResults=150)
+    second = client.describe_instances(MaxResults=150, NextToken=first['NextToken'])
+    assert 'NextToken' not in second
+    pages = first['Reservations'] + second['Reservations']
+    assert [reservation['Instances'][0] for reservation in pages] == instances
+
+    wanted = [instance['InstanceId'] for instance in instances[:3]]
+    response = client.describe_instances(Filters=[{'Name': 'instance-id', 'Values': wanted}])
+    assert [reservation['Instances'][0]['InstanceId'] for reservation in response['Reservations']] == wanted
+    assert fake_aws.calls_by_operation()['describe_instances'] == 3
+
+def test_describe_images_names_the_missing_image(fake_aws, fleet):
+    client = fake_aws.client('ec2', 'us-west-1')
+    known = fleet.amazon_images['us-west-1'][0]['ImageId']
+    with pytest.raises(ClientError) as error:
+        client.describe_images(ImageIds=[known, 'ami-0000000000000dead'])
+    assert error.value.response['Error']['Code'] == 'InvalidAMIID.NotFound'
+    assert 'ami-0000000000000dead' in error.value.response['Error']['Message']
+
+def test_fleet_is_deterministic():
+    assert FakeFleet(50, seed=3).instances == FakeFleet(50, seed=3).instances
+    assert FakeFleet(50, seed=3).instances != FakeFleet(50, seed=4).instances
+
+def test_benchmark_scans_every_instance_despite_throttling(scanner, monkeypatch):
+    monkeypatch.setattr(aws_clients, 'scheduler', aws_clients.scheduler)
+    result = benchmark.run_benchmark(300, throttle_rate=0.02)
+
+    assert result['rows'] == 300
+    assert result['throttled'] == result['retries'] > 0
+    assert result['calls']['describe_instances'] >= len(FAKE_REGIONS)
@@ -0,0 +1,69 @@
+import csv
+
+import pytest
+
+import fleet_daemon
+from fleet_daemon import FAILED_RETRY_DELAY, FAILED_RETRY_LIMIT, FleetDaemon, FleetState
+
+@pytest.fixture
+def daemon(fake_aws, scanner):
+    # Some latency, so worker batches finish out of order
+    fake_aws.latency = 0.002
+    return FleetDaemon(workers=8, batch_size=5)
+
+def instance_ids(rows):
+    return [row['Instance ID'] for row in rows]
+
+def test_report_order_matches_new1_and_survives_refreshes(daemon, scan, tmp_path):
+    # Sweep first: a warm latest-AMI cache would let the batches finish in order
+    daemon.sweep()
+    with open(scan(tmp_path / 'new1.csv'), newline='') as file:
+        expected = instance_ids(csv.DictReader(file))
+    assert instance_ids(daemon.state.rows()) == expected
+
+    # A refresh numbers only the refreshed instances, which must not move them
+    by_region = {}
+    for row in daemon.state.rows()[::-37]:
+        by_region.setdefault(row['Region'], []).append(row['Instance ID'])
+    daemon.refresh(by_region)
+    assert instance_ids(daemon.state.rows()) == expected
+
+    path = tmp_path / 'daemon.csv'
+    assert daemon.state.write_csv(str(path)) == len(expected)
+    with open(path, newline='') as file:
+        assert instance_ids(csv.DictReader(file)) == expected
+
+def test_rows_first_seen_by_a_refresh_go_last():
+    state = FleetState(['us-east-1'])
+    state.write_row((0, 1), {'Region': 'us-east-1', 'Instance ID': 'i-b'})
+    state.write_row((0, 0), {'Region': 'us-east-1', 'Instance ID': 'i-c'})
+    state.refresh_writer().write_row((0, 0), {'Region': 'us-east-1', 'Instance ID': 'i-a'})
+    state.refresh_writer().write_row((0, 0), {'Region': 'us-east-1', 'Instance ID': 'i-b'})
+    assert instance_ids(state.rows()) == ['i-c', 'i-b', 'i-a']
+
+def test_failed_rows_back_off_and_are_parked(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(fleet_daemon.time, 'monotonic', lambda: clock[0])
+    state = FleetState(['us-east-1'])
+    failed = {'Region': 'us-east-1', 'Instance ID': 'i-1', 'Patch Status': 'Error: throttled'}
+    max_age = 3600
+
+    for failures in range(1, FAILED_RETRY_LIMIT):
+        state.write_row((0, 0), failed)
+        delay = FAILED_RETRY_DELAY * 2 ** (failures - 1)
+        clock[0] += delay - 1
+        assert state.stale(max_age, 10) == {}
+        clock[0] += 1
+        assert state.stale(max_age, 10) == {'us-east-1': ['i-1']}
+
+    # Parked: only refreshed once it is stale
+    state.write_row((0, 0), failed)
+    clock[0] += max_age - 1
+    assert state.stale(max_age, 10) == {}
+    clock[0] += 1
+    assert state.stale(max_age, 10) == {'us-east-1': ['i-1']}
+
+    # A successful lookup resets the count
+    state.write_row((0, 0), {'Region': 'us-east-1', 'Instance ID': 'i-1', 'Patch Status': 'Compliant'})
+    clock[0] += FAILED_RETRY_DELAY
+    assert state.stale(max_age, 10) == {}
@@ -0,0 +1,55 @@
+import csv
+import io
+
+from report_diff import diff_reports, missing_tags, write_diff
+
+def rewrite(path, target, change):
+    # Copy a report, passing every row through change(row), which returns the row or None to drop it
+    with open(path, newline='') as file:
+        reader = csv.DictReader(file)
+        columns = reader.fieldnames
+        rows = [changed for changed in map(change, reader) if changed is not None]
+    with open(target, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(target)
+
+def test_diff_of_two_scans_reports_every_kind_of_change(scan, tmp_path):
+    old = scan(tmp_path / 'old.csv')
+    with open(old, newline='') as file:
+        ids = [row['Instance ID'] for row in csv.DictReader(file)]
+    removed, patched, reimaged, untagged = ids[:4]
+
+    def change(row):
+        instance_id = row['Instance ID']
+        if instance_id == removed:
+            return None
+        if instance_id == patched:
+            row['Patch Status'] = 'Non-Compliant' if row['Patch Status'] == 'Compliant' else 'Compliant'
+        if instance_id == reimaged:
+            row['Current AMI ID'] = 'ami-0123456789abcdef0'
+        if instance_id == untagged:
+            row['Mandatory Tags Missing'] = ', '.join(filter(None, [row['Mandatory Tags Missing'], 'company-ssm-managed-scan-extra']))
+        return row
+
+    new = rewrite(old, tmp_path / 'new.csv', change)
+    with open(new, 'a', newline='') as file:
+        csv.writer(file).writerow(['i-new', '', '', 'us-east-1'])
+
+    changes = {(change, instance_id) for change, instance_id, *_ in diff_reports(old, new)}
+    assert changes == {
+        ('removed', removed), ('patch_status', patched), ('ami', reimaged),
+        ('tag_regression', untagged), ('new', 'i-new'),
+    }
+
+    output = io.StringIO()
+    counts = write_diff(new, old, output)
+    assert counts == {'new': 1, 'removed': 1, 'patch_status': 1, 'ami': 1}
+    assert output.getvalue().splitlines()[0] == 'Change,Instance ID,Region,Old,New'
+
+def test_missing_tags_reads_both_report_formats():
+    assert missing_tags('a, b.') == {'a', 'b'}
+    assert missing_tags('Missing: a Missing: b') == {'a', 'b'}
+    assert missing_tags('') == set()
+    assert missing_tags('Error: AccessDenied') is None
@@ -0,0 +1,60 @@
+import csv
+import os
+import runpy
+
+import pytest
+
+import aws_clients
+from conftest import PAGE_SIZE, ROOT
+from fake_aws import FakeClient
+from throttle import RequestScheduler
+
+@pytest.fixture
+def run_script(fake_aws, monkeypatch, tmp_path):
+    """
+    Run one of the single-account report scripts against the fake backend, with small discovery pages and a fresh
+    scheduler. Returns the report rows.
+    """
+    describe_instances = FakeClient.describe_instances
+
+    def paged(self, **kwargs):
+        kwargs['MaxResults'] = PAGE_SIZE
+        return describe_instances(self, **kwargs)
+
+    monkeypatch.setattr(FakeClient, 'describe_instances', paged)
+    monkeypatch.setattr(aws_clients, 'scheduler', RequestScheduler())
+    monkeypatch.chdir(tmp_path)
+
+    def run(script):
+        runpy.run_path(os.path.join(ROOT, script), run_name='__main__')
+        (report,) = tmp_path.glob('*.csv')
+        with open(report, newline='') as file:
+            return list(csv.DictReader(file))
+
+    return run
+
+ALL_STATES = ('running', 'stopped', 'terminated')
+
+@pytest.mark.parametrize('script, regions, states', [
+    ('test5.py', ['us-east-1'], ALL_STATES),
+    ('test6.py', ['us-east-1'], ALL_STATES),
+    ('test7.py', ['us-east-1'], ALL_STATES),
+    ('test8.py', ['us-east-1'], ALL_STATES),
+    ('test9.py', ['us-east-1', 'us-west-2'], ALL_STATES),
+    ('test10', ['us-east-1', 'us-west-2'], ('running',)),
+])
+def test_every_page_is_reported_through_the_scheduler(run_script, fake_aws, fleet, script, regions, states):
+    rows = run_script(script)
+
+    expected = [instance['InstanceId'] for region in regions for instance in fleet.instances[region]
+                if instance['State']['Name'] in states]
+    # test10 leaves terminated instances out and blanks stopped ones
+    assert sorted(row['Instance ID'] for row in rows if row['Instance ID'] != 'instance stopped') == sorted(expected)
+    # Each region's instances span several discovery pages
+    assert fake_aws.calls_by_operation()['describe_instances'] > len(regions)
+
+    # and every call the backend saw went through the shared scheduler
+    scheduled = {}
+    for (operation, region), count in aws_clients.scheduler.calls.items():
+        scheduled[operation] = scheduled.get(operation, 0) + count
+    assert scheduled == dict(fake_aws.calls_by_operation())
@@ -0,0 +1,33 @@
+from report_table import FIRST_ROW, REPORT_COLUMNS, ReportTable
+
+def test_rows_come_out_in_display_order_with_gaps_filled():
+    table = ReportTable(['InstanceID', 'Region'])
+    table.add(FIRST_ROW, 'InstanceID', 'i-1')
+    table.add(FIRST_ROW + 2, 'Region', 'us-west-2')
+    table.add(FIRST_ROW + 1, 'InstanceID', 'i-2')
+
+    assert list(table.rows()) == [('i-1', ''), ('i-2', ''), ('', 'us-west-2')]
+    assert table.row_count == 3
+
+def test_inserted_column_moves_only_the_display_order():
+    table = ReportTable(['InstanceID', 'Region'])
+    table.add(FIRST_ROW, 'InstanceID', 'i-1')
+    table.add(FIRST_ROW, 'Region', 'us-east-1')
+    table.add_column('Account', 1)
+    table.add(FIRST_ROW, 'Account', '123')
+    table.add_column('Region', 1)
+
+    assert table.columns == ['Account', 'InstanceID', 'Region']
+    assert list(table.rows()) == [('123', 'i-1', 'us-east-1')]
+
+def test_cells_append_and_unknown_columns_are_added():
+    table = ReportTable(REPORT_COLUMNS)
+    table.add(FIRST_ROW, 'Tags missing', 'Missing: a')
+    table.add(FIRST_ROW, 'Tags missing', 'Missing: b')
+    table.add(FIRST_ROW, 'Extra', 'x')
+
+    assert table.get(FIRST_ROW, 'Tags missing') == 'Missing: a Missing: b'
+    assert table.get(FIRST_ROW + 5, 'Tags missing') == ''
+    assert table.get(FIRST_ROW, 'Nope', None) is None
+    assert table.columns[-1] == 'Extra'
+    assert len(next(iter(table.rows()))) == len(REPORT_COLUMNS) + 1
@@ -0,0 +1,86 @@
+import csv
+import json
+import os
+import random
+import sqlite3
+
+from report_writer import JsonLinesReportWriter, MultiReportWriter, SortedReportWriter, StreamingReportWriter, open_report
+
+COLUMNS = ['Instance ID', 'Region']
+
+def row(part_index, sequence):
+    return {'Instance ID': f"i-{part_index}-{sequence:04d}", 'Region': f"region-{part_index}"}
+
+def read_ids(path):
+    with open(path, newline='') as file:
+        return [row['Instance ID'] for row in csv.DictReader(file)]
+
+def test_streaming_writer_puts_out_of_order_rows_in_key_order(tmp_path):
+    keys = [(part_index, sequence) for part_index in range(3) for sequence in range(50)]
+    shuffled = keys[:]
+    random.Random(1).shuffle(shuffled)
+    path = str(tmp_path / 'report.csv')
+    writer = StreamingReportWriter(path, COLUMNS)
+    for key in shuffled:
+        writer.write_row(key, row(*key))
+    writer.close()
+
+    assert read_ids(path) == [row(*key)['Instance ID'] for key in keys]
+    assert writer.rows_written == len(keys)
+    assert os.listdir(tmp_path) == ['report.csv']
+
+def test_streaming_writer_streams_contiguous_rows_and_holds_the_rest(tmp_path):
+    writer = StreamingReportWriter(str(tmp_path / 'report.csv'), COLUMNS)
+    for sequence in (0, 1, 3, 4):
+        writer.write_row((0, sequence), row(0, sequence))
+    # Sequence 2 never arrived, so only 0 and 1 are on disk so far
+    assert writer.rows_written == 2
+    with open(tmp_path / 'report.csv.part0', newline='') as file:
+        assert [line[0] for line in csv.reader(file)] == [row(0, 0)['Instance ID'], row(0, 1)['Instance ID']]
+    writer.close()
+
+    assert read_ids(str(tmp_path / 'report.csv')) == [row(0, sequence)['Instance ID'] for sequence in (0, 1, 3, 4)]
+
+def test_json_lines_writer_has_no_header(tmp_path):
+    path = str(tmp_path / 'report.jsonl')
+    writer = JsonLinesReportWriter(path, COLUMNS)
+    writer.write_row((1, 0), row(1, 0))
+    writer.write_row((0, 0), row(0, 0))
+    writer.close()
+
+    with open(path) as file:
+        assert [json.loads(line) for line in file] == [row(0, 0), row(1, 0)]
+
+def test_open_report_feeds_every_format(tmp_path):
+    basename = str(tmp_path / 'report')
+    writer = open_report(basename, ['csv', 'jsonl', 'sqlite'], COLUMNS)
+    assert isinstance(writer, MultiReportWriter)
+    for key in [(1, 1), (0, 0), (1, 0)]:
+        writer.write_row(key, row(*key))
+    writer.close()
+
+    expected = [row(0, 0), row(1, 0), row(1, 1)]
+    assert read_ids(f"{basename}.csv") == [item['Instance ID'] for item in expected]
+    with open(f"{basename}.jsonl") as file:
+        assert [json.loads(line) for line in file] == expected
+    connection = sqlite3.connect(f"{basename}.sqlite")
+    try:
+        rows = connection.execute('SELECT "Instance ID", "Region" FROM report ORDER BY part_index, sequence').fetchall()
+    finally:
+        connection.close()
+    assert [dict(zip(COLUMNS, values)) for values in rows] == expected
+
+def test_sorted_writer_merges_spilled_runs(tmp_path):
+    rows = [row(part_index, sequence) for part_index in range(2) for sequence in range(95)]
+    shuffled = rows[:]
+    random.Random(2).shuffle(shuffled)
+    path = str(tmp_path / 'part.csv')
+    writer = SortedReportWriter(path, lambda row: row['Instance ID'], COLUMNS, run_size=20)
+    for item in shuffled:
+        writer.write_row(None, item)
+    assert len([name for name in os.listdir(tmp_path) if '.run' in name]) == len(rows) // 20
+    writer.close()
+
+    assert read_ids(path) == sorted(item['Instance ID'] for item in rows)
+    assert writer.rows_written == len(rows)
+    assert os.listdir(tmp_path) == ['part.csv']
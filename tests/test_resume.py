@@ -0,0 +1,70 @@
+import glob
+import json
+import sqlite3
+
+import pytest
+from botocore.exceptions import ClientError
+
+from conftest import FLEET_SIZE
+from report_writer import COLUMNS_ORDER
+
+FORMATS = ['csv', 'jsonl', 'sqlite']
+
+def normalise(row):
+    # The missing tags are collected in a set, so their order is not stable between runs
+    row = dict(row)
+    row['Mandatory Tags Missing'] = ', '.join(sorted(row['Mandatory Tags Missing'].split(', ')))
+    return row
+
+def report_path(directory, extension):
+    paths = glob.glob(str(directory / f"*_Report_*.{extension}"))
+    assert len(paths) == 1
+    return paths[0]
+
+def jsonl_rows(directory):
+    with open(report_path(directory, 'jsonl')) as file:
+        return [normalise(json.loads(line)) for line in file]
+
+def sqlite_rows(directory):
+    connection = sqlite3.connect(report_path(directory, 'sqlite'))
+    try:
+        columns = ', '.join(f'"{column}"' for column in COLUMNS_ORDER)
+        rows = connection.execute(f"SELECT {columns} FROM report ORDER BY part_index, sequence").fetchall()
+    finally:
+        connection.close()
+    return [normalise(dict(zip(COLUMNS_ORDER, row))) for row in rows]
+
+@pytest.fixture
+def uninterrupted(run_new1, tmp_path, monkeypatch):
+    directory = tmp_path / 'uninterrupted'
+    directory.mkdir()
+    monkeypatch.chdir(directory)
+    run_new1('-f', *FORMATS)
+    return directory
+
+@pytest.mark.parametrize('mode', [[], ['--async']], ids=['threads', 'async'])
+def test_resumed_scan_matches_uninterrupted_scan(run_new1, uninterrupted, tmp_path, monkeypatch, mode):
+    directory = tmp_path / 'resumed'
+    directory.mkdir()
+    monkeypatch.chdir(directory)
+    with pytest.raises(ClientError):
+        run_new1('-f', *FORMATS, *mode, fail_after=3)
+    assert glob.glob(str(directory / '.scan_checkpoint.json'))
+
+    run_new1('-f', *FORMATS, *mode, '--resume')
+
+    expected = jsonl_rows(uninterrupted)
+    assert len(expected) == FLEET_SIZE
+    assert jsonl_rows(directory) == expected
+    assert sqlite_rows(directory) == sqlite_rows(uninterrupted) == expected
+    # The checkpoint is removed once the resumed scan finishes
+    assert not glob.glob(str(directory / '.scan_checkpoint.json*'))
+
+def test_sqlite_report_is_started_over_on_resume(run_new1, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ClientError):
+        run_new1('-f', 'sqlite', fail_after=3)
+    run_new1('-f', 'sqlite', '--resume')
+
+    ids = [row['Instance ID'] for row in sqlite_rows(tmp_path)]
+    assert len(ids) == len(set(ids)) == FLEET_SIZE
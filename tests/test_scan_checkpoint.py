@@ -0,0 +1,84 @@
+import json
+
+from scan_checkpoint import ScanCheckpoint
+
+class ListReport:
+    def __init__(self):
+        self.rows = []
+
+    def write_row(self, key, row):
+        self.rows.append((key, row))
+
+def test_cursor_only_moves_past_pages_whose_rows_all_finished(tmp_path):
+    checkpoint = ScanCheckpoint(str(tmp_path / 'checkpoint.json'))
+    checkpoint.start('report', ['us-east-1'])
+    first = checkpoint.add_page('us-east-1', 0, 2, 'token-1')
+    second = checkpoint.add_page('us-east-1', 2, 1, None)
+
+    checkpoint.row_done('us-east-1', second, (0, 2), 'i-2', {'Instance ID': 'i-2'})
+    checkpoint.row_done('us-east-1', first, (0, 0), 'i-0', {'Instance ID': 'i-0'})
+    checkpoint.row_done('us-east-1', first, (0, 1), 'i-1', {'Instance ID': 'i-1'}, failed=True)
+    # The failed row keeps the first page open
+    assert checkpoint.cursor('us-east-1') == (None, 0)
+
+    checkpoint.row_done('us-east-1', first, (0, 1), 'i-1', {'Instance ID': 'i-1'})
+    assert checkpoint.cursor('us-east-1') is None
+
+def test_load_and_replay_restore_the_finished_rows(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = ScanCheckpoint(path)
+    checkpoint.start('123_Report_x', ['us-east-1', 'us-west-2'])
+    page = checkpoint.add_page('us-west-2', 0, 3, 'token-1')
+    checkpoint.row_done('us-west-2', page, (1, 0), 'i-0', {'Instance ID': 'i-0'})
+    checkpoint.row_done('us-west-2', page, (1, 1), 'i-1', {'Instance ID': 'i-1'}, failed=True)
+    checkpoint.save()
+    # A row cut short by the interruption is skipped and scanned again
+    with open(f"{path}.rows", 'a') as file:
+        file.write('[1, 2, "i-2", {"Instance')
+
+    resumed = ScanCheckpoint(path)
+    assert resumed.load()
+    assert resumed.report_name == '123_Report_x'
+    assert resumed.regions == ['us-east-1', 'us-west-2']
+    assert resumed.cursor('us-west-2') == (None, 0)
+    report = ListReport()
+    assert resumed.replay(report) == 1
+    assert report.rows == [((1, 0), {'Instance ID': 'i-0'})]
+    assert resumed.done_ids == {'i-0'}
+
+def test_rows_finished_after_a_torn_line_survive_a_second_interruption(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = ScanCheckpoint(path)
+    checkpoint.start('report', ['us-east-1'])
+    page = checkpoint.add_page('us-east-1', 0, 2, 't1')
+    checkpoint.row_done('us-east-1', page, (0, 0), 'i-0', {'a': 0})
+    checkpoint.save()
+    with open(f"{path}.rows", 'a') as file:
+        file.write('[0,1,"i-1",{"a"')
+
+    # First resume: i-1 is scanned again and the scan is interrupted once more
+    resumed = ScanCheckpoint(path)
+    assert resumed.load()
+    assert resumed.replay(ListReport()) == 1
+    assert resumed.cursor('us-east-1') == (None, 0)
+    page = resumed.add_page('us-east-1', 0, 2, 't1')
+    resumed.row_done('us-east-1', page)
+    resumed.row_done('us-east-1', page, (0, 1), 'i-1', {'a': 2})
+    resumed.save()
+
+    # Second resume: both rows come back, so nothing is lost behind the cursor
+    again = ScanCheckpoint(path)
+    assert again.load()
+    report = ListReport()
+    assert again.replay(report) == 2
+    assert report.rows == [((0, 0), {'a': 0}), ((0, 1), {'a': 2})]
+    assert again.cursor('us-east-1') == ('t1', 2)
+
+def test_clear_removes_the_checkpoint(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    checkpoint = ScanCheckpoint(str(path))
+    checkpoint.start('report', ['us-east-1'])
+    assert json.loads(path.read_text())['report_name'] == 'report'
+    checkpoint.clear()
+    assert list(tmp_path.iterdir()) == []
+    assert not ScanCheckpoint(str(path)).load()
@@ -0,0 +1,47 @@
+import csv
+
+import pytest
+
+import shard_scan
+from conftest import FLEET_SIZE
+
+REGIONS = ['us-east-1', 'us-west-1', 'us-west-2']
+
+def read(path):
+    with open(path, newline='') as file:
+        reader = csv.DictReader(file)
+        return reader.fieldnames, list(reader)
+
+def key(row):
+    return row['Region'], row['Instance ID'], row['Patch Status'], row['Current AMI ID'], row['Latest AMI ID']
+
+@pytest.fixture
+def sharded(scanner, tmp_path):
+    """
+    Scan the shards of a FakeAWS fleet one after another in-process and return the merged report's rows.
+    """
+    def run(by, count, profiles=()):
+        shards = shard_scan.plan_shards(by, count, REGIONS, list(profiles))
+        paths = [
+            shard_scan.scan_shard(index, shard, len(shards), REGIONS, str(tmp_path), fake_size=FLEET_SIZE)
+            for index, shard in enumerate(shards)
+        ]
+        return read(shard_scan.merge_partials(paths, REGIONS, str(tmp_path / f"merged_{by}.csv")))
+
+    return run
+
+def test_hash_and_region_shards_merge_to_the_unsharded_report(sharded, scan, tmp_path):
+    _, unsharded = read(scan(tmp_path / 'full.csv', REGIONS))
+    expected = sorted(unsharded, key=shard_scan.report_order(REGIONS))
+
+    for by, count in (('hash', 4), ('region', 2)):
+        columns, rows = sharded(by, count)
+        assert 'Account' not in columns
+        assert [key(row) for row in rows] == [key(row) for row in expected]
+
+def test_account_shards_are_merged_with_an_account_column(sharded):
+    columns, rows = sharded('account', 0, ['prod', 'nonprod'])
+    assert columns[0] == 'Account'
+    assert len(rows) == 2 * FLEET_SIZE
+    sort_key = shard_scan.report_order(REGIONS)
+    assert [(row['Account'], *sort_key(row)) for row in rows] == sorted((row['Account'], *sort_key(row)) for row in rows)
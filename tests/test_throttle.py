@@ -0,0 +1,103 @@
+import pytest
+from botocore.exceptions import ClientError
+
+import throttle
+from throttle import RATE_INCREASE, RequestScheduler, ThrottledClient, TokenBucket
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'DescribeInstances')
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Record backoff and bucket waits instead of sleeping through them
+    slept = []
+    monkeypatch.setattr(throttle.time, 'sleep', slept.append)
+    return slept
+
+class Flaky:
+    """
+    Fail the first `failures` calls with `code`, then succeed.
+    """
+
+    def __init__(self, failures, code='RequestLimitExceeded'):
+        self.failures = failures
+        self.code = code
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise client_error(self.code)
+        return 'ok'
+
+def test_bucket_is_unlimited_until_the_first_throttle(sleeps):
+    bucket = TokenBucket()
+    for _ in range(100):
+        bucket.acquire()
+    assert bucket.rate is None and sleeps == []
+
+    bucket.throttled()
+    rate = bucket.rate
+    assert bucket.min_rate <= rate
+    # Throttles right after a cut were caused by calls sent before it
+    bucket.throttled()
+    assert bucket.rate == rate
+
+    bucket.acquire()
+    bucket.acquire()
+    assert sleeps and sleeps[-1] > 0
+
+def test_bucket_grows_back_and_stops_limiting(sleeps):
+    bucket = TokenBucket(min_rate=10, max_rate=20)
+    bucket.throttled()
+    assert bucket.rate == 10
+    bucket.succeeded()
+    assert bucket.rate == pytest.approx(10 * RATE_INCREASE)
+    for _ in range(10):
+        bucket.succeeded()
+    assert bucket.rate is None
+
+def test_throttled_calls_are_retried_and_counted(sleeps):
+    scheduler = RequestScheduler()
+    function = Flaky(3)
+    assert scheduler.call('describe_instances', 'us-east-1', function) == 'ok'
+
+    key = ('describe_instances', 'us-east-1')
+    assert function.calls == 4
+    assert scheduler.calls[key] == 4
+    assert scheduler.throttled[key] == scheduler.retries[key] == 3
+    assert scheduler.bucket(*key).rate is not None
+    assert len(sleeps) >= 3
+
+def test_transient_errors_are_retried_but_not_throttled(sleeps):
+    scheduler = RequestScheduler()
+    assert scheduler.call('describe_images', 'us-east-1', Flaky(1, 'ServiceUnavailable')) == 'ok'
+    assert scheduler.retries[('describe_images', 'us-east-1')] == 1
+    assert not scheduler.throttled
+
+def test_other_errors_are_raised_at_once(sleeps):
+    scheduler = RequestScheduler()
+    function = Flaky(1, 'UnauthorizedOperation')
+    with pytest.raises(ClientError):
+        scheduler.call('describe_images', 'us-east-1', function)
+    assert function.calls == 1
+
+def test_retries_stop_at_max_attempts_and_when_the_budget_runs_out(sleeps):
+    function = Flaky(100)
+    with pytest.raises(ClientError):
+        RequestScheduler(max_attempts=3).call('describe_tags', 'us-east-1', function)
+    assert function.calls == 3
+
+    function = Flaky(100)
+    with pytest.raises(ClientError):
+        RequestScheduler(retry_budget=2 * throttle.THROTTLE_RETRY_COST).call('describe_tags', 'us-east-1', function)
+    assert function.calls == 3
+
+def test_every_page_goes_through_the_scheduler(fake_aws, sleeps):
+    scheduler = RequestScheduler()
+    client = ThrottledClient(fake_aws.client('ec2', 'us-east-1'), 'us-east-1', scheduler)
+    pages = list(client.get_paginator('describe_instances').paginate(PaginationConfig={'PageSize': 50}))
+
+    assert len(pages) == scheduler.calls[('describe_instances', 'us-east-1')] == 4
+    client.describe_images(ImageIds=[])
+    assert scheduler.calls[('describe_images', 'us-east-1')] == 1
@@ -0,0 +1,245 @@
+"""
+Throttle-aware scheduling for AWS API calls: a token bucket per (operation, region), AIMD rate adaptation on
+throttling responses and a shared retry budget.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+THROTTLING_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException', 'TooManyRequestsException',
+    'RequestLimitExceeded', 'RequestThrottled', 'SlowDown', 'PriorRequestNotComplete', 'ProvisionedThroughputExceededException',
+}
+log = logging.getLogger('scanner.throttle')
+
+TRANSIENT_CODES = {'RequestTimeout', 'RequestTimeoutException', 'InternalError', 'InternalFailure', 'ServiceUnavailable'}
+
+# Request parameter that carries the page size for each paginated operation the scanner uses
+PAGE_SIZE_PARAMS = {
+    'describe_instances': 'MaxResults',
+    'describe_images': 'MaxResults',
+    'describe_tags': 'MaxResults',
+    'describe_instance_patch_states': 'MaxResults',
+    'describe_auto_scaling_instances': 'MaxRecords',
+}
+
+MIN_RATE = 0.5  # calls per second per (operation, region)
+MAX_RATE = 200.0  # above this the bucket stops limiting again
+RATE_INCREASE = 1.1  # rate multiplier after each successful call
+RATE_DECREASE = 0.5  # multiplier applied to the measured rate on a throttling response
+DECREASE_INTERVAL = 1.0  # seconds; throttles arriving sooner after a cut are answered by the same cut
+
+MAX_ATTEMPTS = 8
+BASE_DELAY = 0.1  # seconds
+MAX_DELAY = 10.0
+RETRY_BUDGET = 500
+THROTTLE_RETRY_COST = 5
+TRANSIENT_RETRY_COST = 10
+
+class TokenBucket:
+    """
+    Rate limiter for one (operation, region). It lets calls through unlimited until the first throttling response,
+    then limits to half the rate measured at that moment and grows it back by 10% per success until MAX_RATE.
+    The rate is cut at most once per DECREASE_INTERVAL, since throttles that follow a cut were sent before it.
+    acquire() reserves a token and sleeps until it is due, so limited callers queue up in order.
+    """
+
+    def __init__(self, min_rate=MIN_RATE, max_rate=MAX_RATE):
+        self.rate = None
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._window_start = self._updated
+        self._window_calls = 0
+        self._measured_rate = 0.0
+        self._last_decrease = None
+        self._lock = threading.Lock()
+
+    def _measure(self, now):
+        # Calls per second over the current window, rolled over every second
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self._measured_rate = self._window_calls / elapsed
+            self._window_start = now
+            self._window_calls = 0
+        elif elapsed > 0:
+            self._measured_rate = max(self._measured_rate, self._window_calls / max(elapsed, 0.1))
+
+    def acquire(self):
+        wait = 0
+        with self._lock:
+            now = time.monotonic()
+            self._measure(now)
+            self._window_calls += 1
+            if self.rate:
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = -self._tokens / self.rate
+            self._updated = now
+        if wait:
+            time.sleep(wait)
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate:
+                self.rate *= RATE_INCREASE
+                if self.rate > self.max_rate:
+                    self.rate = None
+
+    def throttled(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._last_decrease is not None and now - self._last_decrease < DECREASE_INTERVAL:
+                return
+            self._last_decrease = now
+            self._measure(now)
+            current_rate = self.rate or self._measured_rate
+            self.rate = max(self.min_rate, current_rate * RATE_DECREASE)
+            # Drop any saved-up burst so the lower rate takes effect straight away
+            self._tokens = min(self._tokens, 0)
+
+class RetryBudget:
+    """
+    Tokens shared by every call of a scheduler. A retry spends tokens and a success refunds one, so a sustained
+    outage stops retrying instead of multiplying load, while occasional throttling is always retried.
+    """
+
+    def __init__(self, capacity=RETRY_BUDGET):
+        self.capacity = capacity
+        self._tokens = capacity
+        self._lock = threading.Lock()
+
+    def spend(self, cost):
+        with self._lock:
+            if self._tokens < cost:
+                return False
+            self._tokens -= cost
+            return True
+
+    def refund(self):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+class RequestScheduler:
+    """
+    Run API calls through the (operation, region) token bucket and retry throttling and transient failures with
+    jittered exponential backoff until MAX_ATTEMPTS or the retry budget runs out. Counts are kept per
+    (operation, region) in `calls`, `throttled` and `retries`. If `profile` is set, the latency of every attempt
+    is recorded with profile.record_call().
+    """
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, retry_budget=RETRY_BUDGET):
+        self.max_attempts = max_attempts
+        self.profile = None
+        self.budget = RetryBudget(retry_budget)
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.retries = Counter()
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, operation, region):
+        key = (operation, region)
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket()
+            return self._buckets[key]
+
+    def _record(self, operation, region, start, failed=False):
+        if self.profile:
+            self.profile.record_call(operation, region, time.perf_counter() - start, failed)
+
+    def call(self, operation, region, function, *args, **kwargs):
+        key = (operation, region)
+        bucket = self.bucket(operation, region)
+        attempt = 0
+        while True:
+            attempt += 1
+            bucket.acquire()
+            with self._lock:
+                self.calls[key] += 1
+            start = time.perf_counter()
+            try:
+                response = function(*args, **kwargs)
+            except ClientError as e:
+                self._record(operation, region, start, failed=True)
+                code = e.response.get('Error', {}).get('Code')
+                if code in THROTTLING_CODES:
+                    bucket.throttled()
+                    with self._lock:
+                        self.throttled[key] += 1
+                    cost = THROTTLE_RETRY_COST
+                elif code in TRANSIENT_CODES:
+                    cost = TRANSIENT_RETRY_COST
+                else:
+                    raise
+                if attempt >= self.max_attempts or not self.budget.spend(cost):
+                    raise
+            except (ConnectionError, HTTPClientError):
+                self._record(operation, region, start, failed=True)
+                if attempt >= self.max_attempts or not self.budget.spend(TRANSIENT_RETRY_COST):
+                    raise
+            else:
+                self._record(operation, region, start)
+                bucket.succeeded()
+                self.budget.refund()
+                return response
+            with self._lock:
+                self.retries[key] += 1
+            # Full jitter keeps workers that were throttled together from retrying together
+            delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+            log.debug("retrying %s in %s after attempt %d (rate limit %s), sleeping %.2fs",
+                      operation, region, attempt, f"{bucket.rate:.1f}/s" if bucket.rate else "none", delay)
+            time.sleep(delay)
+
+class ThrottledPaginator:
+    def __init__(self, client, operation):
+        self.client = client
+        self.operation = operation
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        page_size = (PaginationConfig or {}).get('PageSize')
+        if page_size:
+            kwargs[PAGE_SIZE_PARAMS[self.operation]] = page_size
+        starting_token = (PaginationConfig or {}).get('StartingToken')
+        if starting_token:
+            kwargs['NextToken'] = starting_token
+        method = getattr(self.client, self.operation)
+        while True:
+            page = method(**kwargs)
+            yield page
+            next_token = page.get('NextToken')
+            if not next_token:
+                return
+            kwargs['NextToken'] = next_token
+
+class ThrottledClient:
+    """
+    Wrap a boto3 (or stand-in) client so every API call, including each page of a paginated call, goes through
+    the scheduler.
+    """
+
+    def __init__(self, client, region, scheduler):
+        self._client = client
+        self._region = region
+        self._scheduler = scheduler
+
+    def get_paginator(self, operation):
+        if operation not in PAGE_SIZE_PARAMS:
+            return self._client.get_paginator(operation)
+        return ThrottledPaginator(self, operation)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith('_') or name in ('meta', 'exceptions', 'can_paginate') or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            return self._scheduler.call(name, self._region, attribute, *args, **kwargs)
+        return call